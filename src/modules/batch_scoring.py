@@ -0,0 +1,213 @@
+import argparse
+import collections
+import os
+import pickle  # Python object serialization
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Project level modules
+import modules.calendar_features as cf
+import modules.flights_schema as fs
+import modules.preprocessing_functions as ppf
+import modules.xgboost_functions as xgf
+
+
+# Pickled model and scaler, relative to src/ like save_model.jar
+MODEL_PATH = 'models/flight_delay_xgboost.pickle.dat'
+SCALER_PATH = 'models/xgboost_scaler.pickle.dat'
+
+# Columns of the sample_submission.csv output
+SUBMISSION_COLUMNS = [
+    'fl_date',
+    'mkt_carrier',
+    'mkt_carrier_fl_num',
+    'origin',
+    'dest',
+    'predicted_delay'
+]
+
+# Columns of flights_test read by the pipeline
+SCORING_COLUMNS = sorted(set(xgf.FEATURE_COLUMNS) | set(SUBMISSION_COLUMNS[:-1]))
+
+# Model, scaler and feature settings of a worker process, set once by
+# _init_worker
+_worker = {}
+
+
+def _init_worker(model_path: 'str',
+                 scaler_path: 'str',
+                 time_period: 'str',
+                 imputer_path: 'str'):
+    """
+    Loads the model, scaler and fitted imputer of a worker process
+    """
+
+    with open(model_path, 'rb') as f_input:
+        _worker['model'] = pickle.load(f_input)
+    with open(scaler_path, 'rb') as f_input:
+        _worker['scaler'] = pickle.load(f_input)
+
+    _worker['time_period'] = time_period
+    # Loaded once, never fitted nor saved by the workers
+    _worker['imputer'] = ppf.Imputer.load(imputer_path)
+
+    return None
+
+
+def score_chunk(chunk):
+    """
+    Predicts the arrival delay of a chunk of flights_test in a worker
+    process
+
+    Parameters
+    ----------
+    chunk : Pandas DataFrame
+        flights_test rows with the columns of SCORING_COLUMNS
+
+    Returns
+    -------
+    submission : Pandas DataFrame
+        The chunk's rows with the columns of SUBMISSION_COLUMNS
+    """
+
+    # Map the categories onto the worker's shared dictionaries
+    chunk = fs.apply_schema(chunk.reset_index(drop=True))
+    chunk['fl_date'] = cf.parse_flight_dates(chunk['fl_date'])
+
+    X = xgf.build_features(data=chunk,
+                           time_period=_worker['time_period'],
+                           imputer=_worker['imputer'])
+
+    X_test = pd.DataFrame(_worker['scaler'].transform(X=X), columns=X.columns)
+
+    submission = chunk[SUBMISSION_COLUMNS[:-1]].copy()
+    submission['fl_date'] = submission['fl_date'].dt.strftime('%Y-%m-%d')
+    submission['predicted_delay'] = _worker['model'].predict(X_test)
+
+    return submission
+
+
+def score_file(csv_path: 'str',
+               imputer: 'str',
+               output_path: 'str' = '../output/xgboost_submission.csv',
+               model_path: 'str' = MODEL_PATH,
+               scaler_path: 'str' = SCALER_PATH,
+               time_period: 'str' = 'month',
+               chunksize: 'int' = 100_000,
+               workers: 'int | None' = None,
+               max_pending: 'int | None' = None,
+               progress: 'callable | None' = None):
+    """
+    Predicts the arrival delay of every flight of a flights_test csv file
+
+    The csv is read in chunks that are scored by a pool of worker
+    processes, each loading the model and scaler once. At most
+    max_pending chunks are read ahead of the writer, so memory is
+    bounded by the chunk size whatever the size of the file. Predictions
+    are appended to the output in the order of the csv as soon as their
+    chunk is scored.
+
+    Parameters
+    ----------
+    csv_path : string
+        flights_test csv filepath
+    imputer : string
+        Path of the Imputer json file fitted on the training data (see
+        xgboost_functions.build_features), so the NAN fill values do not
+        depend on the chunks
+    output_path : string, default '../output/xgboost_submission.csv'
+        Written in the format of sample_submission.csv
+    model_path : string, default MODEL_PATH
+    scaler_path : string, default SCALER_PATH
+    time_period : string 'week', 'month', default 'month'
+    chunksize : int, default 100,000
+        Number of csv lines scored at a time
+    workers : int or None, default None
+        Number of worker processes, None uses every CPU
+    max_pending : int or None, default None
+        Number of chunks read ahead, twice the number of workers when None
+    progress : callable or None, default None
+        Called with the number of rows scored so far and the rows per
+        second after every chunk
+
+    Returns
+    -------
+    report : dict
+        rows, seconds and rows_per_second
+    """
+
+    if ppf.Imputer.load(imputer).fill_values is None:
+        raise ValueError(f'the imputer at {imputer} is not fitted')
+
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+
+    start = time.perf_counter()
+    rows = 0
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    pd.DataFrame(columns=SUBMISSION_COLUMNS).to_csv(output_path, index=False)
+
+    def write(future):
+        nonlocal rows
+        submission = future.result()
+        submission.to_csv(output_path, mode='a', header=False, index=False)
+        rows += submission.shape[0]
+        if progress is not None:
+            progress(rows, rows / (time.perf_counter() - start))
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(model_path,
+                                       scaler_path,
+                                       time_period,
+                                       imputer)) as executor:
+        pending = collections.deque()
+
+        for chunk in fs.read_csv(csv_path,
+                                 usecols=SCORING_COLUMNS,
+                                 chunksize=chunksize):
+            pending.append(executor.submit(score_chunk, chunk))
+            if len(pending) >= max_pending:
+                write(pending.popleft())
+
+        while pending:
+            write(pending.popleft())
+
+    seconds = time.perf_counter() - start
+
+    return {
+        'rows' : rows,
+        'seconds' : seconds,
+        'rows_per_second' : rows / seconds if seconds else float('nan')
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Predict the arrival delays of a flights_test csv file'
+    )
+    parser.add_argument('csv_path')
+    parser.add_argument('output_path', nargs='?',
+                        default='../output/xgboost_submission.csv')
+    parser.add_argument('--time-period', default='month',
+                        choices=['week', 'month'])
+    parser.add_argument('--imputer', required=True,
+                        help='Imputer json file fitted on the training data')
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    print(score_file(csv_path=args.csv_path,
+                     output_path=args.output_path,
+                     time_period=args.time_period,
+                     imputer=args.imputer,
+                     chunksize=args.chunksize,
+                     workers=args.workers,
+                     progress=lambda rows, rate: print(
+                         f'{rows:,} rows scored, {rate:,.0f} rows/s'
+                     )))
@@ -0,0 +1,314 @@
+import pandas as pd
+import numpy as np
+
+
+# Columns of the date dimension table and the attribute they are built from
+DATE_DIMENSION = {
+    'day_of_year' : 'dayofyear',
+    'weekday' : 'dayofweek',
+    'week' : 'week',
+    'month' : 'month',
+    'day_of_month' : 'day'
+}
+
+
+def parse_flight_dates(values):
+    """
+    Returns a pandas Series of datetimes parsed from flight dates
+
+    Parameters
+    ----------
+    values : array-like
+        Flight dates as datetimes, epoch milliseconds (the format of
+        fl_date in the flights_test table) or date strings such as
+        'yyyy-mm-dd'
+
+    Returns
+    -------
+    dates : Pandas Series
+        timezone naive datetime64 values
+    """
+
+    values = pd.Series(values)
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        dates = values
+    elif pd.api.types.is_numeric_dtype(values):
+        dates = pd.to_datetime(values, utc=True, unit='ms')
+    else:
+        dates = pd.to_datetime(values, utc=True)
+
+    # Drop timezone information, dates are in UTC
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+
+    return dates
+
+
+def date_dimension(dates):
+    """
+    Returns the date dimension table of a set of (unique) flight dates
+
+    Parameters
+    ----------
+    dates : array-like
+        Flight dates in any format accepted by parse_flight_dates
+
+    Returns
+    -------
+    dimension : Pandas DataFrame
+        One row per date, in the order given, with the columns of
+        DATE_DIMENSION. The week is the ISO week of the year and the
+        weekday counts from Monday = 0.
+    """
+
+    dates = parse_flight_dates(dates)
+    iso_calendar = dates.dt.isocalendar()
+
+    dimension = pd.DataFrame(index=dates.index)
+
+    for column, attribute in DATE_DIMENSION.items():
+        if attribute == 'week':
+            values = iso_calendar['week']
+        else:
+            values = getattr(dates.dt, attribute)
+        dimension[column] = values.astype('int16')
+
+    return dimension
+
+
+def add_calendar_features(df,
+                          columns: 'dict | list' = tuple(DATE_DIMENSION),
+                          date_column: 'str' = 'fl_date'):
+    """
+    Adds date dimension columns to a DataFrame of flights
+
+    The date dimension is built once for the distinct dates of the frame
+    (a couple of years of flights have ~730 of them) and attached to
+    every row with a single gather on the factorized date codes, so no
+    date is parsed more than once.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+    columns : dict or list, default all of DATE_DIMENSION
+        Date dimension columns to add. A dict maps each date dimension
+        column to the name of the column added to df.
+    date_column : string, default 'fl_date'
+        Column holding the flight dates
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The same DataFrame, modified in place
+    """
+
+    if not isinstance(columns, dict):
+        columns = {column : column for column in columns}
+
+    if not set(columns).issubset(DATE_DIMENSION):
+        raise ValueError(f"columns must be any of {list(DATE_DIMENSION)}")
+
+    return _attach_date_table(df, date_column, date_dimension, columns)
+
+
+def _attach_date_table(df, date_column, build_table, columns):
+    """
+    Builds a per-date table for the distinct dates of df[date_column]
+    with build_table and gathers its columns onto every row of df
+    """
+
+    # Integer code of each row's date, -1 for missing dates
+    codes, uniques = pd.factorize(df[date_column])
+    table = build_table(uniques)
+    missing = codes == -1
+
+    for column, name in columns.items():
+        values = table[column].to_numpy()[codes]
+        if missing.any():
+            values = np.where(missing, np.nan, values)
+        df[name] = values
+
+    return df
+
+
+# US federal holidays: the rule fixing the holiday's date and the first
+# and last day, relative to the holiday, of its travel window.
+# Rules are (month, day) for fixed dates or (month, weekday, n) for the
+# n-th weekday of the month, n = -1 being the last one (Monday = 0).
+US_FEDERAL_HOLIDAYS = {
+    "New Year's Day" : ((1, 1), -2, 0),
+    'Martin Luther King Jr. Day' : ((1, 0, 3), -3, 0),
+    "Presidents' Day" : ((2, 0, 3), -3, 0),
+    'Memorial Day' : ((5, 0, -1), -3, 0),
+    'Independence Day' : ((7, 4), -1, 3),
+    'Labor Day' : ((9, 0, 1), -3, 0),
+    'Columbus Day' : ((10, 0, 2), -3, 0),
+    'Veterans Day' : ((11, 11), -3, 0),
+    'Thanksgiving' : ((11, 3, 4), -3, 0),
+    'Christmas' : ((12, 25), -4, 4)
+}
+
+
+def _holiday_date(year: 'int', rule: 'tuple'):
+    """
+    Returns the date of a holiday rule of US_FEDERAL_HOLIDAYS in a year
+    """
+
+    if len(rule) == 2:
+        month, day = rule
+        return pd.Timestamp(year=year, month=month, day=day)
+
+    month, weekday, n = rule
+
+    if n > 0:
+        first = pd.Timestamp(year=year, month=month, day=1)
+        return first + pd.Timedelta(days=(weekday - first.dayofweek) % 7 + 7 * (n - 1))
+
+    last = pd.Timestamp(year=year, month=month, day=1) + pd.offsets.MonthEnd(0)
+    return last - pd.Timedelta(days=(last.dayofweek - weekday) % 7)
+
+
+def holiday_dates(start_year: 'int', end_year: 'int'):
+    """
+    Returns the US federal holidays between two years (inclusive)
+
+    Parameters
+    ----------
+    start_year : int
+    end_year : int
+
+    Returns
+    -------
+    holidays : Pandas DataFrame
+        columns holiday, date, window_start and window_end, sorted by date
+    """
+
+    rows = []
+
+    for year in range(start_year, end_year + 1):
+        for holiday, (rule, first, last) in US_FEDERAL_HOLIDAYS.items():
+            date = _holiday_date(year, rule)
+            rows.append((holiday,
+                         date,
+                         date + pd.Timedelta(days=first),
+                         date + pd.Timedelta(days=last)))
+
+    holidays = pd.DataFrame(
+        rows,
+        columns=['holiday', 'date', 'window_start', 'window_end']
+    )
+
+    return holidays.sort_values('date', ignore_index=True)
+
+
+def holiday_calendar(start_year: 'int', end_year: 'int'):
+    """
+    Returns the sorted index of holiday travel days between two years
+
+    Parameters
+    ----------
+    start_year : int
+    end_year : int
+
+    Returns
+    -------
+    days : numpy array of datetime64[D]
+        every day falling in the travel window of a holiday, sorted
+        and unique
+    """
+
+    holidays = holiday_dates(start_year, end_year)
+
+    days = [
+        np.arange(start, end + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+        for start, end in zip(
+            holidays['window_start'].to_numpy().astype('datetime64[D]'),
+            holidays['window_end'].to_numpy().astype('datetime64[D]')
+        )
+    ]
+
+    return np.unique(np.concatenate(days))
+
+
+def holiday_table(dates):
+    """
+    Returns the holiday features of a set of (unique) flight dates
+
+    Parameters
+    ----------
+    dates : array-like
+        Flight dates in any format accepted by parse_flight_dates
+
+    Returns
+    -------
+    table : Pandas DataFrame
+        One row per date, in the order given, with the columns
+        stat_holiday (1 when the date is in a holiday travel window),
+        days_to_next_holiday and days_since_last_holiday (0 on the
+        holiday itself)
+    """
+
+    days = parse_flight_dates(dates).to_numpy().astype('datetime64[D]')
+    table = pd.DataFrame(index=range(days.shape[0]))
+
+    if days.shape[0] == 0:
+        for column in ['stat_holiday', 'days_to_next_holiday', 'days_since_last_holiday']:
+            table[column] = np.empty(0, dtype='int16')
+        return table
+
+    # Generate one extra year on each side so that every date has a
+    # previous and a next holiday
+    years = days.astype('datetime64[Y]').astype(int) + 1970
+    start_year, end_year = years.min() - 1, years.max() + 1
+
+    window_days = holiday_calendar(start_year, end_year)
+    holidays = np.unique(
+        holiday_dates(start_year, end_year)['date']
+        .to_numpy().astype('datetime64[D]')
+    )
+
+    # Membership and proximity with binary searches on the sorted indexes
+    position = np.searchsorted(window_days, days).clip(max=window_days.shape[0] - 1)
+    table['stat_holiday'] = (window_days[position] == days).astype('int8')
+
+    next_holiday = holidays[np.searchsorted(holidays, days, side='left')]
+    last_holiday = holidays[np.searchsorted(holidays, days, side='right') - 1]
+    table['days_to_next_holiday'] = (next_holiday - days).astype('int16')
+    table['days_since_last_holiday'] = (days - last_holiday).astype('int16')
+
+    return table
+
+
+def add_holiday_features(df,
+                         date_column: 'str' = 'fl_date',
+                         proximity: 'bool' = True):
+    """
+    Adds US federal holiday features to a DataFrame of flights
+
+    Holidays are generated for whatever years the flights cover, and the
+    features are computed once per distinct date and gathered onto
+    every row.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+    date_column : string, default 'fl_date'
+        Column holding the flight dates
+    proximity : bool, default True
+        Also add days_to_next_holiday and days_since_last_holiday
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The same DataFrame, modified in place
+    """
+
+    columns = ['stat_holiday']
+    if proximity:
+        columns += ['days_to_next_holiday', 'days_since_last_holiday']
+
+    return _attach_date_table(df,
+                              date_column,
+                              holiday_table,
+                              {column : column for column in columns})
@@ -4,18 +4,92 @@
 # Connect to the mid_term_project PostgreSQL database
 
 
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import psycopg2  # PostgreSQL database adapter
 from psycopg2 import sql  # SQL string composition
+from psycopg2 import pool as pg_pool  # Connection pools
 import pandas as pd
 
 # Project level modules
 from modules.database_credentials import credentials  # PostgreSQL database credentials
 from modules import sql_statements as sqs  # PostgreSQL statements
+from modules import flights_schema as fs  # Compact flights column types
 
 
 # [psycopg2 documentation](https://www.psycopg.org/docs/)
 
 
+# pandas dtype of the PostgreSQL type OIDs of cursor.description, used
+# to parse COPY output. Integers are read as nullable integers since
+# they may hold NULLs; columns of the flights tables are then narrowed
+# by flights_schema.
+POSTGRESQL_DTYPES = {
+    16 : 'boolean',   # boolean
+    20 : 'Int64',     # bigint
+    21 : 'Int16',     # smallint
+    23 : 'Int32',     # integer
+    700 : 'float64',  # real
+    701 : 'float64',  # double precision
+    1700 : 'float64', # numeric
+    18 : 'object',    # char
+    19 : 'object',    # name
+    25 : 'object',    # text
+    1042 : 'object',  # character
+    1043 : 'object'   # character varying
+}
+
+# Date and time type OIDs: date, timestamp and timestamp with time zone
+POSTGRESQL_DATES = {1082, 1114, 1184}
+
+# NULL marker of the COPY output, so NULLs and empty strings differ
+COPY_NULL = '\\N'
+
+# Tables stored with the compact flights column types (flights_schema)
+FLIGHTS_TABLES = ['flights', 'flights_test']
+
+# OIDs of the flights tables, by connection string
+_flights_table_oids = {}
+
+# Local cache of query results, a parquet file and a json description
+# per query
+QUERY_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'data', 'query_cache'
+)
+
+# Fingerprint of tables: storage file (changed by TRUNCATE and table
+# rewrites), columns and the row modification counters
+TABLE_FINGERPRINT_SQL = """
+SELECT
+   c.relname,
+   c.relfilenode,
+   (SELECT string_agg(a.attname || ':' || a.atttypid, ',' ORDER BY a.attnum)
+      FROM pg_attribute AS a
+     WHERE a.attrelid = c.oid
+       AND a.attnum > 0
+       AND NOT a.attisdropped) AS columns,
+   s.n_tup_ins,
+   s.n_tup_upd,
+   s.n_tup_del
+FROM
+   pg_class AS c
+   LEFT JOIN pg_stat_user_tables AS s ON s.relid = c.oid
+WHERE
+   c.relname = ANY(%s)
+ORDER BY
+   c.relname;
+"""
+
+
 def postgresql_connection(db_credentials: 'str' = credentials):
     """
     Create a new database session
@@ -39,6 +113,200 @@ def postgresql_connection(db_credentials: 'str' = credentials):
     return connection
 
 
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections
+    
+    Connections are opened once and lent to one thread at a time with
+    the connection() context manager. When every connection is lent,
+    borrowers wait for one to be returned. Connections are checked on
+    checkout and replaced when broken.
+    
+    Parameters
+    ----------
+    minconn : int, default 1
+        Number of connections opened up front and kept open while idle.
+        Connections above minconn are closed when returned.
+    maxconn : int, default 10
+        Maximum number of open connections
+    db_credentials : string
+        The credentials string format corresponds to psycopg2.connect()
+        parameter format.
+    ping : bool, default True
+        Run SELECT 1 on checkout, not only check the connection state
+    timeout : float or None, default None
+        Seconds to wait for a free connection, None waits forever
+    
+    Attributes
+    ----------
+    minconn, maxconn : int
+    
+    Example
+    -------
+    with postgresql_pool(minconn=8, maxconn=8) as pool:
+        df = execute_sql_statement(pool, query='SELECT * FROM flights LIMIT 10;')
+    """
+    
+    def __init__(self,
+                 minconn: 'int' = 1,
+                 maxconn: 'int' = 10,
+                 db_credentials: 'str' = credentials,
+                 ping: 'bool' = True,
+                 timeout: 'float | None' = None):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = pg_pool.ThreadedConnectionPool(minconn,
+                                                    maxconn,
+                                                    db_credentials)
+        # ThreadedConnectionPool raises when exhausted, borrowers wait
+        # on the semaphore instead
+        self._available = threading.BoundedSemaphore(maxconn)
+        self.ping = ping
+        self.timeout = timeout
+    
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+        if (connection.get_transaction_status()
+                == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN):
+            return False
+        if self.ping:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1;')
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+    
+    def getconn(self):
+        """
+        Returns a healthy connection, waiting for one when the pool is
+        exhausted. Return it with putconn.
+        """
+        
+        if not self._available.acquire(timeout=self.timeout):
+            raise pg_pool.PoolError('no connection available')
+        
+        try:
+            # Replace broken connections, at most once per pooled one
+            for _ in range(self.maxconn + 1):
+                connection = self._pool.getconn()
+                try:
+                    healthy = self._is_healthy(connection)
+                except Exception:
+                    self._pool.putconn(connection, close=True)
+                    raise
+                if healthy:
+                    return connection
+                # Close and discard it, the inner pool opens a new one
+                self._pool.putconn(connection, close=True)
+            raise pg_pool.PoolError('no healthy connection available')
+        except Exception:
+            self._available.release()
+            raise
+    
+    def putconn(self, connection, close: 'bool' = False):
+        """
+        Returns a connection to the pool, rolling back any open
+        transaction
+        """
+        
+        try:
+            if not connection.closed:
+                connection.rollback()
+        except psycopg2.Error:
+            close = True
+        finally:
+            self._pool.putconn(connection, close=close)
+            self._available.release()
+    
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Lends a connection to the calling thread
+        
+        The transaction is committed when the block succeeds and rolled
+        back when it raises.
+        """
+        
+        connection = self.getconn()
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            self.putconn(connection)
+            raise
+        else:
+            self.putconn(connection)
+    
+    def closeall(self):
+        """
+        Closes every connection of the pool
+        """
+        
+        self._pool.closeall()
+    
+    @property
+    def closed(self):
+        return self._pool.closed
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.closeall()
+
+
+def postgresql_pool(minconn: 'int' = 1,
+                    maxconn: 'int' = 10,
+                    db_credentials: 'str' = credentials,
+                    ping: 'bool' = True,
+                    timeout: 'float | None' = None):
+    """
+    Create a thread-safe pool of database sessions
+    
+    Parameters:
+    -----------
+    minconn : int, default 1
+        Connections opened up front and kept open while idle
+    maxconn : int, default 10
+        Maximum number of open connections
+    db_credentials : string
+        The credentials string format corresponds to psycopg2.connect()
+        parameter format.
+        Example: "dbname=test user=postgres password=secret"
+    ping : bool, default True
+        Check connections with SELECT 1 on checkout
+    timeout : float or None, default None
+        Seconds to wait for a free connection, None waits forever
+    
+    Returns:
+    --------
+    pool : ConnectionPool
+    """
+    
+    return ConnectionPool(minconn=minconn,
+                          maxconn=maxconn,
+                          db_credentials=db_credentials,
+                          ping=ping,
+                          timeout=timeout)
+
+
+@contextlib.contextmanager
+def borrow(connection):
+    """
+    Context manager yielding a connection from a ConnectionPool, or the
+    connection itself when given a psycopg2 connection
+    """
+    
+    if isinstance(connection, ConnectionPool):
+        with connection.connection() as pooled_connection:
+            yield pooled_connection
+    else:
+        yield connection
+
+
 def dataframe_to_csv(df, csv_path: str):
     """
     Save Pandas Dataframe to csv file
@@ -99,6 +367,55 @@ def postgresql_to_csv(cursor, sql_statement: 'str', csv_path: 'str'):
     return None
 
 
+def flights_columns(connection, description):
+    """
+    Returns the columns of a query description that are read from one
+    of the FLIGHTS_TABLES, the columns flights_schema applies to
+    
+    Parameters
+    ----------
+    connection : psycopg2 connection object
+    description : cursor.description of the query
+    
+    Returns
+    -------
+    column_names : list
+    """
+    
+    if connection.dsn not in _flights_table_oids:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT oid FROM pg_class WHERE relname = ANY(%s);',
+                           (FLIGHTS_TABLES,))
+            _flights_table_oids[connection.dsn] = {row[0] for row in cursor.fetchall()}
+    
+    oids = _flights_table_oids[connection.dsn]
+    
+    return [desc.name for desc in description if desc.table_oid in oids]
+
+
+def _fetch_rows(connection,
+                query: 'str',
+                variables: 'tuple | None' = None):
+    """
+    Returns the rows and column names of a PostgreSQL query, and the
+    columns read from a flights table (see flights_columns)
+    """
+    
+    with borrow(connection) as connection, \
+         connection.cursor() as cursor: # client side cursor
+        # execute sql statement
+        cursor.execute(query=query, vars=variables)
+
+        # Retrieve query column names
+        column_names = [desc[0] for desc in cursor.description]
+        schema_columns = flights_columns(connection, cursor.description)
+        
+        # Fetch all (remaining) rows of a query result
+        rows = cursor.fetchall()
+    
+    return rows, column_names, schema_columns
+
+
 def postgresql_results(connection,
                        query: 'str',
                        variables: 'tuple | None' = None):
@@ -107,8 +424,8 @@ def postgresql_results(connection,
     
     Parameters
     ----------
-    connection : (psycopg2 connection object)
-        A PostgreSQL connection
+    connection : (psycopg2 connection object) or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
     query : string
         SQL query
     variables : tuple or None, default None
@@ -120,7 +437,8 @@ def postgresql_results(connection,
     column_names : list
     """
     
-    with connection.cursor() as cursor: # client side cursor
+    with borrow(connection) as connection, \
+         connection.cursor() as cursor: # client side cursor
         # execute sql statement
         cursor.execute(query=query, vars=variables)
 
@@ -133,18 +451,108 @@ def postgresql_results(connection,
     return rows, column_names
 
 
+def postgresql_copy_results(connection,
+                            query: 'str',
+                            variables: 'tuple | None' = None,
+                            chunksize: 'int | None' = None):
+    """
+    Get PostgreSQL query results as a Pandas DataFrame with COPY
+    
+    The query results are copied by the server as csv into an in-memory
+    buffer that is parsed by pandas, without creating a Python object
+    per value. Column types come from the description of a cursor
+    declared on the query, which is not run.
+    
+    Parameters
+    ----------
+    connection : (psycopg2 connection object) or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
+    query : string
+        SQL query (SELECT, VALUES or WITH)
+    variables : tuple or None, default None
+        Parameters to pass to SQL query
+    chunksize : int or None, default None
+        Parse the buffer chunksize lines at a time
+    
+    Returns
+    -------
+    df : Pandas DataFrame
+        query results, with the compact flights column types for the
+        columns of flights tables
+    """
+    
+    with borrow(connection) as connection, \
+         connection.cursor() as cursor:
+        # Python codec of the client encoding of the connection
+        encoding = psycopg2.extensions.encodings[connection.encoding]
+        
+        # Inline the parameters, COPY does not take any
+        statement = sqs.strip_statement(
+            cursor.mogrify(query, variables).decode(encoding)
+        )
+        
+        # Column names and types without running the query: fetching no
+        # row of a cursor declared on it
+        name = sql.Identifier(f'describe_{uuid.uuid4().hex}')
+        cursor.execute(sql.SQL('DECLARE {} NO SCROLL CURSOR FOR\n{}\n')
+                       .format(name, sql.SQL(statement)))
+        cursor.execute(sql.SQL('FETCH FORWARD 0 FROM {}').format(name))
+        description = [(desc[0], desc[1]) for desc in cursor.description]
+        schema_columns = flights_columns(connection, cursor.description)
+        cursor.execute(sql.SQL('CLOSE {}').format(name))
+        
+        buffer = io.BytesIO()
+        cursor.copy_expert(
+            sql.SQL("COPY (\n{}\n) TO STDOUT WITH (FORMAT csv, HEADER, NULL {})")
+            .format(sql.SQL(statement), sql.Literal(COPY_NULL)),
+            buffer
+        )
+    
+    buffer.seek(0)
+    
+    dtype = {
+        name : POSTGRESQL_DTYPES[oid]
+        for name, oid in description
+        if oid in POSTGRESQL_DTYPES
+    }
+    # Flights text columns are parsed straight to categoricals, they are
+    # then mapped onto the shared category dictionaries
+    dtype.update({name : 'category' for name in schema_columns
+                  if name in fs.CATEGORICAL_DOMAINS})
+    parse_dates = [name for name, oid in description if oid in POSTGRESQL_DATES]
+    
+    df = pd.read_csv(buffer,
+                     dtype=dtype,
+                     parse_dates=parse_dates,
+                     keep_default_na=False,
+                     na_values=[COPY_NULL],
+                     true_values=['t'],
+                     false_values=['f'],
+                     encoding=encoding,
+                     chunksize=chunksize)
+    
+    if chunksize is None:
+        return fs.apply_schema(df, columns=schema_columns)
+    
+    frames = [fs.apply_schema(chunk, columns=schema_columns) for chunk in df]
+    
+    return pd.concat(frames, ignore_index=True)
+
+
 def execute_sql_statement(connection,
                           query: 'str',
                           variables: 'tuple | None' = None,
                           save_to_csv: 'bool' = False,
-                          csv_path: 'str | None' = None):
+                          csv_path: 'str | None' = None,
+                          fetch: 'str' = 'copy',
+                          chunksize: 'int | None' = None):
     """
     Returns a PostgreSQL query as a Pandas Dataframe
     
     Parameters
     ----------
-    connection : (psycopg2 connection object)
-        A PostgreSQL connection
+    connection : (psycopg2 connection object) or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
     query : string
         SQL query
     variables : tuple or None, default None
@@ -153,6 +561,12 @@ def execute_sql_statement(connection,
         Write query result to csv
     csv_path : string or None, default None
         Filepath to save csv output
+    fetch : string 'copy', 'rows', default 'copy'
+        'copy' transfers the results with COPY (see
+        postgresql_copy_results), 'rows' fetches them as Python tuples,
+        which also works for statements COPY does not accept
+    chunksize : int or None, default None
+        With fetch='copy', parse the results chunksize lines at a time
             
     Returns
     -------
@@ -160,13 +574,151 @@ def execute_sql_statement(connection,
         dataframe of query results
     """
     
-    # Get PostgreSQL query results and column names
-    rows, column_names = postgresql_results(connection=connection,
-                                            query=query,
-                                            variables=variables)
+    if fetch == 'copy':
+        df = postgresql_copy_results(connection=connection,
+                                     query=query,
+                                     variables=variables,
+                                     chunksize=chunksize)
+    else:
+        # Get PostgreSQL query results and column names
+        rows, column_names, schema_columns = _fetch_rows(connection=connection,
+                                                         query=query,
+                                                         variables=variables)
+        
+        # Store query results in Pandas Dataframe with the compact flights
+        # column types
+        df = fs.apply_schema(pd.DataFrame(rows, columns=column_names),
+                             columns=schema_columns)
     
-    # Store query results in Pandas Dataframe
-    df = pd.DataFrame(rows, columns=column_names)
+    # If True and a file path is provided save the dataframe to csv
+    if (save_to_csv) & (csv_path != None):
+        dataframe_to_csv(df=df, csv_path=csv_path)
+    
+    return df
+
+
+def table_fingerprint(connection, tables: 'list'):
+    """
+    Returns a cheap fingerprint of database tables, which changes when
+    rows are inserted, updated or deleted, or the table is altered
+    
+    The row counters come from pg_stat_user_tables, which the server
+    updates shortly after every transaction commits.
+    
+    Parameters
+    ----------
+    connection : psycopg2 connection object or ConnectionPool
+    tables : list of string
+        Table names
+    
+    Returns
+    -------
+    fingerprint : list
+    """
+    
+    rows, _ = postgresql_results(connection=connection,
+                                 query=TABLE_FINGERPRINT_SQL,
+                                 variables=(list(tables),))
+    
+    return [list(row) for row in rows]
+
+
+def cached_sql_statement(connection,
+                         query: 'str',
+                         variables: 'tuple | None' = None,
+                         tables: 'list' = ['flights'],
+                         save_to_csv: 'bool' = False,
+                         csv_path: 'str | None' = None,
+                         fetch: 'str' = 'copy',
+                         refresh: 'bool' = False,
+                         cache_dir: 'str' = QUERY_CACHE_DIR):
+    """
+    Returns a PostgreSQL query as a Pandas Dataframe, from the local
+    query cache when the tables it reads have not changed
+    
+    Results are keyed by the query, normalized outside its quoted
+    strings (see sql_statements.normalize_statement), and its variables,
+    and saved as parquet with the fingerprint of the tables (see
+    table_fingerprint). A saved result is returned only when the
+    fingerprint of the tables still matches, which costs one catalog
+    query instead of the query itself. Its categorical columns are cast
+    to the shared category dictionaries, like the result of the query.
+    
+    Parameters
+    ----------
+    connection : psycopg2 connection object or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
+    query : string
+        SQL query
+    variables : tuple or None, default None
+        Parameters to pass to SQL query
+    tables : list of string, default ['flights']
+        Tables the query reads
+    save_to_csv : bool, default False
+        Write query result to csv
+    csv_path : string or None, default None
+        Filepath to save csv output
+    fetch : string 'copy', 'rows', default 'copy'
+        See execute_sql_statement
+    refresh : bool, default False
+        Run the query even when its result is cached
+    cache_dir : string, default QUERY_CACHE_DIR
+    
+    Returns
+    -------
+    df : Pandas DataFrame
+        dataframe of query results
+    """
+    
+    statement = sqs.normalize_statement(query)
+    key = hashlib.sha1(json.dumps(
+        {'query' : statement, 'variables' : variables},
+        default=str
+    ).encode()).hexdigest()
+    
+    parquet_path = os.path.join(cache_dir, f'{key}.parquet')
+    meta_path = os.path.join(cache_dir, f'{key}.json')
+    
+    fingerprint = table_fingerprint(connection, tables)
+    
+    df = None
+    
+    if not refresh and os.path.exists(meta_path):
+        with open(meta_path) as f_input:
+            meta = json.load(f_input)
+        if (meta['fingerprint'] == fingerprint
+                and 'categorical_columns' in meta):
+            df = pd.read_parquet(parquet_path)
+            # Saved with the categories of the query's result
+            df = fs.apply_schema(df, columns=meta['categorical_columns'])
+    
+    if df is None:
+        df = execute_sql_statement(connection,
+                                   query=query,
+                                   variables=variables,
+                                   fetch=fetch)
+        
+        # The description is written last, so a result is never read
+        # from a partially written file
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{parquet_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, parquet_path)
+        
+        tmp_path = f'{meta_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        with open(tmp_path, 'w') as f_output:
+            json.dump({'query' : statement,
+                       'variables' : variables,
+                       'tables' : list(tables),
+                       'fingerprint' : fingerprint,
+                       'categorical_columns' : [
+                           column for column, dtype in df.dtypes.items()
+                           if isinstance(dtype, pd.CategoricalDtype)
+                       ]},
+                      f_output,
+                      indent=4,
+                      default=str)
+        os.replace(tmp_path, meta_path)
     
     # If True and a file path is provided save the dataframe to csv
     if (save_to_csv) & (csv_path != None):
@@ -175,17 +727,131 @@ def execute_sql_statement(connection,
     return df
 
 
-def get_table_data_types(connection, table_name: str):
+def clear_query_cache(cache_dir: 'str' = QUERY_CACHE_DIR):
+    """
+    Deletes every cached query result
+    """
+    
+    if os.path.exists(cache_dir):
+        for entry in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, entry))
+    
+    return None
+
+
+def stream_sql_statement(connection,
+                         query: 'str',
+                         variables: 'tuple | None' = None,
+                         chunksize: 'int' = 100_000,
+                         itersize: 'int' = 10_000):
+    """
+    Yields the results of a PostgreSQL query as Pandas DataFrames of at
+    most chunksize rows
+    
+    The query runs in a named (server side) cursor, so rows are sent by
+    the server itersize at a time and only one chunk is held in memory,
+    whatever the size of the result.
+    
+    Parameters
+    ----------
+    connection : (psycopg2 connection object) or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from for the
+        life of the generator
+    query : string
+        SQL query
+    variables : tuple or None, default None
+        Parameters to pass to SQL query
+    chunksize : int, default 100,000
+        Rows per DataFrame
+    itersize : int, default 10,000
+        Rows fetched from the server per network round trip
+    
+    Yields
+    ------
+    df : Pandas DataFrame
+        query results with the compact flights column types for the
+        columns of flights tables, so chunks can be combined with
+        flights_schema.concat. An empty result
+        yields one empty DataFrame with the query's columns.
+    
+    Example
+    -------
+    for df in stream_sql_statement(pool, 'SELECT * FROM flights;'):
+        ...
+    """
+    
+    with borrow(connection) as connection, \
+         connection.cursor(name=f'stream_{uuid.uuid4().hex}') as cursor: # server side cursor
+        cursor.itersize = itersize
+        cursor.execute(query=query, vars=variables)
+        
+        column_names = None
+        
+        while True:
+            rows = list(itertools.islice(cursor, chunksize))
+            
+            # The description of a named cursor is known after a fetch
+            if column_names is None:
+                column_names = [desc[0] for desc in cursor.description]
+                schema_columns = flights_columns(connection, cursor.description)
+            elif not rows:
+                break
+            
+            yield fs.apply_schema(pd.DataFrame(rows, columns=column_names),
+                                  columns=schema_columns)
+            
+            if len(rows) < chunksize:
+                break
+
+
+def execute_sql_statements(pool,
+                           queries: 'dict',
+                           max_workers: 'int | None' = None):
+    """
+    Returns several PostgreSQL queries as Pandas DataFrames, running
+    them concurrently on the connections of a pool
+    
+    Parameters
+    ----------
+    pool : ConnectionPool
+    queries : dict
+        name : SQL query, or name : (SQL query, variables)
+    max_workers : int or None, default None
+        Number of concurrent queries, the pool's maximum size when None
+    
+    Returns
+    -------
+    dfs : dict
+        name : Pandas DataFrame
+    """
+    
+    def run(query):
+        query, variables = query if isinstance(query, tuple) else (query, None)
+        return execute_sql_statement(pool, query=query, variables=variables)
+    
+    with ThreadPoolExecutor(max_workers=max_workers or pool.maxconn) as executor:
+        futures = {name : executor.submit(run, query)
+                   for name, query in queries.items()}
+    
+    return {name : future.result() for name, future in futures.items()}
+
+
+def get_table_data_types(connection,
+                         table_name: str,
+                         use_cache: 'bool' = True):
     """
     Returns a summary table of the columns and corresponding datatypes
     in a given PostgreSQL database table.
     
     Parameters
     ----------
-    connection : psycopg2 connection object
-        A PostgreSQL connection
+    connection : psycopg2 connection object or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
     table_name : string
         Name of the table
+    use_cache : bool, default True
+        Read the result from the query cache while the table is
+        unchanged (see cached_sql_statement)
         
     Returns
     -------
@@ -207,6 +873,13 @@ def get_table_data_types(connection, table_name: str):
     # store table_name as a tuple
     variables = (table_name,)
     
+    if use_cache:
+        return cached_sql_statement(connection,
+                                    query=query,
+                                    variables=variables,
+                                    tables=[table_name],
+                                    fetch='rows')
+    
     # Get PostgreSQL query results and column names
     rows, column_names = postgresql_results(connection=connection,
                                             query=query,
@@ -223,45 +896,415 @@ def get_table_data_types(connection, table_name: str):
 # [How to derive summary statistics using PostgreSQL](https://towardsdatascience.com/how-to-derive-summary-statistics-using-postgresql-742f3cdc0f44)
 
 
+# PostgreSQL numeric data types, as named by information_schema
+NUMERIC_DATA_TYPES = ['smallint', 'integer', 'bigint', 'real',
+                      'double precision', 'numeric']
+
+# Rows of the numeric statistics, as in the saved *_numeric_stats.csv
+NUMERIC_STATISTICS = ['null_count', 'count', 'mean', 'standard_deviation',
+                      'variance', 'range', 'minimum', 'Q1/25%',
+                      'median/Q2/50%', 'Q3/75%', 'maximum',
+                      'interquartile_range (IQR)', 'skewness', 'kurtosis']
+
+
+def get_numeric_columns(connection, table_name: 'str'):
+    """
+    Returns the numeric columns of a PostgreSQL database table, in
+    table order
+    """
+    
+    query = """
+    SELECT
+       column_name
+    FROM 
+       information_schema.columns
+    WHERE 
+       table_name = (%s)
+       AND data_type = ANY(%s)
+    ORDER BY
+       ordinal_position;
+    """
+    
+    rows, _ = postgresql_results(connection=connection,
+                                 query=query,
+                                 variables=(table_name, NUMERIC_DATA_TYPES))
+    
+    return [row[0] for row in rows]
+
+
+def numeric_statistics_sql(table_name: 'str', columns: 'list'):
+    """
+    Composes one SELECT computing the aggregates of the numeric
+    statistics of every column, so the table is scanned once
+    
+    The result is a single row with the columns c<i>_<aggregate> for
+    the i-th column: nulls, count, mean, variance, min, max, q1, median,
+    q3 and the sums of the 3rd and 4th powers (for the kurtosis).
+    
+    Returns
+    -------
+    query : psycopg2.sql.Composed
+    """
+    
+    aggregates = {
+        'nulls' : 'COUNT(*) - COUNT({x})',
+        'count' : 'COUNT({x})',
+        'mean' : 'AVG({x})',
+        'variance' : 'VAR_SAMP({x})',
+        'min' : 'MIN({x})',
+        'max' : 'MAX({x})',
+        'q1' : 'PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY {x})',
+        'median' : 'PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {x})',
+        'q3' : 'PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY {x})',
+        'sum3' : 'SUM({x} ^ 3)',
+        'sum4' : 'SUM({x} ^ 4)'
+    }
+    
+    select = [
+        sql.SQL(aggregate + ' AS {alias}').format(
+            # Double precision, as AVG and VAR_SAMP of integers are
+            # computed in exact numeric otherwise
+            x=sql.SQL('{}::DOUBLE PRECISION').format(sql.Identifier(column)),
+            alias=sql.Identifier(f'c{i}_{name}')
+        )
+        for i, column in enumerate(columns)
+        for name, aggregate in aggregates.items()
+    ]
+    
+    return sql.SQL('SELECT {} FROM {};').format(sql.SQL(', ').join(select),
+                                               sql.Identifier(table_name))
+
+
+def numeric_statistics(row, columns: 'list'):
+    """
+    Returns the numeric statistics of every column from the single row
+    of numeric_statistics_sql
+    
+    skewness is Pearson's median skewness, 3 (mean - median) / std, as
+    in the saved statistics, kurtosis is the excess kurtosis of the
+    moments.
+    
+    Returns
+    -------
+    stats : Pandas DataFrame
+        One row per statistic (NUMERIC_STATISTICS), one column per
+        column of the table
+    """
+    
+    stats = {}
+    
+    for i, column in enumerate(columns):
+        value = {name[len(f'c{i}_'):] : row[name]
+                 for name in row.index if name.startswith(f'c{i}_')}
+        value = {k : float(v) if pd.notna(v) else float('nan')
+                 for k, v in value.items()}
+        
+        n, mean = value['count'], value['mean']
+        std = value['variance'] ** 0.5
+        
+        # Central moments from the raw moments
+        m2 = value['variance'] * (n - 1) / n if n > 0 else float('nan')
+        m4 = (value['sum4'] / n - 4 * mean * value['sum3'] / n
+              + 6 * mean ** 2 * (m2 + mean ** 2) - 3 * mean ** 4) if n > 0 else float('nan')
+        
+        stats[column] = [
+            value['nulls'],
+            n,
+            mean,
+            std,
+            value['variance'],
+            value['max'] - value['min'],
+            value['min'],
+            value['q1'],
+            value['median'],
+            value['q3'],
+            value['max'],
+            value['q3'] - value['q1'],
+            3 * (mean - value['median']) / std if std > 0 else float('nan'),
+            m4 / m2 ** 2 - 3 if m2 > 0 else float('nan')
+        ]
+    
+    return pd.DataFrame(stats, index=NUMERIC_STATISTICS)
+
+
+def get_numeric_statistics(connection,
+                           table_name: 'str' = 'flights',
+                           columns: 'list | None' = None,
+                           use_cache: 'bool' = True):
+    """
+    Returns the descriptive statistics of the numeric columns of a
+    PostgreSQL database table, computed in a single scan
+    
+    Parameters
+    ----------
+    connection : psycopg2 connection object or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
+    table_name : string, default 'flights'
+    columns : list or None, default None
+        Columns to describe, every numeric column when None
+    use_cache : bool, default True
+        Read the result from the query cache while the table is
+        unchanged (see cached_sql_statement)
+    
+    Returns
+    -------
+    df : Pandas DataFrame
+        One row per statistic (NUMERIC_STATISTICS), one column per
+        numeric column, like the saved *_numeric_stats.csv files
+    """
+    
+    if columns is None:
+        columns = get_numeric_columns(connection, table_name)
+    
+    with borrow(connection) as pooled_connection:
+        query = (numeric_statistics_sql(table_name, columns)
+                 .as_string(pooled_connection))
+    
+    if use_cache:
+        row = cached_sql_statement(connection, query=query, tables=[table_name])
+    else:
+        row = execute_sql_statement(connection, query=query)
+    
+    return numeric_statistics(row.iloc[0], columns)
+
+
+# PostgreSQL text data types, as named by information_schema
+TEXT_DATA_TYPES = ['text', 'character varying', 'character']
+
+
+def get_text_columns(connection, table_name: 'str'):
+    """
+    Returns the text columns of a PostgreSQL database table, in table
+    order
+    """
+    
+    query = """
+    SELECT
+       column_name
+    FROM 
+       information_schema.columns
+    WHERE 
+       table_name = (%s)
+       AND data_type = ANY(%s)
+    ORDER BY
+       ordinal_position;
+    """
+    
+    rows, _ = postgresql_results(connection=connection,
+                                 query=query,
+                                 variables=(table_name, TEXT_DATA_TYPES))
+    
+    return [row[0] for row in rows]
+
+
+def categorical_statistics_sql(table_name: 'str', columns: 'list'):
+    """
+    Composes one SELECT counting the values of every column, with one
+    grouping set per column, so the table is scanned once
+    
+    GROUPING() tells which column a group counts (column_index). Like
+    the saved *_cat_stats.csv files, NULL values are counted with
+    COUNT(column) and so have a frequency of 0. Values ranked below
+    %(top_k)s in their column are summed into a single %(other)s row
+    (is_other), none when top_k is NULL.
+    
+    Returns
+    -------
+    query : psycopg2.sql.Composed
+        To execute with the variables {'top_k' : int or None,
+        'other' : string}
+    """
+    
+    identifiers = [sql.Identifier(column) for column in columns]
+    
+    def case(template):
+        return sql.SQL('CASE {} END').format(sql.SQL(' ').join(
+            sql.SQL('WHEN GROUPING({x}) = 0 THEN ' + template).format(x=x, i=sql.Literal(i))
+            for i, x in enumerate(identifiers)
+        ))
+    
+    return sql.SQL("""
+    WITH
+    counts AS
+    (
+     SELECT
+      {column_index} AS column_index,
+      {value} AS value,
+      {frequency} AS frequency
+       FROM {table}
+        GROUP BY GROUPING SETS ({grouping_sets})
+    ),
+    ranked AS
+    (
+     SELECT
+      *,
+      COALESCE(ROW_NUMBER() OVER (PARTITION BY column_index
+                                  ORDER BY frequency DESC, value) > %(top_k)s
+               AND value IS NOT NULL, FALSE) AS is_other
+       FROM counts
+    ),
+    bucketed AS
+    (
+     SELECT
+      column_index,
+      CASE WHEN is_other THEN %(other)s ELSE value END AS value,
+      is_other,
+      frequency
+       FROM ranked
+    )
+    SELECT
+     column_index,
+     value,
+     is_other,
+     SUM(frequency)::BIGINT AS frequency,
+     COALESCE(SUM(frequency)::DOUBLE PRECISION
+              / NULLIF(SUM(SUM(frequency)) OVER (PARTITION BY column_index), 0),
+              0) AS relative_frequency
+      FROM bucketed
+       GROUP BY column_index, value, is_other
+        ORDER BY column_index, value IS NULL, is_other, frequency DESC, value;
+    """).format(
+        column_index=case('{i}'),
+        value=case('{x}::TEXT'),
+        frequency=case('COUNT({x})'),
+        table=sql.Identifier(table_name),
+        grouping_sets=sql.SQL(', ').join(sql.SQL('({})').format(x) for x in identifiers)
+    )
+
+
+def get_categorical_statistics(connection,
+                               table_name: 'str' = 'flights',
+                               columns: 'list | None' = None,
+                               top_k: 'int | None' = None,
+                               other_label: 'str' = 'other',
+                               save_dir: 'str | None' = None,
+                               use_cache: 'bool' = True):
+    """
+    Returns the frequency and relative frequency of the values of the
+    categorical columns of a PostgreSQL database table, computed in a
+    single scan (see categorical_statistics_sql)
+    
+    Parameters
+    ----------
+    connection : psycopg2 connection object or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
+    table_name : string, default 'flights'
+    columns : list or None, default None
+        Columns to describe, every text column when None
+    top_k : int or None, default None
+        Keep the top_k most frequent values of every column and sum the
+        others into an other_label row, e.g. for tail_num. None keeps
+        every value.
+    other_label : string, default 'other'
+    save_dir : string or None, default None
+        Directory to write every column to
+        {table_name}_{column}_cat_stats.csv, e.g.
+        '../data/descriptive_stats'
+    use_cache : bool, default True
+        Read the result from the query cache while the table is
+        unchanged (see cached_sql_statement)
+    
+    Returns
+    -------
+    stats : dict
+        column : Pandas DataFrame with the columns [column, frequency,
+        relative_frequency], most frequent values first, then the
+        other_label row and the NULL row
+    """
+    
+    if columns is None:
+        columns = get_text_columns(connection, table_name)
+    
+    with borrow(connection) as pooled_connection:
+        query = (categorical_statistics_sql(table_name, columns)
+                 .as_string(pooled_connection))
+    
+    variables = {'top_k' : top_k, 'other' : other_label}
+    
+    if use_cache:
+        df = cached_sql_statement(connection,
+                                  query=query,
+                                  variables=variables,
+                                  tables=[table_name])
+    else:
+        df = execute_sql_statement(connection, query=query, variables=variables)
+    
+    stats = {}
+    
+    for i, column in enumerate(columns):
+        column_stats = (df[df['column_index'] == i]
+                        .rename(columns={'value' : column})
+                        [[column, 'frequency', 'relative_frequency']]
+                        .astype({'frequency' : 'int64'})
+                        .reset_index(drop=True))
+        stats[column] = column_stats
+        
+        if save_dir is not None:
+            dataframe_to_csv(column_stats, csv_path=os.path.join(
+                save_dir, f'{table_name}_{column}_cat_stats.csv'
+            ))
+    
+    return stats
+
+
 def get_descriptive_statistics(connection,
                                stat_type: 'str num | cat',
                                save_to_csv: 'bool' = False,
-                               csv_path: 'str | None' = None):
+                               csv_path: 'str | None' = None,
+                               use_cache: 'bool' = True,
+                               table_name: 'str' = 'flights'):
     """
     Get descriptive statistics for numeric or categorical columns
     in PostgreSQL database
     
     Paramaters
     ----------
-    connection : psycopg2 connection object
-        A PostgreSQL connection
+    connection : psycopg2 connection object or ConnectionPool
+        A PostgreSQL connection, or a pool to borrow one from
     stat_type : string, 'num' or 'cat'
         Select type of descriptive statistic, numeric or categorical
     save_to_csv : bool, default False
         Write query result to csv
     csv_path : string or None, default None
         Filepath to save csv output
+    use_cache : bool, default True
+        Read the statistics from the query cache while the table is
+        unchanged (see cached_sql_statement)
+    table_name : string, default 'flights'
+        Table of the statistics
     
     Returns
     -------
     df : Pandas DataFrame
+        For 'num', one row per statistic and one column per numeric
+        column of the table (see get_numeric_statistics). For 'cat',
+        the frequency and relative frequency of every
+        mkt_unique_carrier (see get_categorical_statistics).
     """
     
-    # Select descriptive statistic type
+    # Every numeric column in a single scan
     if stat_type == 'num':
-        query = sqs.numerical_statistics_sql
-    elif stat_type == 'cat':
-        query = sqs.categorical_statistics_sql
+        df = get_numeric_statistics(connection,
+                                    table_name=table_name,
+                                    use_cache=use_cache)
+        
+        # The statistics are the index
+        if (save_to_csv) & (csv_path != None):
+            df.to_csv(csv_path)
+        
+        return df
     
-    # retrive descriptive statistics
-    df = execute_sql_statement(connection,
-                               query=query,                             
-                               save_to_csv=save_to_csv,
-                               csv_path=csv_path)
+    if stat_type != 'cat':
+        raise ValueError(f"stat_type must be 'num' or 'cat', not {stat_type!r}")
+    
+    df = get_categorical_statistics(connection,
+                                    table_name=table_name,
+                                    columns=['mkt_unique_carrier'],
+                                    use_cache=use_cache)['mkt_unique_carrier']
+    
+    if (save_to_csv) & (csv_path != None):
+        dataframe_to_csv(df=df, csv_path=csv_path)
     
-    if 'sno' in df.columns:
-        df = df.drop('sno', axis=1)
-
     return df
 
 
@@ -0,0 +1,416 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Delay statistics are built from central moment accumulators: the
+# count, mean, and sums of squared (m2) and cubed (m3) deviations from
+# the mean. Accumulators of disjoint sets of flights can be merged
+# exactly, so every statistic is computed in one pass over the data.
+MOMENTS = ['count', 'mean', 'm2', 'm3']
+
+
+def grouped_moments(codes, values, n_groups: 'int'):
+    """
+    Returns the moment accumulators of values grouped by integer codes
+
+    Parameters
+    ----------
+    codes : numpy array of int
+        Group of every value, from 0 to n_groups - 1
+    values : numpy array of float
+    n_groups : int
+
+    Returns
+    -------
+    moments : Pandas DataFrame
+        One row per group with the columns of MOMENTS
+    """
+
+    values = np.asarray(values, dtype='float64')
+
+    count = np.bincount(codes, minlength=n_groups).astype('float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / count
+
+    deviation = values - mean[codes]
+
+    return pd.DataFrame({
+        'count' : count,
+        'mean' : mean,
+        'm2' : np.bincount(codes, weights=deviation ** 2, minlength=n_groups),
+        'm3' : np.bincount(codes, weights=deviation ** 3, minlength=n_groups)
+    })
+
+
+def merge_moments(a, b):
+    """
+    Returns the moment accumulators of the union of two disjoint sets
+
+    Parameters
+    ----------
+    a, b : Pandas DataFrame
+        Moment accumulators with the columns of MOMENTS, aligned on
+        their index. Missing rows count as empty sets.
+
+    Returns
+    -------
+    moments : Pandas DataFrame
+        Indexed by the union of both indexes
+
+    The update follows Pébay (2008), "Formulas for Robust, One-Pass
+    Parallel Computation of Covariances and Arbitrary-Order Statistical
+    Moments".
+    """
+
+    index = a.index.union(b.index)
+    a = a.reindex(index)
+    b = b.reindex(index)
+
+    n_a = a['count'].fillna(0).to_numpy()
+    n_b = b['count'].fillna(0).to_numpy()
+    n = n_a + n_b
+
+    mean_a = a['mean'].fillna(0).to_numpy()
+    mean_b = b['mean'].fillna(0).to_numpy()
+    m2_a = a['m2'].fillna(0).to_numpy()
+    m2_b = b['m2'].fillna(0).to_numpy()
+    m3_a = a['m3'].fillna(0).to_numpy()
+    m3_b = b['m3'].fillna(0).to_numpy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where((n_a > 0) & (n_b > 0), mean_b - mean_a, 0)
+        mean = np.where(n > 0, (n_a * mean_a + n_b * mean_b) / n, np.nan)
+        m2 = m2_a + m2_b + np.where(n > 0, delta ** 2 * n_a * n_b / n, 0)
+        m3 = (m3_a + m3_b
+              + np.where(n > 0,
+                         delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+                         + 3 * delta * (n_a * m2_b - n_b * m2_a) / n,
+                         0))
+
+    return pd.DataFrame({'count' : n, 'mean' : mean, 'm2' : m2, 'm3' : m3},
+                        index=index)
+
+
+def moments_to_stats(moments):
+    """
+    Returns the mean, standard deviation and skewness of moment
+    accumulators, with the same conventions as pandas: std uses one
+    delta degree of freedom (NaN below 2 values) and skew is the
+    adjusted Fisher-Pearson coefficient (NaN below 3 values)
+
+    Parameters
+    ----------
+    moments : Pandas DataFrame
+        Moment accumulators with the columns of MOMENTS
+
+    Returns
+    -------
+    stats : Pandas DataFrame
+        columns mean, std and skew
+    """
+
+    n = moments['count'].to_numpy()
+    m2 = moments['m2'].to_numpy()
+    m3 = moments['m3'].to_numpy()
+
+    # Treat floating point noise around zero as zero like pandas does
+    m2 = np.where(np.abs(m2) < 1e-14, 0, m2)
+    m3 = np.where(np.abs(m3) < 1e-14, 0, m3)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+        skew = n * (n - 1) ** 0.5 / (n - 2) * (m3 / m2 ** 1.5)
+        skew = np.where(m2 == 0, 0, skew)
+        skew = np.where(n > 2, skew, np.nan)
+
+    return pd.DataFrame({
+        'mean' : np.where(n > 0, moments['mean'].to_numpy(), np.nan),
+        'std' : std,
+        'skew' : skew
+    }, index=moments.index)
+
+
+def window_moments(data, groupby: 'str', feature: 'str', windows: 'dict'):
+    """
+    Returns the moment accumulators of a feature for every group and
+    time window, computed in a single pass over the data
+
+    Every row is assigned to the combination of windows it belongs to.
+    Moments are accumulated once per (group, combination) and each
+    window is then the merge of the combinations that include it, so
+    overlapping windows (e.g. a week within a month) cost no extra pass.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+    groupby : string
+        Grouping feature
+    feature : string
+        Numeric feature
+    windows : dict
+        Window name : boolean mask (array-like aligned with data)
+
+    Returns
+    -------
+    moments : dict
+        Window name : Pandas DataFrame of moment accumulators indexed by
+        the groups (named groupby) that have at least one row in it
+    """
+
+    names = list(windows)
+    masks = np.column_stack(
+        [np.asarray(windows[name], dtype=bool) for name in names]
+    ) if names else np.zeros((data.shape[0], 0), dtype=bool)
+
+    # Combination of windows of each row as a bit field
+    combination = (masks * (1 << np.arange(len(names)))).sum(axis=1)
+
+    codes, groups = pd.factorize(data[groupby], sort=True)
+    values = data[feature].to_numpy(dtype='float64')
+    keep = (codes != -1) & (combination > 0) & ~np.isnan(values)
+
+    n_combinations = 1 << len(names)
+    moments = grouped_moments(
+        codes[keep] * n_combinations + combination[keep],
+        values[keep],
+        len(groups) * n_combinations
+    )
+    moments.index = pd.MultiIndex.from_product(
+        [range(len(groups)), range(n_combinations)]
+    )
+
+    result = {}
+
+    for bit, name in enumerate(names):
+        merged = None
+        for c in range(n_combinations):
+            if not c & (1 << bit):
+                continue
+            part = moments.xs(c, level=1)
+            merged = part if merged is None else merge_moments(merged, part)
+        merged = merged[merged['count'] > 0]
+        merged.index = pd.Index(np.asarray(groups)[merged.index], name=groupby)
+        result[name] = merged
+
+    return result
+
+
+def window_stats(data, feature_dict: 'dict', windows: 'dict'):
+    """
+    Returns the mean, standard deviation and skewness of delay features
+    for every grouping feature and time window
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+    feature_dict : dict
+        Grouping feature : numeric feature, e.g. {'origin' : 'dep_delay'}
+    windows : dict
+        Window name : boolean mask (array-like aligned with data)
+
+    Returns
+    -------
+    stats : dict
+        Grouping feature : Pandas DataFrame indexed by the groups with
+        the columns {window}_{groupby}_{mean|std|skew}_{feature}
+    """
+
+    stats = {}
+
+    for groupby, feature in feature_dict.items():
+        frames = []
+        for window, moments in window_moments(data, groupby, feature, windows).items():
+            window_table = moments_to_stats(moments)
+            window_table.columns = [
+                f'{window}_{groupby}_{stat}_{feature}'
+                for stat in window_table.columns
+            ]
+            frames.append(window_table)
+
+        stats[groupby] = pd.concat(frames, axis=1).sort_index()
+
+    return stats
+
+
+class DelayStatsStore:
+    """
+    Mergeable store of delay moment accumulators, by grouping feature,
+    time window and group
+
+    New flights are folded into the accumulators of the groups and
+    windows they belong to, so an update costs time proportional to the
+    new flights only, and the statistics are always those of all the
+    flights seen so far.
+
+    Parameters
+    ----------
+    feature_dict : dict
+        Grouping feature : numeric feature, e.g. {'origin' : 'dep_delay'}
+
+    Example
+    -------
+    store = DelayStatsStore.load('../data/feature_average_delay_stats/moments',
+                                 feature_dict={'origin' : 'dep_delay'},
+                                 windows=['2020_month'])
+    store.update(day_of_flights, windows={'2020_month' : mask})
+    store.save('../data/feature_average_delay_stats/moments',
+               windows=['2020_month'])
+    store.stats('origin')
+    """
+
+    def __init__(self, feature_dict: 'dict'):
+        self.feature_dict = dict(feature_dict)
+        # (groupby, window) : Pandas DataFrame of MOMENTS indexed by group
+        self.moments = {}
+
+    def update(self, data, windows: 'dict'):
+        """
+        Folds flights into the accumulators and returns the store
+
+        Parameters
+        ----------
+        data : Pandas DataFrame
+            New flights, disjoint from the flights already folded in
+        windows : dict
+            Window name : boolean mask (array-like aligned with data)
+        """
+
+        for groupby, feature in self.feature_dict.items():
+            new_moments = window_moments(data, groupby, feature, windows)
+
+            for window, new in new_moments.items():
+                if new.empty:
+                    continue
+
+                table = self.moments.get((groupby, window))
+
+                if table is None:
+                    self.moments[(groupby, window)] = new
+                    continue
+
+                # Merge the groups of the new flights only
+                merged = merge_moments(table.reindex(new.index), new)
+                seen = merged.index.isin(table.index)
+                table.loc[merged.index[seen]] = merged[seen]
+
+                if not seen.all():
+                    table = pd.concat([table, merged[~seen]])
+                    table.index.name = groupby
+                    self.moments[(groupby, window)] = table
+
+        return self
+
+    def windows(self, groupby: 'str'):
+        """
+        Returns the windows of a grouping feature, in insertion order
+        """
+
+        return [window for (key, window) in self.moments if key == groupby]
+
+    def stats(self, groupby: 'str', windows: 'list | None' = None):
+        """
+        Returns the delay statistics of a grouping feature
+
+        Parameters
+        ----------
+        groupby : string
+        windows : list or None, default None
+            Windows of the statistics, None for every window of the
+            grouping feature
+
+        Returns
+        -------
+        stats : Pandas DataFrame
+            indexed by the groups with the columns
+            {window}_{groupby}_{mean|std|skew}_{feature}, the layout of
+            the data/feature_average_delay_stats csv files
+        """
+
+        feature = self.feature_dict[groupby]
+        frames = []
+
+        for window in self.windows(groupby):
+            if windows is not None and window not in windows:
+                continue
+            window_table = moments_to_stats(self.moments[(groupby, window)])
+            window_table.columns = [
+                f'{window}_{groupby}_{stat}_{feature}'
+                for stat in window_table.columns
+            ]
+            frames.append(window_table)
+
+        return pd.concat(frames, axis=1).sort_index()
+
+    def save(self, directory: 'str', windows: 'list | None' = None):
+        """
+        Saves the accumulators to one directory per window, holding one
+        csv file per grouping feature, and returns the store
+
+        Parameters
+        ----------
+        directory : string
+        windows : list or None, default None
+            Windows to save, e.g. the windows of the last update. None
+            saves every window.
+        """
+
+        for groupby, feature in self.feature_dict.items():
+            for window in self.windows(groupby):
+                if windows is not None and window not in windows:
+                    continue
+
+                window_dir = os.path.join(directory, window)
+                os.makedirs(window_dir, exist_ok=True)
+
+                path = os.path.join(window_dir, f'{groupby}_{feature}_moments.csv')
+                tmp_path = f'{path}.tmp-{os.getpid()}'
+                self.moments[(groupby, window)].to_csv(tmp_path)
+                os.replace(tmp_path, path)
+
+        return self
+
+    @classmethod
+    def load(cls,
+             directory: 'str',
+             feature_dict: 'dict',
+             windows: 'list | None' = None):
+        """
+        Returns the store saved in a directory, empty when the directory
+        holds no accumulators
+
+        Parameters
+        ----------
+        directory : string
+        feature_dict : dict
+        windows : list or None, default None
+            Windows to load, e.g. the windows new flights belong to.
+            None loads every saved window.
+        """
+
+        store = cls(feature_dict)
+
+        if windows is None:
+            windows = sorted(
+                window for window in os.listdir(directory)
+                if os.path.isdir(os.path.join(directory, window))
+            ) if os.path.isdir(directory) else []
+
+        for groupby, feature in feature_dict.items():
+            for window in windows:
+                path = os.path.join(directory, window,
+                                    f'{groupby}_{feature}_moments.csv')
+                if not os.path.exists(path):
+                    continue
+
+                store.moments[(groupby, window)] = pd.read_csv(
+                    path,
+                    index_col=0,
+                    dtype={groupby : str},
+                    keep_default_na=False,
+                    na_values=[''],
+                    float_precision='round_trip'
+                )[MOMENTS]
+
+        return store
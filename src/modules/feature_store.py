@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+# Feature matrices already computed, one directory per key
+STORE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'data', 'feature_store'
+)
+
+# Name of the file describing the frames of a key
+META = 'meta.json'
+
+
+def file_fingerprint(path: 'str'):
+    """
+    Returns the path, size and modification time of a file
+    """
+
+    path = os.path.abspath(os.path.expanduser(path))
+    stat = os.stat(path)
+
+    return {'path' : path, 'size' : stat.st_size, 'mtime_ns' : stat.st_mtime_ns}
+
+
+def code_version(modules: 'list'):
+    """
+    Returns the hash of the source files of python modules
+    """
+
+    digest = hashlib.sha1()
+
+    for module in sorted(modules, key=lambda module: module.__name__):
+        with open(module.__file__, 'rb') as f_input:
+            digest.update(module.__name__.encode())
+            digest.update(f_input.read())
+
+    return digest.hexdigest()
+
+
+def feature_key(config: 'dict', sources: 'list', modules: 'list'):
+    """
+    Returns the key of the feature matrices of a pipeline configuration
+
+    Parameters
+    ----------
+    config : dict
+        Parameters of the pipeline, json serializable
+    sources : list of string
+        Files the pipeline reads, identified by path, size and
+        modification time
+    modules : list of python modules
+        Modules holding the feature code, identified by their source
+
+    Returns
+    -------
+    key : string
+    """
+
+    description = json.dumps({
+        'config' : config,
+        'sources' : [file_fingerprint(path) for path in sources],
+        'code' : code_version(modules)
+    }, sort_keys=True, default=str)
+
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def save_frames(key: 'str',
+                frames: 'tuple',
+                description: 'dict | None' = None):
+    """
+    Saves DataFrames under a key, one .npy file per column
+
+    The frames are written to a temporary directory that is renamed
+    once complete, so a key is never partially written. A key identifies
+    its frames, so when another process saved the same key first its
+    frames are kept.
+
+    Parameters
+    ----------
+    key : string
+    frames : tuple of Pandas DataFrames
+        Numeric and boolean columns only
+    description : dict or None, default None
+        Saved in the metadata, e.g. the configuration of the key
+
+    Returns
+    -------
+    path : string
+    """
+
+    path = os.path.join(STORE_DIR, key)
+    tmp_path = f'{path}.tmp-{uuid.uuid4().hex}'
+    os.makedirs(tmp_path)
+
+    meta = {'description' : description if description is not None else {},
+            'frames' : []}
+
+    for n, df in enumerate(frames):
+        frame_meta = {
+            'columns' : [str(column) for column in df.columns],
+            'dtypes' : [str(dtype) for dtype in df.dtypes],
+            'index_name' : df.index.name
+        }
+
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                shutil.rmtree(tmp_path)
+                raise TypeError(f'column {column} is not numeric')
+            np.save(os.path.join(tmp_path, f'{n}-{i}.npy'), values)
+
+        if isinstance(df.index, pd.RangeIndex):
+            frame_meta['range_index'] = [df.index.start,
+                                         df.index.stop,
+                                         df.index.step]
+        else:
+            np.save(os.path.join(tmp_path, f'{n}-index.npy'), df.index.to_numpy())
+
+        meta['frames'].append(frame_meta)
+
+    with open(os.path.join(tmp_path, META), 'w') as f_output:
+        json.dump(meta, f_output, indent=4, default=str)
+
+    while True:
+        try:
+            os.rename(tmp_path, path)
+            return path
+        except OSError:
+            # Another process saved the key first, or an incomplete
+            # directory is in the way
+            if os.path.exists(os.path.join(path, META)):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return path
+            old_path = f'{path}.old-{uuid.uuid4().hex}'
+            try:
+                os.rename(path, old_path)
+            except FileNotFoundError:
+                # Moved aside by another process, try again
+                continue
+            shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_frames(key: 'str'):
+    """
+    Returns the DataFrames saved under a key, None when there are none
+
+    The columns are memory mapped copy-on-write and every column keeps
+    its own block, so only the pages that are used are read from disk
+    and changes are never written back.
+    """
+
+    path = os.path.join(STORE_DIR, key)
+
+    if not os.path.exists(os.path.join(path, META)):
+        return None
+
+    with open(os.path.join(path, META)) as f_input:
+        meta = json.load(f_input)
+
+    frames = []
+
+    for n, frame_meta in enumerate(meta['frames']):
+        if 'range_index' in frame_meta:
+            index = pd.RangeIndex(*frame_meta['range_index'])
+        else:
+            index = np.load(os.path.join(path, f'{n}-index.npy'), mmap_mode='r')
+
+        # copy=False keeps the memory maps instead of consolidating the
+        # columns into a copy
+        df = pd.DataFrame({
+            column : np.load(os.path.join(path, f'{n}-{i}.npy'), mmap_mode='c')
+            for i, column in enumerate(frame_meta['columns'])
+        }, index=pd.Index(index, name=frame_meta['index_name']), copy=False)
+
+        frames.append(df)
+
+    return tuple(frames)
+
+
+def cached(build, config: 'dict', sources: 'list', modules: 'list'):
+    """
+    Returns the feature matrices of a pipeline, computing and saving
+    them only when the configuration, a source file or the feature code
+    changed
+
+    Parameters
+    ----------
+    build : callable
+        Returns the tuple of DataFrames of the pipeline
+    config : dict
+    sources : list of string
+    modules : list of python modules
+        See feature_key
+
+    Returns
+    -------
+    frames : tuple of Pandas DataFrames
+    """
+
+    key = feature_key(config=config, sources=sources, modules=modules)
+    frames = load_frames(key)
+
+    if frames is None:
+        frames = tuple(build())
+        save_frames(key, frames, description={'config' : config,
+                                              'sources' : sources})
+
+    return frames
+
+
+def clear():
+    """
+    Deletes every saved feature matrix
+    """
+
+    shutil.rmtree(STORE_DIR, ignore_errors=True)
+
+    return None
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa  # Columnar in-memory format
+import pyarrow.parquet as pq  # Parquet columnar files
+
+# Project level modules
+import modules.flights_schema as fs
+
+
+# Local cache of the raw flight csv files, one directory per csv file
+CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'data', 'cache'
+)
+
+# Name of the file describing the csv file a cache was built from
+MANIFEST = '_source.json'
+
+# Column holding the position of every row in the csv file
+ROW_COLUMN = '_row'
+
+# Partition of the rows without a flight date
+NULL_PARTITION = 'fl_date=__null__'
+
+
+def cache_path(csv_path: 'str'):
+    """
+    Returns the cache directory of a csv file
+
+    Parameters
+    ----------
+    csv_path : string
+        filepath
+
+    Returns
+    -------
+    path : string
+    """
+
+    csv_path = os.path.abspath(os.path.expanduser(csv_path))
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    digest = hashlib.sha1(csv_path.encode()).hexdigest()[:10]
+
+    return os.path.join(CACHE_DIR, f'{name}-{digest}')
+
+
+def _source_fingerprint(csv_path: 'str'):
+    """
+    Returns the path, size and modification time of a csv file
+    """
+
+    csv_path = os.path.abspath(os.path.expanduser(csv_path))
+    stat = os.stat(csv_path)
+
+    return {
+        'path' : csv_path,
+        'size' : stat.st_size,
+        'mtime_ns' : stat.st_mtime_ns
+    }
+
+
+def is_cached(csv_path: 'str'):
+    """
+    Returns True when the cache of a csv file exists and was built from
+    the current version of the file (same size and modification time)
+    """
+
+    manifest_path = os.path.join(cache_path(csv_path), MANIFEST)
+
+    if not os.path.exists(manifest_path):
+        return False
+
+    with open(manifest_path) as f_input:
+        manifest = json.load(f_input)
+
+    return manifest['source'] == _source_fingerprint(csv_path)
+
+
+def cache_schema(df):
+    """
+    Returns the parquet schema of every partition of a cache
+
+    The compact numeric types depend on the values of a chunk (see
+    flights_schema), so partitions are stored with one type per column
+    that holds any chunk: floats wide enough for the integer values of
+    the column. The compact types are applied again on read.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        A chunk of the csv file, with the row column, or of a query
+        (see flights_extract)
+
+    Returns
+    -------
+    schema : pyarrow.Schema
+    """
+
+    fields = []
+
+    for column, dtype in df.dtypes.items():
+        if column == ROW_COLUMN:
+            arrow_type = pa.int64()
+        elif isinstance(dtype, pd.CategoricalDtype):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif column in fs.NUMERIC_DTYPES:
+            # float32 holds every int8 and int16 value exactly
+            arrow_type = (pa.float32()
+                          if np.dtype(fs.NUMERIC_DTYPES[column]).itemsize <= 2
+                          or fs.NUMERIC_DTYPES[column] == 'float32'
+                          else pa.float64())
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            arrow_type = pa.timestamp('ns')
+        elif pd.api.types.is_bool_dtype(dtype):
+            arrow_type = pa.bool_()
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) \
+                and pd.api.types.is_integer_dtype(dtype):
+            # Nullable integers of COPY results
+            arrow_type = pa.from_numpy_dtype(dtype.numpy_dtype)
+        elif pd.api.types.is_numeric_dtype(dtype):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column, arrow_type))
+
+    return pa.schema(fields)
+
+
+def build_cache(csv_path: 'str', chunksize: 'int' = 250_000):
+    """
+    Converts a flights csv file to its cache of parquet files
+
+    The csv file is streamed in chunks and every chunk is written as one
+    parquet file per flight date, in the directory of that date:
+
+        <cache_path>/fl_date=2019-01-01/part-00000.parquet
+
+    Rows without a flight date go to the fl_date=__null__ directory.
+    Every row keeps its position in the csv file (ROW_COLUMN), so reads
+    can restore the order of the csv, and every partition has the same
+    schema (see cache_schema).
+
+    The cache is built in a temporary directory that is renamed into
+    place once complete, so concurrent builds and reads never see a
+    partial cache.
+
+    Parameters
+    ----------
+    csv_path : string
+        filepath
+    chunksize : int, default 250,000
+        Number of csv lines parsed at a time
+
+    Returns
+    -------
+    path : string
+        cache directory
+    """
+
+    path = cache_path(csv_path)
+    source = _source_fingerprint(csv_path)
+
+    # Start from an empty directory
+    tmp_path = f'{path}.tmp-{uuid.uuid4().hex}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = None
+    schema = None
+    rows = 0
+
+    for part, chunk in enumerate(fs.read_csv(csv_path,
+                                             parse_dates=['fl_date'],
+                                             chunksize=chunksize)):
+        columns = list(chunk.columns)
+        chunk[ROW_COLUMN] = np.arange(rows, rows + chunk.shape[0])
+        rows += chunk.shape[0]
+
+        if schema is None:
+            schema = cache_schema(chunk)
+
+        # Only store the categories used by the chunk
+        for column in chunk.select_dtypes('category').columns:
+            chunk[column] = chunk[column].cat.remove_unused_categories()
+
+        days = chunk['fl_date'].dt.date.astype(object).where(chunk['fl_date'].notna(), None)
+
+        for fl_date, day in chunk.groupby(days, dropna=False, sort=False):
+            partition = NULL_PARTITION if pd.isna(fl_date) else f'fl_date={fl_date}'
+            day_path = os.path.join(tmp_path, partition)
+            os.makedirs(day_path, exist_ok=True)
+            pq.write_table(
+                pa.Table.from_pandas(day, schema=schema, preserve_index=False),
+                os.path.join(day_path, f'part-{part:05d}.parquet')
+            )
+
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as f_output:
+        json.dump({'source' : source, 'columns' : columns, 'rows' : rows},
+                  f_output,
+                  indent=4)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another process finished a cache of the same file first, or a
+        # stale cache is in the way
+        if is_cached(csv_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return path
+        old_path = f'{path}.old-{uuid.uuid4().hex}'
+        os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    return path
+
+
+def cached_dates(csv_path: 'str'):
+    """
+    Returns the sorted flight dates (as 'yyyy-mm-dd' strings) of the
+    cache of a csv file
+    """
+
+    return sorted(
+        entry[len('fl_date='):]
+        for entry in os.listdir(cache_path(csv_path))
+        if entry.startswith('fl_date=') and entry != NULL_PARTITION
+    )
+
+
+def _read_partition(day_path: 'str', columns: 'list | None' = None):
+    """
+    Returns the rows of a partition directory, with the row column, in
+    the order of the csv file
+    """
+
+    parts = [os.path.join(day_path, part) for part in sorted(os.listdir(day_path))]
+
+    # Columns in the order of the csv file
+    if columns is not None:
+        columns = [column for column in pq.read_schema(parts[0]).names
+                   if column in columns or column == ROW_COLUMN]
+
+    frames = [
+        pq.read_table(part, columns=columns, memory_map=True).to_pandas()
+        for part in parts
+    ]
+
+    # Cast the categoricals of every part to the shared dictionaries,
+    # the numeric columns keep the cache schema
+    categoricals = [column for column in frames[0].columns
+                    if column in fs.CATEGORICAL_DOMAINS]
+    frames = [fs.apply_schema(frame, columns=categoricals) for frame in frames]
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _partitions(csv_path: 'str', date_windows: 'list | None' = None):
+    """
+    Returns the partition directories of the requested dates of the
+    cache of a csv file, built first when missing or out of date
+    """
+
+    if not is_cached(csv_path):
+        build_cache(csv_path)
+
+    path = cache_path(csv_path)
+
+    partitions = [
+        os.path.join(path, f'fl_date={fl_date}')
+        for fl_date in cached_dates(csv_path)
+        if date_windows is None or any(
+            start <= fl_date <= end for start, end in date_windows
+        )
+    ]
+
+    # Rows without a date are in no date window
+    if date_windows is None and os.path.exists(os.path.join(path, NULL_PARTITION)):
+        partitions.append(os.path.join(path, NULL_PARTITION))
+
+    return partitions
+
+
+def iter_partitions(csv_path: 'str',
+                    columns: 'list | None' = None,
+                    date_windows: 'list | None' = None):
+    """
+    Reads a flights csv file through its cache, one flight date at a time
+
+    The cache is (re)built first when it is missing or out of date.
+    Only the parquet files of the requested dates are opened, they are
+    memory mapped and only the requested columns are read.
+
+    Parameters
+    ----------
+    csv_path : string
+        filepath
+    columns : list or None, default None
+        Columns to read, None reads every column
+    date_windows : list of (start, end) 'yyyy-mm-dd' tuples or None
+        Inclusive date ranges to read, None reads every date and then
+        the rows without a date
+
+    Yields
+    ------
+    day : Pandas DataFrame
+        The flights of one date, in the order of the csv file, indexed
+        by their position in the csv file. Numeric columns have the
+        types of the cache schema.
+    """
+
+    for day_path in _partitions(csv_path, date_windows=date_windows):
+        day = _read_partition(day_path, columns=columns)
+        yield day.set_index(ROW_COLUMN).rename_axis(None)
+
+
+def read_flights(csv_path: 'str',
+                 columns: 'list | None' = None,
+                 date_windows: 'list | None' = None):
+    """
+    Returns the flights of a csv file read through its cache
+
+    Parameters
+    ----------
+    csv_path : string
+        filepath
+    columns : list or None, default None
+        Columns to read, None reads every column
+    date_windows : list of (start, end) 'yyyy-mm-dd' tuples or None
+        Inclusive date ranges to read, None reads every row
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        rows in the order of the csv file, indexed by their position in
+        it like a pandas.read_csv of the whole file, with the compact
+        flights column types
+    """
+
+    frames = [_read_partition(day_path, columns=columns)
+              for day_path in _partitions(csv_path, date_windows=date_windows)]
+
+    if not frames:
+        return fs.apply_schema(
+            pd.DataFrame(columns=columns if columns is not None else [])
+        )
+
+    # The partitions share the category dictionaries
+    df = pd.concat(frames, ignore_index=True)
+    df = df.sort_values(ROW_COLUMN, kind='stable')
+
+    return fs.apply_schema(df.set_index(ROW_COLUMN).rename_axis(None))
@@ -0,0 +1,371 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import pyarrow as pa  # Columnar in-memory format
+import pyarrow.parquet as pq  # Parquet columnar files
+from psycopg2 import sql  # SQL string composition
+
+# Project level modules
+import modules.database_connection as dc
+import modules.flight_cache as fc
+import modules.flights_schema as fs
+
+
+# Local extracts of database tables, one directory per table
+EXTRACT_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'data', 'extract'
+)
+
+# Name of the file describing a complete extract
+MANIFEST = '_extract.json'
+
+
+def date_partitions(start: 'str', end: 'str', days: 'int' = 7):
+    """
+    Splits an inclusive range of flight dates into consecutive ranges
+
+    Parameters
+    ----------
+    start, end : string
+        First and last date, 'yyyy-mm-dd'
+    days : int, default 7
+        Number of dates of every range, the last one may be shorter
+
+    Returns
+    -------
+    partitions : list of (start, end) 'yyyy-mm-dd' tuples
+    """
+
+    first = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    partitions = []
+
+    while first <= last:
+        stop = min(first + datetime.timedelta(days=days - 1), last)
+        partitions.append((first.isoformat(), stop.isoformat()))
+        first = stop + datetime.timedelta(days=1)
+
+    return partitions
+
+
+def extract_key(table: 'str',
+                columns: 'list | None' = None,
+                date_column: 'str' = 'fl_date'):
+    """
+    Returns the key of the extract of a table's columns, part of the
+    name of its parquet files so that only the files of the same table
+    and columns are resumed
+    """
+
+    description = json.dumps({'table' : table,
+                              'columns' : columns,
+                              'date_column' : date_column})
+
+    return hashlib.sha1(description.encode()).hexdigest()[:12]
+
+
+def partition_path(output_dir: 'str', start: 'str', end: 'str', key: 'str'):
+    """
+    Returns the parquet file of a range of flight dates, see extract_key
+    """
+
+    return os.path.join(output_dir, f'fl_date={start}_{end}-{key}.parquet')
+
+
+def partition_query(table: 'str',
+                    columns: 'list | None' = None,
+                    date_column: 'str' = 'fl_date'):
+    """
+    Returns the query of the rows of a table in a range of dates, to be
+    executed with the (start, end) variables
+
+    fl_date is stored as 'yyyy-mm-dd' text, so the range is compared as
+    strings.
+    """
+
+    return sql.SQL('SELECT {columns} FROM {table} WHERE {date} BETWEEN %s AND %s').format(
+        columns=(sql.SQL(', ').join(map(sql.Identifier, columns))
+                 if columns else sql.SQL('*')),
+        table=sql.Identifier(table),
+        date=sql.Identifier(date_column)
+    )
+
+
+def extract_partition(pool,
+                      query,
+                      start: 'str',
+                      end: 'str',
+                      path: 'str'):
+    """
+    Fetches the rows of a range of dates and writes them to a parquet
+    file
+
+    The file is written under a temporary name and renamed once
+    complete, so an existing file is always a complete partition. The
+    numeric columns of the flights tables are stored with the types of
+    flight_cache.cache_schema, which do not depend on the values of the
+    partition.
+
+    Parameters
+    ----------
+    pool : ConnectionPool or psycopg2 connection
+    query : psycopg2.sql.Composable
+        See partition_query
+    start, end : string
+        First and last date, 'yyyy-mm-dd'
+    path : string
+        parquet filepath
+
+    Returns
+    -------
+    rows : int
+    """
+
+    df = dc.execute_sql_statement(pool, query=query, variables=(start, end))
+
+    # Only store the categories used by the partition
+    for column in df.select_dtypes('category').columns:
+        df[column] = df[column].cat.remove_unused_categories()
+
+    tmp_path = f'{path}.tmp-{os.getpid()}-{start}'
+    pq.write_table(pa.Table.from_pandas(df,
+                                        schema=fc.cache_schema(df),
+                                        preserve_index=False),
+                   tmp_path)
+    os.replace(tmp_path, path)
+
+    return df.shape[0]
+
+
+def extract_table(pool,
+                  table: 'str' = 'flights',
+                  start: 'str' = '2018-01-01',
+                  end: 'str' = '2019-12-31',
+                  days: 'int' = 7,
+                  columns: 'list | None' = None,
+                  workers: 'int | None' = None,
+                  output_dir: 'str | None' = None,
+                  date_column: 'str' = 'fl_date',
+                  progress: 'callable | None' = None):
+    """
+    Extracts a table to parquet files, fetching ranges of dates
+    concurrently over the connections of a pool
+
+    Every range of dates is one query and one parquet file, written as
+    soon as it arrives. Ranges whose file already exists for the same
+    table and columns (see extract_key) are skipped, so an interrupted
+    extraction resumes where it stopped. The manifest is written last,
+    once every range is extracted.
+
+    Parameters
+    ----------
+    pool : ConnectionPool
+        See database_connection.postgresql_pool
+    table : string, default 'flights'
+    start, end : string, default '2018-01-01', '2019-12-31'
+        First and last date to extract, 'yyyy-mm-dd'
+    days : int, default 7
+        Number of dates of every range (see date_partitions)
+    columns : list or None, default None
+        Columns to extract, None extracts every column
+    workers : int or None, default None
+        Number of concurrent queries, the pool's maximum size when None
+    output_dir : string or None, default None
+        Directory of the parquet files, EXTRACT_DIR/<table> when None
+    date_column : string, default 'fl_date'
+    progress : callable or None, default None
+        Called with the number of ranges extracted so far, the number to
+        extract and the (start, end, rows) of the last one
+
+    Returns
+    -------
+    output_dir : string
+    """
+
+    if output_dir is None:
+        output_dir = os.path.join(EXTRACT_DIR, table)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The extract is incomplete until every range is written
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    query = partition_query(table, columns=columns, date_column=date_column)
+    key = extract_key(table, columns=columns, date_column=date_column)
+    partitions = date_partitions(start, end, days=days)
+    todo = [
+        (first, last) for first, last in partitions
+        if not os.path.exists(partition_path(output_dir, first, last, key))
+    ]
+
+    if workers is None:
+        workers = pool.maxconn if isinstance(pool, dc.ConnectionPool) else 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(extract_partition,
+                            pool,
+                            query,
+                            first,
+                            last,
+                            partition_path(output_dir, first, last, key)) : (first, last)
+            for first, last in todo
+        }
+
+        for n, future in enumerate(as_completed(futures), start=1):
+            rows = future.result()
+            if progress is not None:
+                progress(n, len(todo), (*futures[future], rows))
+
+    with open(manifest_path, 'w') as f_output:
+        json.dump({'table' : table,
+                   'columns' : columns,
+                   'date_column' : date_column,
+                   'key' : key,
+                   'partitions' : partitions,
+                   'rows' : sum(pq.ParquetFile(partition_path(output_dir, *p, key))
+                                .metadata.num_rows for p in partitions)},
+                  f_output,
+                  indent=4)
+
+    return output_dir
+
+
+def read_extract(output_dir: 'str', columns: 'list | None' = None):
+    """
+    Returns the rows of a complete extract, ordered by range of dates
+
+    Parameters
+    ----------
+    output_dir : string
+        See extract_table
+    columns : list or None, default None
+        Columns to read, None reads every column
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        With the compact flights column types, empty when the extract
+        has no partitions
+    """
+
+    manifest_path = os.path.join(output_dir, MANIFEST)
+
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f'{output_dir} is not a complete extract')
+
+    with open(manifest_path) as f_input:
+        manifest = json.load(f_input)
+
+    frames = [
+        pq.read_table(partition_path(output_dir, first, last, manifest['key']),
+                      columns=columns,
+                      memory_map=True).to_pandas()
+        for first, last in manifest['partitions']
+    ]
+
+    if not frames:
+        if columns is None:
+            columns = manifest['columns'] or []
+        return fs.apply_schema(pd.DataFrame(columns=columns))
+
+    # Cast the categoricals of every partition to the shared
+    # dictionaries, the numeric columns share the partition schema and
+    # are narrowed once
+    categoricals = [column for column in frames[0].columns
+                    if column in fs.CATEGORICAL_DOMAINS]
+    for frame in frames:
+        fs.apply_schema(frame, columns=categoricals)
+
+    return fs.apply_schema(pd.concat(frames, ignore_index=True))
+
+
+def load_csv(connection, csv_path: 'str', table: 'str' = 'flights'):
+    """
+    Loads a csv file into an existing table with COPY, e.g. to fill a
+    local database with the sample csv files for benchmarking
+
+    The csv header must name columns of the table.
+
+    Returns
+    -------
+    rows : int
+    """
+
+    with open(csv_path) as f_input:
+        header = f_input.readline().strip().split(',')
+        f_input.seek(0)
+
+        with dc.borrow(connection) as connection, \
+             connection.cursor() as cursor:
+            cursor.copy_expert(
+                sql.SQL('COPY {} ({}) FROM STDIN WITH CSV HEADER').format(
+                    sql.Identifier(table),
+                    sql.SQL(', ').join(map(sql.Identifier, header))
+                ),
+                f_input
+            )
+            rows = cursor.rowcount
+            connection.commit()
+
+    return rows
+
+
+def benchmark_extract(pool,
+                      workers_list: 'list' = [1, 2, 4, 8],
+                      repeats: 'int' = 1,
+                      **kwargs):
+    """
+    Times extract_table for several numbers of workers
+
+    Every run extracts into a new temporary directory, so nothing is
+    resumed.
+
+    Parameters
+    ----------
+    pool : ConnectionPool
+        With at least max(workers_list) connections
+    workers_list : list of int, default [1, 2, 4, 8]
+    repeats : int, default 1
+        Runs per number of workers, the fastest is kept
+    **kwargs
+        passed to extract_table, e.g. table, start, end, days
+
+    Returns
+    -------
+    timings : Pandas DataFrame
+        workers, seconds, rows and speedup over the first number of
+        workers
+    """
+
+    results = []
+
+    for workers in workers_list:
+        timings = []
+        for repeat in range(repeats):
+            output_dir = os.path.join(EXTRACT_DIR,
+                                      f'_benchmark-{os.getpid()}-{workers}-{repeat}')
+            shutil.rmtree(output_dir, ignore_errors=True)
+            try:
+                begin = time.perf_counter()
+                extract_table(pool, workers=workers, output_dir=output_dir, **kwargs)
+                timings.append(time.perf_counter() - begin)
+                with open(os.path.join(output_dir, MANIFEST)) as f_input:
+                    rows = json.load(f_input)['rows']
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+        results.append({'workers' : workers, 'seconds' : min(timings), 'rows' : rows})
+
+    timings = pd.DataFrame(results)
+    timings['speedup'] = timings['seconds'].iloc[0] / timings['seconds']
+
+    return timings
@@ -0,0 +1,384 @@
+import argparse
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl  # Lock the domain files across processes (POSIX)
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+
+# Compact column types of the flights and flights_test tables
+#
+# Text columns become categoricals. Columns holding the same kind of
+# value share one category dictionary (a domain), e.g. origin and dest
+# are both airports, so their codes can be compared and joined.
+CATEGORICAL_DOMAINS = {
+    'mkt_unique_carrier' : 'carrier',
+    'mkt_carrier' : 'carrier',
+    'op_unique_carrier' : 'carrier',
+    'branded_code_share' : 'branded_code_share',
+    'tail_num' : 'tail_num',
+    'origin' : 'airport',
+    'dest' : 'airport',
+    'origin_city_name' : 'city_name',
+    'dest_city_name' : 'city_name',
+    'cancellation_code' : 'cancellation_code',
+    'dup' : 'dup'
+}
+
+# Numeric columns are narrowed to the smallest type that holds their
+# values. Integer types are only used when a column has no NAN values
+# and its values fit, otherwise it is stored as float32.
+NUMERIC_DTYPES = {
+    'mkt_carrier_fl_num' : 'int16',
+    'op_carrier_fl_num' : 'int16',
+    'origin_airport_id' : 'int32',
+    'dest_airport_id' : 'int32',
+    'crs_dep_time' : 'int16',
+    'dep_time' : 'float32',
+    'dep_delay' : 'float32',
+    'taxi_out' : 'float32',
+    'wheels_off' : 'float32',
+    'wheels_on' : 'float32',
+    'taxi_in' : 'float32',
+    'crs_arr_time' : 'int16',
+    'arr_time' : 'float32',
+    'arr_delay' : 'float32',
+    'cancelled' : 'int8',
+    'diverted' : 'int8',
+    'crs_elapsed_time' : 'float32',
+    'actual_elapsed_time' : 'float32',
+    'air_time' : 'float32',
+    'flights' : 'float32',
+    'distance' : 'float32',
+    'carrier_delay' : 'float32',
+    'weather_delay' : 'float32',
+    'nas_delay' : 'float32',
+    'security_delay' : 'float32',
+    'late_aircraft_delay' : 'float32',
+    'first_dep_time' : 'float32',
+    'total_add_gtime' : 'float32',
+    'longest_add_gtime' : 'float32',
+    'no_name' : 'float32'
+}
+
+# The category dictionaries are seeded, in sorted order, with the
+# categories profiled in the descriptive statistics of both tables
+DESCRIPTIVE_STATS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'data', 'descriptive_stats'
+)
+
+# Category dictionaries, one json list per domain. They are fixed at
+# runtime, values missing from them are cast to NAN. They only grow
+# through build_domains, which appends new values in sorted order, so
+# the code of a value is the same in every process and never changes.
+DOMAINS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'data', 'category_domains'
+)
+
+# Category dictionaries read by this process, by domain
+_dtypes = {}
+_dtypes_lock = threading.Lock()
+
+
+def _seed_categories(domain: 'str'):
+    """
+    Returns the sorted categories of a domain found in the descriptive
+    statistics csv files
+    """
+
+    seeds = set()
+
+    for column, column_domain in CATEGORICAL_DOMAINS.items():
+        if column_domain != domain:
+            continue
+        for table in ['flights', 'flights_test']:
+            path = os.path.join(DESCRIPTIVE_STATS_DIR,
+                                f'{table}_{column}_cat_stats.csv')
+            if os.path.exists(path):
+                stats = pd.read_csv(path, usecols=[0], dtype=str,
+                                    keep_default_na=False)
+                seeds.update(stats.iloc[:, 0])
+
+    seeds.discard('')
+
+    return sorted(seeds)
+
+
+def _read_domain(domain: 'str'):
+    """
+    Returns the saved categories of a domain, its seed categories when
+    it was never saved
+    """
+
+    path = os.path.join(DOMAINS_DIR, f'{domain}.json')
+
+    if not os.path.exists(path):
+        return _seed_categories(domain)
+
+    with open(path) as f_input:
+        return json.load(f_input)
+
+
+def _write_domain(domain: 'str', categories: 'list'):
+    """
+    Saves the categories of a domain, replacing the file atomically
+    """
+
+    path = os.path.join(DOMAINS_DIR, f'{domain}.json')
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+
+    with open(tmp_path, 'w') as f_output:
+        json.dump(categories, f_output, indent=0)
+
+    os.replace(tmp_path, path)
+
+    return None
+
+
+@contextlib.contextmanager
+def _domain_lock(domain: 'str'):
+    """
+    Holds an exclusive lock on the file of a domain, so processes
+    appending categories do not overwrite each other
+    """
+
+    os.makedirs(DOMAINS_DIR, exist_ok=True)
+
+    with open(os.path.join(DOMAINS_DIR, f'{domain}.lock'), 'w') as f_lock:
+        if fcntl is not None:
+            fcntl.flock(f_lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f_lock, fcntl.LOCK_UN)
+
+
+def categorical_dtype(domain: 'str'):
+    """
+    Returns the shared CategoricalDtype of a domain
+
+    The dictionary is read once per process and never changes at
+    runtime, see build_domains to add categories to it.
+
+    Parameters
+    ----------
+    domain : string
+        A domain of CATEGORICAL_DOMAINS, e.g. 'airport'
+
+    Returns
+    -------
+    dtype : Pandas CategoricalDtype
+    """
+
+    with _dtypes_lock:
+        if domain not in _dtypes:
+            _dtypes[domain] = pd.CategoricalDtype(
+                pd.Index(_read_domain(domain), dtype=object)
+            )
+
+        return _dtypes[domain]
+
+
+def build_domains(frames):
+    """
+    Appends the values of the categorical columns of flights DataFrames
+    missing from their domain's dictionary and saves the dictionaries
+
+    This is the only step that changes the saved dictionaries, run it on
+    new data and commit the data/category_domains files. The values are
+    appended in sorted order, so the codes of the existing categories
+    do not change.
+
+    Parameters
+    ----------
+    frames : iterable of Pandas DataFrames
+        e.g. the chunks of a raw flights csv file read as strings
+
+    Returns
+    -------
+    appended : dict
+        Domain : list of the categories appended to it
+    """
+
+    values = {}
+
+    for frame in frames:
+        for column, domain in CATEGORICAL_DOMAINS.items():
+            if column in frame.columns:
+                values.setdefault(domain, set()).update(
+                    frame[column].dropna().astype(str).unique()
+                )
+
+    appended = {}
+
+    for domain, domain_values in values.items():
+        with _domain_lock(domain):
+            categories = _read_domain(domain)
+            new_values = sorted(domain_values - set(categories) - {''})
+            if new_values:
+                _write_domain(domain, categories + new_values)
+                appended[domain] = new_values
+
+        # Read the saved dictionary on the next cast
+        with _dtypes_lock:
+            _dtypes.pop(domain, None)
+
+    return appended
+
+
+def _narrow(values, dtype: 'str'):
+    """
+    Returns values cast to dtype when no information is lost, falling
+    back to float32 and then to the original values
+    """
+
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    elif isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+        # Nullable integers, with NaN for their missing values
+        values = values.astype('float64')
+
+    array = values.to_numpy()
+
+    for candidate in [dtype, 'float32']:
+        candidate = np.dtype(candidate)
+        if candidate.kind in 'iu':
+            if values.isna().any():
+                continue
+            info = np.iinfo(candidate)
+            if len(array) and (array.min() < info.min or array.max() > info.max):
+                continue
+            if not np.array_equal(array, np.round(array)):
+                continue
+            return values.astype(candidate)
+        narrowed = array.astype(candidate)
+        if np.array_equal(narrowed.astype(array.dtype), array, equal_nan=True):
+            return values.astype(candidate)
+
+    return values
+
+
+def apply_schema(df, columns: 'list | None' = None):
+    """
+    Casts the columns of a flights DataFrame to their compact types
+
+    Columns that are not part of the flights schema are left unchanged.
+    Values missing from the category dictionaries become NAN, see
+    build_domains.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+    columns : list or None, default None
+        Columns to cast, e.g. the ones read from a flights table, every
+        column when None
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The same DataFrame, modified in place
+    """
+
+    for column in df.columns if columns is None else columns:
+        if column in CATEGORICAL_DOMAINS:
+            dtype = categorical_dtype(CATEGORICAL_DOMAINS[column])
+            values = df[column]
+            if values.dtype == dtype:
+                # Already using the shared dictionary
+                if values.dtype.categories is dtype.categories:
+                    continue
+                # Equal categories, e.g. read from parquet: only share
+                # the dictionary, which astype would keep apart
+                df[column] = pd.Categorical.from_codes(values.cat.codes, dtype=dtype)
+            else:
+                df[column] = values.astype(dtype)
+
+        elif column in NUMERIC_DTYPES and df[column].dtype != NUMERIC_DTYPES[column]:
+            df[column] = _narrow(df[column], NUMERIC_DTYPES[column])
+
+    return df
+
+
+def read_csv(csv_path: 'str', **kwargs):
+    """
+    Reads a flights csv file with the compact column types
+
+    Parameters
+    ----------
+    csv_path : string
+        filepath
+    **kwargs
+        passed to pandas.read_csv
+
+    Returns
+    -------
+    df : Pandas DataFrame, or an iterator of DataFrames when chunksize
+        is passed
+    """
+
+    # Parse text columns straight to categoricals, they are then mapped
+    # onto the shared category dictionaries
+    dtype = {column : 'category' for column in CATEGORICAL_DOMAINS}
+    dtype.update(kwargs.pop('dtype', {}))
+
+    reader = pd.read_csv(csv_path, dtype=dtype, **kwargs)
+
+    if isinstance(reader, pd.DataFrame):
+        return apply_schema(reader)
+
+    return (apply_schema(chunk) for chunk in reader)
+
+
+def concat(frames: 'list', **kwargs):
+    """
+    Concatenates flights DataFrames keeping their categorical columns
+
+    pandas.concat turns categoricals into objects unless every frame has
+    the same categories, so copies of the frames are first cast to the
+    shared dictionaries. The frames themselves are not modified.
+
+    Parameters
+    ----------
+    frames : list of Pandas DataFrames
+    **kwargs
+        passed to pandas.concat
+
+    Returns
+    -------
+    df : Pandas DataFrame
+    """
+
+    return pd.concat([apply_schema(frame.copy(deep=False)) for frame in frames],
+                     **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Append the categories of flights csv files to the '
+                    'category dictionaries'
+    )
+    parser.add_argument('csv_paths', nargs='+')
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    for csv_path in args.csv_paths:
+        appended = build_domains(pd.read_csv(
+            csv_path,
+            usecols=lambda column: column in CATEGORICAL_DOMAINS,
+            dtype=str,
+            keep_default_na=False,
+            na_values=[''],
+            chunksize=args.chunksize
+        ))
+        for domain, categories in appended.items():
+            print(f'{csv_path}: {len(categories):,} {domain} categories appended')
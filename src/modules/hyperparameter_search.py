@@ -0,0 +1,368 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+from sklearn.preprocessing import MinMaxScaler
+
+# Project level modules
+import modules.model_registry as mr
+
+
+# Training data of a worker process, attached once by _init_worker:
+# the shared memory blocks and the numpy arrays viewing them
+_worker = {}
+
+
+def _share(array):
+    """
+    Copies a numpy array into a new shared memory block
+
+    Returns
+    -------
+    shm : multiprocessing.shared_memory.SharedMemory
+    spec : tuple
+        (name, shape, dtype) needed to attach to the array
+    """
+
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec: 'tuple'):
+    """
+    Returns the shared memory block of a spec and the array viewing it
+    """
+
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(X_spec: 'tuple', y_spec: 'tuple', time_spec: 'tuple'):
+    """
+    Attaches a worker process to the shared training data
+    """
+
+    for key, spec in [('X', X_spec), ('y', y_spec), ('time', time_spec)]:
+        _worker[f'{key}_shm'], _worker[key] = _attach(spec)
+
+    return None
+
+
+def time_series_folds(time_values, n_splits: 'int' = 3):
+    """
+    Expanding window cross validation folds over time
+
+    The sorted distinct time values (e.g. the day of the flights) are
+    cut into n_splits + 1 consecutive blocks. Fold k trains on blocks
+    0 to k and validates on block k + 1, so a model is never validated
+    on flights older than the ones it was trained on.
+
+    Parameters
+    ----------
+    time_values : array-like
+        Time of every row, e.g. the fl_date of the flights
+    n_splits : int, default 3
+
+    Returns
+    -------
+    folds : list of (train_end, valid_end) tuples
+        Training rows have time <= train_end, validation rows have
+        train_end < time <= valid_end
+    """
+
+    times = np.unique(np.asarray(time_values))
+
+    if times.shape[0] < n_splits + 1:
+        raise ValueError(f'{n_splits} splits need at least {n_splits + 1} '
+                         + f'distinct time values, got {times.shape[0]}')
+
+    blocks = np.array_split(times, n_splits + 1)
+
+    return [
+        (blocks[k][-1].item(), blocks[k + 1][-1].item())
+        for k in range(n_splits)
+    ]
+
+
+def parameter_sets(param_space: 'dict',
+                   n_iter: 'int | None' = None,
+                   random_state: 'int' = 0):
+    """
+    Parameter sets of a grid or a random search
+
+    Parameters
+    ----------
+    param_space : dict
+        Parameter : list of values, or a scipy.stats distribution when
+        n_iter is set. Scalars are fixed parameters.
+    n_iter : int or None, default None
+        None searches the whole grid, otherwise n_iter parameter sets are
+        sampled
+    random_state : int, default 0
+
+    Returns
+    -------
+    params : list of dict
+    """
+
+    param_space = {
+        k : v if isinstance(v, list) or hasattr(v, 'rvs') else [v]
+        for k, v in param_space.items()
+    }
+
+    if n_iter is None:
+        return list(ParameterGrid(param_space))
+
+    samples = ParameterSampler(param_space,
+                               n_iter=n_iter,
+                               random_state=random_state)
+
+    # Numpy scalars drawn from distributions as python values
+    return [
+        {k : v.item() if isinstance(v, np.generic) else v
+         for k, v in params.items()}
+        for params in samples
+    ]
+
+
+def _data_key(X, y, time_values, folds: 'list'):
+    """
+    Returns the fingerprint of the training data and folds of a search,
+    so that results logged for other data are not reused
+    """
+
+    digest = hashlib.sha1(
+        mr.data_fingerprint(X, pd.Series(np.asarray(y, dtype='float64'))).encode()
+    )
+    digest.update(np.ascontiguousarray(time_values).tobytes())
+    digest.update(json.dumps(folds).encode())
+
+    return digest.hexdigest()
+
+
+def _params_key(estimator, params: 'dict', data_key: 'str'):
+    """
+    Returns the key of a fit in the results log
+    """
+
+    description = json.dumps(
+        {'estimator' : f'{estimator.__module__}.{estimator.__name__}',
+         'params' : params,
+         'data' : data_key},
+        sort_keys=True,
+        default=str
+    )
+
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def evaluate(estimator, params: 'dict', folds: 'list'):
+    """
+    Cross validates a parameter set on the shared training data of a
+    worker process
+
+    Every fold scales the features with a MinMaxScaler fit on its
+    training rows, like the modeling notebooks.
+
+    Returns
+    -------
+    result : dict
+        fold_rmse, the validation root mean squared error of every
+        fold, and seconds, the time of the fits
+    """
+
+    start = time.perf_counter()
+    X, y, time_values = _worker['X'], _worker['y'], _worker['time']
+    scores = []
+
+    for train_end, valid_end in folds:
+        train = time_values <= train_end
+        valid = (time_values > train_end) & (time_values <= valid_end)
+
+        scaler = MinMaxScaler()
+        model = estimator(**params)
+        model.fit(scaler.fit_transform(X[train]), y[train])
+        y_pred = model.predict(scaler.transform(X[valid]))
+
+        scores.append(mean_squared_error(y[valid], y_pred) ** 0.5)
+
+    return {'fold_rmse' : scores, 'seconds' : time.perf_counter() - start}
+
+
+def read_results(log_path: 'str', data_key: 'str | None' = None):
+    """
+    Returns the results log of a search
+
+    Parameters
+    ----------
+    log_path : string
+    data_key : string or None, default None
+        Only return the results of the searches on this training data
+        and folds, None returns every result
+
+    Returns
+    -------
+    results : Pandas DataFrame
+        One row per parameter set, best (lowest mean_rmse) first
+    """
+
+    columns = ['key', 'data', 'params', 'fold_rmse', 'mean_rmse',
+               'std_rmse', 'seconds']
+
+    rows = []
+    if os.path.exists(log_path):
+        with open(log_path) as f_input:
+            rows = [json.loads(line) for line in f_input if line.strip()]
+
+    if data_key is not None:
+        rows = [row for row in rows if row.get('data') == data_key]
+
+    if not rows:
+        return pd.DataFrame(columns=columns)
+
+    return (pd.DataFrame(rows)
+            .drop_duplicates('key', keep='last')
+            .sort_values('mean_rmse', ignore_index=True))
+
+
+def search(X,
+           y,
+           time_values,
+           param_space: 'dict',
+           estimator=xgb.XGBRegressor,
+           n_iter: 'int | None' = None,
+           n_splits: 'int' = 3,
+           log_path: 'str' = '../output/hyperparameter_search.jsonl',
+           workers: 'int | None' = None,
+           random_state: 'int' = 0,
+           progress: 'callable | None' = None):
+    """
+    Parallel hyperparameter search with time based cross validation
+
+    X and y are copied once into shared memory that every worker process
+    attaches to, so tasks only carry their parameters. Every finished
+    parameter set is appended to a json lines log and parameter sets
+    already in the log for the same data and folds are skipped, so an
+    interrupted search resumes where it stopped.
+
+    Parameters
+    ----------
+    X : Pandas DataFrame
+        Features, e.g. the X returned by xgboost_functions.load
+    y : Pandas Series or array-like
+        Target, e.g. y['arr_delay']
+    time_values : Pandas Series or array-like of datetimes
+        Date of every row of X the folds are cut on, e.g. the fl_date of
+        the flights returned by xgboost_functions.load_and_process. The
+        fl_date feature of X is only the day of the month.
+    param_space : dict
+        See parameter_sets
+    estimator : class, default xgboost.XGBRegressor
+        scikit-learn compatible regressor, e.g.
+        sklearn.ensemble.RandomForestRegressor
+    n_iter : int or None, default None
+        None searches the whole grid, otherwise n_iter random sets
+    n_splits : int, default 3
+        Number of time_series_folds
+    log_path : string, default '../output/hyperparameter_search.jsonl'
+    workers : int or None, default None
+        Number of worker processes, None uses every CPU
+    random_state : int, default 0
+    progress : callable or None, default None
+        Called with the number of parameter sets evaluated so far, the
+        number to evaluate and the log entry of the last one
+
+    Returns
+    -------
+    results : Pandas DataFrame
+        Every parameter set of the log evaluated on this data and these
+        folds, best first (see read_results)
+    """
+
+    # Times as int64 nanoseconds, compared by the workers as float64
+    time_values = np.asarray(time_values)
+    if np.issubdtype(time_values.dtype, np.datetime64):
+        time_values = time_values.astype('datetime64[ns]').astype('int64')
+    time_values = time_values.astype('float64')
+
+    if time_values.shape[0] != X.shape[0]:
+        raise ValueError(f'{time_values.shape[0]} time values for '
+                         + f'{X.shape[0]} rows')
+
+    folds = time_series_folds(time_values, n_splits=n_splits)
+    params_list = parameter_sets(param_space,
+                                 n_iter=n_iter,
+                                 random_state=random_state)
+
+    # Fits are spread across processes, not threads within a fit
+    if 'n_jobs' in estimator().get_params():
+        params_list = [{'n_jobs' : 1, **params} for params in params_list]
+
+    data_key = _data_key(X, y, time_values, folds)
+    done = set(read_results(log_path, data_key=data_key)['key'])
+    todo = {
+        _params_key(estimator, params, data_key) : params
+        for params in params_list
+        if _params_key(estimator, params, data_key) not in done
+    }
+
+    if not todo:
+        return read_results(log_path, data_key=data_key)
+
+    log_dir = os.path.dirname(log_path)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    blocks = [
+        _share(X.to_numpy(dtype='float64')),
+        _share(np.asarray(y, dtype='float64')),
+        _share(time_values)
+    ]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 initializer=_init_worker,
+                                 initargs=tuple(spec for _, spec in blocks)) as executor:
+            futures = {
+                executor.submit(evaluate, estimator, params, folds) : key
+                for key, params in todo.items()
+            }
+
+            with open(log_path, 'a') as f_output:
+                for n, future in enumerate(as_completed(futures), start=1):
+                    key = futures[future]
+                    result = future.result()
+                    scores = result['fold_rmse']
+                    entry = {
+                        'key' : key,
+                        'data' : data_key,
+                        'params' : todo[key],
+                        'fold_rmse' : scores,
+                        'mean_rmse' : float(np.mean(scores)),
+                        'std_rmse' : float(np.std(scores)),
+                        'seconds' : result['seconds']
+                    }
+                    f_output.write(json.dumps(entry, default=str) + '\n')
+                    f_output.flush()
+                    if progress is not None:
+                        progress(n, len(todo), entry)
+    finally:
+        for shm, _ in blocks:
+            shm.close()
+            shm.unlink()
+
+    return read_results(log_path, data_key=data_key)
@@ -0,0 +1,348 @@
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Project level modules
+import modules.tree_predictor as tp
+
+
+logger = logging.getLogger(__name__)
+
+# Registered models, as <name>/v<version>/ directories
+REGISTRY_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'models', 'registry'
+)
+
+# Scaler parameters saved for each kind of scikit-learn scaler, and
+# transform(X) = (X - offset) * factor computed from them
+SCALER_KINDS = {
+    'MinMaxScaler' : ['min_', 'scale_'],
+    'StandardScaler' : ['mean_', 'scale_']
+}
+
+
+def data_fingerprint(X, y=None):
+    """
+    Returns a hash of the training data of a model
+
+    Parameters
+    ----------
+    X : Pandas DataFrame
+    y : Pandas DataFrame, Series or None, default None
+
+    Returns
+    -------
+    fingerprint : string
+    """
+
+    digest = hashlib.sha1(json.dumps([str(c) for c in X.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    if y is not None:
+        digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+
+    return f'{X.shape[0]}x{X.shape[1]}-{digest.hexdigest()[:16]}'
+
+
+def versions(name: 'str' = 'flight_delay_xgboost'):
+    """
+    Returns the registered versions of a model, in increasing order
+    """
+
+    path = os.path.join(REGISTRY_DIR, name)
+
+    if not os.path.exists(path):
+        return []
+
+    return sorted(
+        int(entry[1:]) for entry in os.listdir(path)
+        if entry.startswith('v') and entry[1:].isdigit()
+    )
+
+
+def register(model,
+             scaler,
+             features: 'list',
+             name: 'str' = 'flight_delay_xgboost',
+             metrics: 'dict | None' = None,
+             fingerprint: 'str | None' = None):
+    """
+    Saves a model and its scaler as the next version of a registered
+    model
+
+    The model is saved in the native XGBoost format and, when
+    tree_predictor supports it, as flattened trees. The scaler is saved
+    as numpy arrays, next to a metadata.json file. The version directory
+    is written under a temporary name and renamed once complete. When
+    another registration takes the version first, the next one is used.
+
+    Parameters
+    ----------
+    model : XGBoost regressor or Booster fit to training data
+    scaler : fit scikit-learn MinMaxScaler or StandardScaler
+    features : list of string
+        Feature columns, in the order the model was trained on
+    name : string, default 'flight_delay_xgboost'
+    metrics : dict or None, default None
+        Evaluation metrics, e.g. {'rmse' : 29.1}
+    fingerprint : string or None, default None
+        Training data fingerprint, see data_fingerprint
+
+    Returns
+    -------
+    version : int
+    """
+
+    scaler_kind = type(scaler).__name__
+    if scaler_kind not in SCALER_KINDS:
+        raise ValueError(f'scaler must be any of {list(SCALER_KINDS)}')
+
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+
+    tmp_path = os.path.join(REGISTRY_DIR, name, f'.tmp-{uuid.uuid4().hex}')
+    os.makedirs(tmp_path)
+
+    booster.save_model(os.path.join(tmp_path, 'model.ubj'))
+
+    try:
+        tp.export(booster, os.path.join(tmp_path, 'trees.npz'))
+        trees = True
+    except ValueError as error:
+        logger.warning('%s is registered without flattened trees, '
+                       + 'engine="numpy" is unavailable: %s',
+                       name, error)
+        trees = False
+
+    for attribute in SCALER_KINDS[scaler_kind]:
+        np.save(os.path.join(tmp_path, f'scaler_{attribute.rstrip("_")}.npy'),
+                np.asarray(getattr(scaler, attribute), dtype='float64'))
+
+    import xgboost as xgb
+
+    metadata = {
+        'name' : name,
+        'created' : datetime.datetime.now().isoformat(timespec='seconds'),
+        'features' : list(features),
+        'data_fingerprint' : fingerprint,
+        'metrics' : metrics if metrics is not None else {},
+        'model_class' : type(model).__name__,
+        'xgboost_version' : xgb.__version__,
+        'scaler' : scaler_kind,
+        'trees' : trees
+    }
+
+    version = (versions(name) or [0])[-1] + 1
+
+    while True:
+        metadata['version'] = version
+        with open(os.path.join(tmp_path, 'metadata.json'), 'w') as f_output:
+            json.dump(metadata, f_output, indent=4, default=str)
+
+        path = os.path.join(REGISTRY_DIR, name, f'v{version}')
+        try:
+            os.rename(tmp_path, path)
+            return version
+        except OSError:
+            if not os.path.exists(path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+            # Registered concurrently, take the next free version
+            version = max(version, (versions(name) or [0])[-1]) + 1
+
+
+class ModelArtifact:
+    """
+    A registered model version
+
+    The metadata is read when the artifact is opened. The scaler arrays
+    are memory mapped and the XGBoost booster is only loaded (and
+    xgboost imported) the first time a prediction is made.
+
+    Parameters
+    ----------
+    path : string
+        Version directory
+    """
+
+    def __init__(self, path: 'str'):
+        self.path = path
+
+        with open(os.path.join(path, 'metadata.json')) as f_input:
+            self.metadata = json.load(f_input)
+
+        self.features = self.metadata['features']
+        self._booster = None
+
+    @functools.cached_property
+    def scaler_arrays(self):
+        """
+        Returns the offset and factor of the scaler: (X - offset) * factor
+        """
+
+        def array(attribute):
+            return np.load(
+                os.path.join(self.path, f'scaler_{attribute.rstrip("_")}.npy'),
+                mmap_mode='r'
+            )
+
+        if self.metadata['scaler'] == 'MinMaxScaler':
+            # X * scale_ + min_
+            scale = array('scale_')
+            return -np.asarray(array('min_')) / scale, scale
+
+        # (X - mean_) / scale_
+        return array('mean_'), 1 / np.asarray(array('scale_'))
+
+    @property
+    def booster(self):
+        """
+        Returns the XGBoost booster, loading it on first use
+        """
+
+        if self._booster is None:
+            import xgboost as xgb
+
+            booster = xgb.Booster()
+            booster.load_model(os.path.join(self.path, 'model.ubj'))
+            self._booster = booster
+
+        return self._booster
+
+    def transform(self, X):
+        """
+        Returns the scaled features of X as a numpy array
+        """
+
+        if isinstance(X, pd.DataFrame):
+            X = X[self.features]
+
+        offset, factor = self.scaler_arrays
+
+        return (np.asarray(X, dtype='float64') - offset) * factor
+
+    @functools.cached_property
+    def trees(self):
+        """
+        Returns the flattened trees of the model, evaluated with numpy
+        only
+        """
+
+        return tp.TreeEnsemble.load(os.path.join(self.path, 'trees.npz'))
+
+    def predict(self, X, engine: 'str' = 'xgboost'):
+        """
+        Returns the predictions of the model for unscaled features X
+
+        Parameters
+        ----------
+        X : Pandas DataFrame or 2-D array-like
+        engine : string 'xgboost', 'numpy', default 'xgboost'
+            'numpy' evaluates the flattened trees without importing
+            xgboost, matching its predictions to float32 precision. Only
+            available when the model was registered with them.
+        """
+
+        if engine == 'numpy':
+            if not self.metadata.get('trees', True):
+                raise ValueError(f'{self.path} has no flattened trees, '
+                                 + 'use engine="xgboost"')
+            return self.trees.predict(self.transform(X))
+
+        return self.booster.inplace_predict(self.transform(X))
+
+
+@functools.lru_cache(maxsize=None)
+def _open(name: 'str', version: 'int'):
+    return ModelArtifact(os.path.join(REGISTRY_DIR, name, f'v{version}'))
+
+
+def load(name: 'str' = 'flight_delay_xgboost', version: 'int | None' = None):
+    """
+    Returns a registered model version, opened once per process
+
+    Parameters
+    ----------
+    name : string, default 'flight_delay_xgboost'
+    version : int or None, default None
+        None opens the latest version
+
+    Returns
+    -------
+    artifact : ModelArtifact
+    """
+
+    if version is None:
+        if not versions(name):
+            raise FileNotFoundError(f'no registered versions of {name}')
+        version = versions(name)[-1]
+
+    return _open(name, version)
+
+
+def benchmark_cold_start(name: 'str' = 'flight_delay_xgboost',
+                         version: 'int | None' = None,
+                         model_path: 'str | None' = 'models/flight_delay_xgboost.pickle.dat',
+                         scaler_path: 'str | None' = 'models/xgboost_scaler.pickle.dat',
+                         repeats: 'int' = 5):
+    """
+    Times the load and first prediction of a model in fresh processes
+
+    Parameters
+    ----------
+    name : string, default 'flight_delay_xgboost'
+    version : int or None, default None
+        None benchmarks the latest version
+    model_path, scaler_path : string or None
+        Pickled model and scaler to compare with, skipped when None
+    repeats : int, default 5
+
+    Returns
+    -------
+    seconds : dict
+        Median seconds of 'registry' and 'pickle'
+    """
+
+    version = version if version is not None else versions(name)[-1]
+    n_features = len(load(name, version).features)
+
+    scripts = {
+        'registry' : (
+            'import numpy as np\n'
+            + 'import modules.model_registry as mr\n'
+            + f'artifact = mr.load({name!r}, {version})\n'
+            + f'artifact.predict(np.zeros((1, {n_features})))\n'
+        )
+    }
+
+    if model_path is not None and scaler_path is not None:
+        scripts['pickle'] = (
+            'import pickle\n'
+            + 'import numpy as np\n'
+            + f'model = pickle.load(open({model_path!r}, "rb"))\n'
+            + f'scaler = pickle.load(open({scaler_path!r}, "rb"))\n'
+            + f'model.predict(scaler.transform(np.zeros((1, {n_features}))))\n'
+        )
+
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    seconds = {}
+
+    for label, script in scripts.items():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', script], cwd=src_dir, check=True)
+            timings.append(time.perf_counter() - start)
+        seconds[label] = float(np.median(timings))
+
+    return seconds
@@ -0,0 +1,473 @@
+import argparse
+import collections
+import json
+import math
+import pickle  # Python object serialization
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+# Project level modules
+import modules.calendar_features as cf
+import modules.flights_schema as fs
+import modules.preprocessing_functions as ppf
+import modules.stats_lookup as sl
+import modules.xgboost_functions as xgf
+from modules.batch_scoring import MODEL_PATH, SCALER_PATH
+
+
+def validate_flight(flight: 'dict'):
+    """
+    Checks the features of a flight received by the server
+
+    Text features must be strings (or null), numeric features numbers
+    and fl_date epoch milliseconds or a date string.
+
+    Parameters
+    ----------
+    flight : dict
+        A flight with the keys of xgboost_functions.FEATURE_COLUMNS
+
+    Raises
+    ------
+    ValueError
+        naming the first invalid feature
+    """
+
+    for column in xgf.FEATURE_COLUMNS:
+        value = flight[column]
+
+        if column == 'fl_date':
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f'fl_date: expected epoch milliseconds or a '
+                                 + f'date string, got {value!r}')
+            try:
+                date = cf.parse_flight_dates([value]).iloc[0]
+            except (ValueError, TypeError, OverflowError) as error:
+                raise ValueError(f'fl_date: invalid date {value!r}') from error
+            if pd.isna(date):
+                raise ValueError(f'fl_date: invalid date {value!r}')
+
+        elif column in fs.CATEGORICAL_DOMAINS:
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f'{column}: expected a string, got {value!r}')
+
+        elif (isinstance(value, bool)
+                or not isinstance(value, (int, float))
+                or not math.isfinite(value)):
+            raise ValueError(f'{column}: expected a number, got {value!r}')
+
+    return None
+
+
+class MicroBatcher:
+    """
+    Scores flights in micro-batches on a background thread
+
+    Requests are queued and gathered into one batch until max_batch_size
+    flights are waiting or the oldest request has waited max_wait_ms,
+    then the whole batch goes through the feature path and the model at
+    once. When a batch fails, its requests are scored one at a time so
+    that one invalid request only fails itself.
+
+    Parameters
+    ----------
+    model : fit XGBoost regressor
+    scaler : fit scikit-learn scaler
+    imputer : preprocessing_functions.Imputer or string
+        Imputer fitted on the training data (or the path of its json
+        file), so the NAN fill values do not depend on the batch (see
+        xgboost_functions.build_features)
+    time_period : string 'week', 'month', default 'month'
+    max_batch_size : int, default 256
+        Maximum number of flights scored at once
+    max_wait_ms : float, default 5
+        Maximum time a request waits for other requests to join its batch
+    """
+
+    def __init__(self,
+                 model,
+                 scaler,
+                 imputer: 'ppf.Imputer | str',
+                 time_period: 'str' = 'month',
+                 max_batch_size: 'int' = 256,
+                 max_wait_ms: 'float' = 5):
+        if isinstance(imputer, str):
+            imputer = ppf.Imputer.load(imputer)
+        if not isinstance(imputer, ppf.Imputer) or imputer.fill_values is None:
+            raise ValueError('MicroBatcher needs an Imputer fitted on the '
+                             + 'training data')
+
+        self.model = model
+        self.scaler = scaler
+        self.time_period = time_period
+        self.imputer = imputer
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.metrics = LatencyMetrics()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """
+        Precomputes the week_month lookups and starts the batching thread
+        """
+
+        self.warm_up()
+        self._thread.start()
+
+        return self
+
+    def warm_up(self):
+        """
+        Loads the delay statistics tables and builds their lookup arrays
+        for the current category dictionaries, so the first requests do
+        not pay for them
+        """
+
+        for k, v in xgf.STATS_FEATURES.items():
+            sl.encode(
+                pd.Series([], name=k, dtype=fs.categorical_dtype(
+                    fs.CATEGORICAL_DOMAINS[k]
+                )),
+                path=f'{xgf.STATS_DIR}/{k}_{v}_stats.csv',
+                column=f'{xgf.STATS_WINDOW}_{self.time_period}_{k}_mean_{v}'
+            )
+
+        return None
+
+    def submit(self, flights: 'list'):
+        """
+        Queues flights for scoring
+
+        Parameters
+        ----------
+        flights : list of dict
+            Flights with the keys of xgboost_functions.FEATURE_COLUMNS
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Resolves to the list of predicted delays
+        """
+
+        future = Future()
+        self._queue.put((time.perf_counter(), flights, future))
+
+        return future
+
+    def _next_batch(self):
+        """
+        Returns the requests of the next batch, waiting for the first one
+        """
+
+        batch = [self._queue.get()]
+        size = len(batch[0][1])
+        deadline = batch[0][0] + self.max_wait_ms / 1000
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                # Past the deadline, only take the requests already queued
+                if timeout > 0:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[1])
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            flights = [flight for _, request, _ in batch for flight in request]
+
+            try:
+                predictions = self.predict(flights)
+            except Exception as error:
+                if len(batch) == 1:
+                    batch[0][2].set_exception(error)
+                else:
+                    self._run_each(batch)
+                continue
+
+            end = time.perf_counter()
+            position = 0
+            for received, request, future in batch:
+                future.set_result(
+                    predictions[position:position + len(request)].tolist()
+                )
+                position += len(request)
+                self.metrics.record(end - received, len(request))
+
+            self.metrics.record_batch()
+
+    def _run_each(self, batch):
+        """
+        Scores the requests of a failed batch one at a time
+        """
+
+        for received, request, future in batch:
+            try:
+                predictions = self.predict(request)
+            except Exception as error:
+                future.set_exception(error)
+                continue
+
+            future.set_result(predictions.tolist())
+            self.metrics.record(time.perf_counter() - received, len(request))
+            self.metrics.record_batch()
+
+        return None
+
+    def predict(self, flights: 'list'):
+        """
+        Predicts the arrival delay of flights
+
+        Parameters
+        ----------
+        flights : list of dict
+            Flights with the keys of xgboost_functions.FEATURE_COLUMNS
+
+        Returns
+        -------
+        predictions : numpy array
+        """
+
+        data = fs.apply_schema(
+            pd.DataFrame.from_records(flights, columns=list(xgf.FEATURE_COLUMNS))
+        )
+        data['fl_date'] = cf.parse_flight_dates(data['fl_date'])
+
+        X = xgf.build_features(data=data,
+                               time_period=self.time_period,
+                               imputer=self.imputer)
+        X_test = pd.DataFrame(self.scaler.transform(X=X), columns=X.columns)
+
+        return np.asarray(self.model.predict(X_test))
+
+
+class LatencyMetrics:
+    """
+    Request latency and throughput of the server
+
+    Parameters
+    ----------
+    window : int, default 10,000
+        Number of most recent requests the latency percentiles are
+        computed on
+    """
+
+    def __init__(self, window: 'int' = 10_000):
+        self.started = time.perf_counter()
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.flights = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: 'float', flights: 'int'):
+        with self._lock:
+            self.latencies.append(latency)
+            self.requests += 1
+            self.flights += flights
+
+    def record_batch(self):
+        with self._lock:
+            self.batches += 1
+
+    def summary(self):
+        """
+        Returns the metrics as a dict, latencies in milliseconds
+        """
+
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            uptime = time.perf_counter() - self.started
+            summary = {
+                'requests' : self.requests,
+                'flights' : self.flights,
+                'batches' : self.batches,
+                'mean_batch_size' : self.flights / self.batches if self.batches else 0,
+                'uptime_s' : uptime,
+                'throughput_flights_per_s' : self.flights / uptime
+            }
+
+        for percentile in [50, 99]:
+            summary[f'p{percentile}_latency_ms'] = (
+                float(np.percentile(latencies, percentile))
+                if latencies.shape[0] else None
+            )
+
+        return summary
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict with a flight, or a list of flights, as json
+        {"predicted_delay" : [...]}
+    GET /metrics
+        latency and throughput metrics
+    GET /health
+    """
+
+    def _send_json(self, status: 'int', body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_json(200, self.server.batcher.metrics.summary())
+        elif self.path == '/health':
+            self._send_json(200, {'status' : 'ok'})
+        else:
+            self._send_json(404, {'error' : f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error' : f'unknown path {self.path}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            flights = json.loads(self.rfile.read(length))
+        except ValueError as error:
+            self._send_json(400, {'error' : f'invalid json: {error}'})
+            return
+
+        if isinstance(flights, dict):
+            flights = [flights]
+
+        if (not isinstance(flights, list)
+                or not all(isinstance(flight, dict) for flight in flights)):
+            self._send_json(400, {'error' : 'expected a flight or a list of '
+                                            + 'flights as json objects'})
+            return
+
+        missing = sorted({
+            column
+            for flight in flights
+            for column in xgf.FEATURE_COLUMNS
+            if column not in flight
+        })
+        if not flights or missing:
+            self._send_json(400, {'error' : f'missing features: {missing}'})
+            return
+
+        for position, flight in enumerate(flights):
+            try:
+                validate_flight(flight)
+            except ValueError as error:
+                self._send_json(400, {'error' : f'flight {position}: {error}'})
+                return
+
+        try:
+            predictions = self.server.batcher.submit(flights).result()
+        except Exception as error:
+            self._send_json(500, {'error' : str(error)})
+            return
+
+        self._send_json(200, {'predicted_delay' : predictions})
+
+    def log_message(self, format, *args):
+        # Per request logging would dominate the latency
+        return None
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """
+    Threading HTTP server holding the MicroBatcher of its handlers
+    """
+
+    daemon_threads = True
+    # Accept bursts of concurrent connections
+    request_queue_size = 128
+
+
+def serve(imputer: 'str',
+          host: 'str' = '127.0.0.1',
+          port: 'int' = 8000,
+          model_path: 'str' = MODEL_PATH,
+          scaler_path: 'str' = SCALER_PATH,
+          time_period: 'str' = 'month',
+          max_batch_size: 'int' = 256,
+          max_wait_ms: 'float' = 5):
+    """
+    Returns a prediction server, started in a background thread
+
+    Parameters
+    ----------
+    imputer : string
+        Path of the Imputer json file fitted on the training data
+    host : string, default '127.0.0.1'
+    port : int, default 8000
+    model_path : string, default MODEL_PATH
+    scaler_path : string, default SCALER_PATH
+    time_period : string 'week', 'month', default 'month'
+    max_batch_size : int, default 256
+    max_wait_ms : float, default 5
+
+    Returns
+    -------
+    server : PredictionServer
+        Stop it with server.shutdown()
+    """
+
+    with open(model_path, 'rb') as f_input:
+        model = pickle.load(f_input)
+    with open(scaler_path, 'rb') as f_input:
+        scaler = pickle.load(f_input)
+
+    # Refuse to start without a fitted imputer, before binding the port
+    batcher = MicroBatcher(model=model,
+                           scaler=scaler,
+                           imputer=imputer,
+                           time_period=time_period,
+                           max_batch_size=max_batch_size,
+                           max_wait_ms=max_wait_ms)
+
+    server = PredictionServer((host, port), PredictionHandler)
+    server.batcher = batcher.start()
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Flight delay prediction server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--time-period', default='month', choices=['week', 'month'])
+    parser.add_argument('--imputer', required=True,
+                        help='Imputer json file fitted on the training data')
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    server = serve(imputer=args.imputer,
+                   host=args.host,
+                   port=args.port,
+                   time_period=args.time_period,
+                   max_batch_size=args.max_batch_size,
+                   max_wait_ms=args.max_wait_ms)
+    print(f'Serving on http://{args.host}:{args.port}')
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,6 +1,11 @@
+import json
+
 import pandas as pd
 import numpy as np
 
+# Project level modules
+import modules.calendar_features as cf
+
 def convert_flight_date(df):
     df['fl_date'] = pd.to_datetime(df['fl_date'], unit='ms')
     return df
@@ -11,16 +16,91 @@ def daily_flight_order(df):
     """
     
     data = df.sort_values(['fl_date', 'tail_num', 'crs_dep_time']).reset_index(drop = True)
-    data['n_previous_flights'] = 0
-    
-    for table_index in range(1, data.shape[0]):
-        if data.loc[table_index, 'tail_num'] != data.loc[table_index - 1, 'tail_num']:
-            continue
-        data.loc[table_index, 'n_previous_flights'] = data.loc[table_index - 1, 'n_previous_flights'] + 1
+    data['n_previous_flights'] = _tail_run_position(data['tail_num'], data['fl_date'])
         
     return data
 
 
+def _same_as_previous(tail_num, fl_date = None):
+    """
+    Returns a boolean numpy array, True where a row is the same plane as the row above it on the same day (when fl_date is given).
+    
+    Missing tail numbers never compare equal.
+    """
+    
+    tail_num = pd.Series(tail_num).reset_index(drop = True)
+    same = tail_num.eq(tail_num.shift())
+    
+    if fl_date is not None:
+        fl_date = pd.Series(fl_date).reset_index(drop = True)
+        same &= fl_date.eq(fl_date.shift())
+    
+    return same.to_numpy()
+
+
+def _tail_run_position(tail_num, fl_date = None):
+    """
+    Returns a numpy array with the position of each row within its run of consecutive, equal tail numbers.
+    
+    A row starts a new run when its tail number differs from the row above it, or its fl_date does when fl_date is given. Missing tail numbers never compare equal, so each of them starts a run of its own.
+    """
+    
+    same = _same_as_previous(tail_num, fl_date)
+    position = np.arange(same.shape[0])
+    
+    # Index of the first row of the run each row belongs to
+    run_start = np.where(~same, position, 0)
+    run_start = np.maximum.accumulate(run_start) if run_start.size else run_start
+    
+    return position - run_start
+
+
+def hhmm_to_minutes(hhmm):
+    """
+    Returns the number of minutes after midnight of an hhmm local time (e.g. 1435 -> 875). Accepts scalars, numpy arrays or pandas Series.
+    """
+    
+    return (hhmm // 100) * 60 + hhmm % 100
+
+
+def aircraft_rotation_features(df):
+    """
+    Returns the pandas DataFrame ordered by [fl_date, tail_num, crs_dep_time] with aircraft rotation features added.
+    
+    Added columns
+    -------------
+    n_previous_flights : int
+        Number of flights the plane has undertaken previously during the same day (identical to daily_flight_order).
+    prev_crs_arr_time : float
+        Scheduled arrival time (hhmm local) of the plane's previous leg that day, NaN for its first leg.
+    turnaround_buffer : float
+        Scheduled minutes between the previous leg's arrival and this leg's departure, NaN for the first leg. A previous leg arriving before it departed (hhmm) arrives the next day, its arrival counts 24 hours later. Negative when this leg is scheduled to leave before the previous one arrives.
+    prev_origin : same dtype as origin
+        Origin airport of the plane's previous leg that day, NaN for its first leg.
+    
+    Every column is computed with sorted array operations, so the run time is dominated by the initial sort.
+    """
+    
+    data = daily_flight_order(df)
+    
+    # A previous leg exists when the row above is the same plane on the same day, the rule of n_previous_flights
+    has_previous = _same_as_previous(data['tail_num'], data['fl_date'])
+    
+    prev_crs_arr_time = data['crs_arr_time'].shift().where(has_previous)
+    data['prev_crs_arr_time'] = prev_crs_arr_time
+    
+    # Minutes from midnight of the flight date, the previous leg's arrival the next day when it crossed midnight
+    prev_arr_minutes = hhmm_to_minutes(prev_crs_arr_time)
+    prev_arr_minutes = prev_arr_minutes.where(
+        prev_crs_arr_time >= data['crs_dep_time'].shift(),
+        prev_arr_minutes + 24 * 60
+    )
+    data['turnaround_buffer'] = hhmm_to_minutes(data['crs_dep_time']) - prev_arr_minutes
+    data['prev_origin'] = data['origin'].shift().where(has_previous)
+    
+    return data
+
+
 def flight_test_features(df, purged = False):
     """
     Returns a pandas DataFrame containing only the feature set that will be used to test the machine learning model.
@@ -110,39 +190,118 @@ def purge_features(df):
 def process_nan_values(df, features_to_zero = [], features_to_remove = [], features_to_mean = [], features_to_median = [], avg_before_purge = True):
     """
     Returns a pandas DataFrame with the NaN values replaced or removed.
+    
+    The mean and median fill values are computed on df itself. To reuse the statistics of a training set on later batches, fit an Imputer once and call its transform method instead.
     """
     
-    df.reset_index(drop = True, inplace = True)
+    imputer = Imputer(
+        features_to_zero = features_to_zero,
+        features_to_remove = features_to_remove,
+        features_to_mean = features_to_mean,
+        features_to_median = features_to_median,
+        avg_before_purge = avg_before_purge
+    )
     
-    for feature in features_to_zero:
-        zero_column = df[feature].fillna(0)
-        df[feature] = zero_column
+    return imputer.fit(df).transform(df)
+
+
+class Imputer:
+    """
+    NaN value replacement plan with the same options as process_nan_values, whose fill values are computed once (fit) and then applied to any number of batches (transform).
     
-    if avg_before_purge:
-        for feature in features_to_mean:
-            mean = df[feature].mean()
-            mean_column = df[feature].fillna(mean)
-            df[feature] = mean_column
+    Parameters
+    ----------
+    features_to_zero: list
+        Features whose NaN values are set to 0
+    features_to_remove: list
+        Features whose NaN values cause the row to be dropped
+    features_to_mean: list
+        Features whose NaN values are set to the fitted mean
+    features_to_median: list
+        Features whose NaN values are set to the fitted median
+    avg_before_purge: bool, default = True
+        When set to False, the means and medians are computed after dropping the rows of features_to_remove
+    
+    Example
+    -------
+    imputer = Imputer(features_to_mean = ['dest_month_mean_arr_delay']).fit(X_train)
+    imputer.save('models/imputer.json')
+    X_batch = Imputer.load('models/imputer.json').transform(X_batch)
+    """
+    
+    def __init__(self, features_to_zero = [], features_to_remove = [], features_to_mean = [], features_to_median = [], avg_before_purge = True):
+        self.features_to_zero = list(features_to_zero)
+        self.features_to_remove = list(features_to_remove)
+        self.features_to_mean = list(features_to_mean)
+        self.features_to_median = list(features_to_median)
+        self.avg_before_purge = avg_before_purge
+        self.fill_values = None
+    
+    def fit(self, df):
+        """
+        Computes the fill values of every feature from a pandas DataFrame of training data and returns the Imputer.
+        """
+        
+        data = df
+        if not self.avg_before_purge and self.features_to_remove:
+            data = df[df[self.features_to_remove].notna().all(axis = 1)]
+        
+        fill_values = {feature: 0 for feature in self.features_to_zero}
+        
+        if self.features_to_mean:
+            fill_values.update(data[self.features_to_mean].mean())
+        
+        if self.features_to_median:
+            fill_values.update(data[self.features_to_median].median())
         
-        for feature in features_to_median:
-            median = df[feature].median()
-            median_column = df[feature].fillna(median)
-            df[feature] = median_column
-    
-    df.dropna(subset=features_to_remove, inplace=True)
-    
-    if not avg_before_purge:
-        for feature in features_to_mean:
-            mean = df[feature].mean()
-            mean_column = df[feature].fillna(mean)
-            df[feature] = mean_column
+        self.fill_values = {feature: float(value) for feature, value in fill_values.items()}
         
-        for feature in features_to_median:
-            median = df[feature].median()
-            median_column = df[feature].fillna(median)
-            df[feature] = median_column
+        return self
     
-    return df.reset_index(drop = True)
+    def transform(self, df):
+        """
+        Returns the pandas DataFrame, modified in place, with the NaN values replaced by the fitted fill values or removed.
+        """
+        
+        if self.fill_values is None:
+            raise ValueError("Imputer must be fit before calling transform")
+        
+        if self.avg_before_purge:
+            df.fillna(self.fill_values, inplace = True)
+        
+        if self.features_to_remove:
+            df.dropna(subset = self.features_to_remove, inplace = True)
+        
+        if not self.avg_before_purge:
+            df.fillna(self.fill_values, inplace = True)
+        
+        df.reset_index(drop = True, inplace = True)
+        
+        return df
+    
+    def save(self, path):
+        """
+        Saves the features lists and fitted fill values to a json file and returns the Imputer.
+        """
+        
+        with open(path, 'w') as f_output:
+            json.dump(vars(self), f_output, indent = 4)
+        
+        return self
+    
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the Imputer saved to a json file.
+        """
+        
+        with open(path) as f_input:
+            state = json.load(f_input)
+        
+        imputer = cls()
+        imputer.__dict__.update(state)
+        
+        return imputer
 
 
 def datetime_binning(df, bin_set = {}):
@@ -167,46 +326,17 @@ def datetime_binning(df, bin_set = {}):
     if not set(bin_set).issubset({'h', 'd', 'wd', 'w', 'm'}):
         raise ValueError("bin_set must be any of 'd', 'wd', 'w', or 'm'")
     
-    fl_date = np.array(df['fl_date'])
-    shape = df.shape[0]
-    
     if 'h' in bin_set:
         df['dep_hour'] = df['crs_dep_time']//100
-    if 'd' in bin_set:
-        day_of_year = np.empty(shape = shape)
-    if 'wd' in bin_set:
-        weekday = np.empty(shape = shape)    
-    if 'w' in bin_set:
-        week = np.empty(shape = shape)
-    if 'm' in bin_set:
-        month = np.empty(shape = shape)
-    
-    for i in range(shape):
-        try:
-            date_code = pd.to_datetime(fl_date[i], utc=True, unit='ms')
-        except ValueError:
-            date_code = pd.to_datetime(fl_date[i])   
-    
-        if 'd' in bin_set:
-            day[i] = date_code.day_of_year
-            
-        if 'wd' in bin_set:
-            weekday[i] = date_code.day_of_week
-
-        if 'w' in bin_set:
-            week[i] = date_code.weekofyear
-
-        if 'm' in bin_set:
-            month[i] = date_code.month
     
-    if 'd' in bin_set:
-        df['day_of_year'] = day
-    if 'wd' in bin_set:
-        df['weekday'] = weekday
-    if 'w' in bin_set:
-        df['week'] = week
-    if 'm' in bin_set:
-        df['month'] = month
+    date_bins = {
+        'd': 'day_of_year',
+        'wd': 'weekday',
+        'w': 'week',
+        'm': 'month'
+    }
+    
+    cf.add_calendar_features(df, columns = [date_bins[b] for b in date_bins if b in bin_set])
     
     return df
 
@@ -214,90 +344,13 @@ def datetime_binning(df, bin_set = {}):
 def is_stat_holiday(df):
     """
     Returns a pandas DataFrame with an additional column of the whether or not the flight is taking place on a holiday. 
-    """
     
-    holiday_days_list = [
-        #New Years
-        '2019-1-1',
-        
-        #MLK Jr Day
-        '2019-1-18',
-        '2019-1-19',
-        '2019-1-20',
-        '2019-1-21',
-        
-        #President's Day
-        '2019-2-15',        
-        '2019-2-16',
-        '2019-2-17',
-        '2019-2-18',
-        
-        #Memorial Day
-        '2019-5-24',
-        '2019-5-25',
-        '2019-5-26',
-        '2019-5-27',
-        
-        #Independence Day
-        '2019-7-3',
-        '2019-7-4',
-        '2019-7-5',
-        '2019-7-6',
-        '2019-7-7',
-        
-        #Labor Day
-        '2019-8-30',
-        '2019-8-31',
-        '2019-9-1',
-        '2019-9-2',
-        
-        #Columbus Day
-        '2019-10-11',
-        '2019-10-12',
-        '2019-10-13',
-        '2019-10-14',
-        
-        #Veteran's Day
-        '2019-11-8',
-        '2019-11-9',
-        '2019-11-10',
-        '2019-11-11',
-        
-        #Thanksgiving
-        '2019-11-25',
-        '2019-11-26',
-        '2019-11-27',
-        '2019-11-28',
-        
-        #Christmas
-        '2019-12-21',
-        '2019-12-22',
-        '2019-12-23',
-        '2019-12-24',
-        '2019-12-25',
-        '2019-12-26',
-        '2019-12-27',
-        '2019-12-28',
-        '2019-12-29',
-        
-        #New Years
-        '2019-12-30',
-        '2019-12-31',
-        '2020-1-1'
-    ]
+    Holidays are the travel windows around the US federal holidays of calendar_features.US_FEDERAL_HOLIDAYS, for any year.
+    """
     
     df.reset_index(drop = True, inplace = True)
-    df['stat_holiday'] = 0
-    
-    for i in range(df.shape[0]):
-        try:
-            timestamp = pd.to_datetime(df.loc[i, 'fl_date'], utc=True, unit='ms')
-            df.loc[i, 'stat_holiday'] = int(f"{timestamp.year}-{timestamp.month}-{timestamp.day}" in holiday_days_list)
-        except ValueError:
-            timestamp = pd.to_datetime(df.loc[i, 'fl_date'])
-            df.loc[i, 'stat_holiday'] = int(f"{timestamp.year}-{timestamp.month}-{timestamp.day}" in holiday_days_list)
-        
-    return df
+    
+    return cf.add_holiday_features(df, proximity = False)
 
 
 def numerical_categorical_split(df):
@@ -354,27 +407,74 @@ def binomial_stats(df, col_list, threshold=0, greater=True):
     if len(col_list) != 2:
             raise Exception("'Error. The columns list must only contain two column names: grouping feature and frequency feature.")
             
-    stats = df[col_list]
     group = col_list[0]
     col_filt = col_list[1]
     col_1 = col_filt + "_" + "yes"
     col_2 = col_filt + "_" + "no"
-    if greater == True:
+    
+    stats = binomial_threshold_stats(df, [group], col_filt, [threshold], greater=greater)
+    
+    return stats[[group, col_1, col_2]]
 
-        filt = stats.apply(lambda x : True
-            if x[col_filt] > threshold else False, axis = 1)
-    else:
-        filt = stats.apply(lambda x : True
-            if x[col_filt] < threshold else False, axis = 1)
-        
 
-    yes = stats[filt].groupby(group).count()
-    total = stats.groupby(group).count()
-    stats = yes/total     
-    stats[col_2] = (1- yes/total)
-    stats.rename({col_filt: col_1}, axis=1, inplace=True)
+def binomial_threshold_stats(df, group_cols, feature, thresholds=[0], greater=True):
+    '''Returns the bionomial distribution of a feature at several cut-off thresholds for every group of one or more grouping features, in a single pass over the data.
+        Parameters:
+            a (Pandas Data Frame) df - Date frame.
+            b (list) group_cols - Grouping feature(s).
+            c (string) feature - Numeric feature compared to the thresholds.
+            d (list of float or int) thresholds (default = [0]) - Numeric values to determine true or false cut-off thresholds.
+            e (boolean) greater (default = True) - Boolean to determine if the comparison operator is greater than or less than.
+        Returns:
+            New Pandas Data Frame in long format with one row per group and threshold: the grouping features, threshold, total (non-null count), yes (count), <feature>_yes and <feature>_no (proportions).
+    '''
+    group_cols = list(group_cols)
+    thresholds = np.sort(np.asarray(thresholds, dtype = float))
+    
+    # Integer code of every group, rows with a missing key or value are left out like in a groupby count
+    grouped = df.groupby(group_cols, sort = True, observed = True)
+    keys = grouped.size().index
+    codes = grouped.ngroup().to_numpy()
+    values = df[feature].to_numpy(dtype = float)
+    valid = ~(np.isnan(codes) | np.isnan(values))
+    codes = codes[valid].astype(np.int64)
+    values = values[valid]
+    
+    n_groups = keys.shape[0]
+    
+    # Dense rank of the values, then sort once by (group, rank)
+    uniques, ranks = np.unique(values, return_inverse = True)
+    span = uniques.shape[0] + 1
+    sorted_keys = np.sort(codes * span + ranks)
+    
+    # Position of every group in the sorted keys
+    group_start = np.searchsorted(sorted_keys, np.arange(n_groups) * span)
+    group_end = np.searchsorted(sorted_keys, np.arange(1, n_groups + 1) * span)
+    total = group_end - group_start
+    
+    # Rank from which values are past each threshold and where it falls within every group
+    if greater:
+        threshold_rank = np.searchsorted(uniques, thresholds, side = 'right')
+    else:
+        threshold_rank = np.searchsorted(uniques, thresholds, side = 'left')
+    cut = np.searchsorted(
+        sorted_keys,
+        (np.arange(n_groups)[:, None] * span + threshold_rank[None, :]).ravel()
+    ).reshape(n_groups, thresholds.shape[0])
+    
+    if greater:
+        yes = group_end[:, None] - cut
+    else:
+        yes = cut - group_start[:, None]
     
-    return stats.reset_index()
+    stats = keys.to_frame(index = False).loc[np.repeat(np.arange(n_groups), thresholds.shape[0])].reset_index(drop = True)
+    stats['threshold'] = np.tile(thresholds, n_groups)
+    stats['total'] = np.repeat(total, thresholds.shape[0])
+    stats['yes'] = yes.ravel()
+    stats[feature + "_yes"] = stats['yes'] / stats['total']
+    stats[feature + "_no"] = 1 - stats[feature + "_yes"]
+    
+    return stats
 
 # Version 2 Doesn't have weekday option
 def datetime_binning_v2(df, bin_set = {}):
@@ -402,36 +502,12 @@ def datetime_binning_v2(df, bin_set = {}):
     if 'h' in bin_set:
         df['dep_hour'] = df['crs_dep_time']//100       
     
-    if 'd' in bin_set:
-        df['day_of_month'] = 0
-        for i in range(df.shape[0]):
-            try:
-                df.loc[i, 'day_of_month'] = pd.to_datetime(df.loc[i, 'fl_date'], utc=True, unit='ms').day
-            except ValueError:
-                df.loc[i, 'day_of_month'] = pd.to_datetime(df.loc[i, 'fl_date']).day
-                
-#     if 'wd' in bin_set:
-#         df['weekday'] = 0
-#         for i in range(df.shape[0]):
-#             try:
-#                 df.loc[i, 'weekday'] = pd.to_datetime(df.loc[i, 'fl_date'], utc=True, unit='ms').weekday
-#             except ValueError:
-#                 df.loc[i, 'weekday'] = pd.to_datetime(df.loc[i, 'fl_date']).weekday
-    
-    if 'w' in bin_set:
-        df['week_of_year'] = 0
-        for i in range(df.shape[0]):
-            try:
-                df.loc[i, 'week_of_year'] = pd.to_datetime(df.loc[i, 'fl_date'], utc=True, unit='ms').week
-            except ValueError:
-                df.loc[i, 'week_of_year'] = pd.to_datetime(df.loc[i, 'fl_date']).week
-    
-    if 'm' in bin_set:
-        df['month'] = 0
-        for i in range(df.shape[0]):
-            try:
-                df.loc[i, 'month'] = pd.to_datetime(df.loc[i, 'fl_date'], utc=True, unit='ms').month
-            except ValueError:
-                df.loc[i, 'month'] = pd.to_datetime(df.loc[i, 'fl_date']).month
+    date_bins = {
+        'd': ('day_of_month', 'day_of_month'),
+        'w': ('week', 'week_of_year'),
+        'm': ('month', 'month')
+    }
+    
+    cf.add_calendar_features(df, columns = dict(date_bins[b] for b in date_bins if b in bin_set))
         
     return df
@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+# Project level modules
+import modules.calendar_features as cf
+
+
+# Grouping feature : delay feature of the rolling statistics
+ROLLING_FEATURES = {
+    'origin' : 'dep_delay',
+    'dest' : 'arr_delay',
+    'op_unique_carrier' : 'arr_delay',
+    'tail_num' : 'arr_delay'
+}
+
+
+def _days(values):
+    """
+    Returns flight dates as integer days since the epoch
+    """
+
+    return (cf.parse_flight_dates(values).to_numpy()
+            .astype('datetime64[D]').astype('int64'))
+
+
+def rolling_delay_stats(df,
+                        groupby: 'str',
+                        feature: 'str',
+                        windows: 'list' = [7],
+                        history=None,
+                        date_column: 'str' = 'fl_date'):
+    """
+    Trailing delay statistics of every flight's group, as of the day
+    before the flight
+
+    For a window of N days, the statistics of a flight flown on day d
+    are computed on the flights of its group flown from day d - N to
+    day d - 1, so they never include the flight itself or any flight of
+    the same day.
+
+    The history is aggregated once into per (group, day) counts, sums
+    and sums of squares, sorted by group then day, and cumulated within
+    every group. The statistics of any window are then the difference
+    of two cumulative sums found with binary searches, so the cost does
+    not depend on the window length and every window reuses the same
+    table.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Flights to compute the statistics for
+    groupby : string
+        Grouping feature, e.g. 'origin'
+    feature : string
+        Delay feature, e.g. 'dep_delay'
+    windows : list of int, default [7]
+        Window lengths in days
+    history : Pandas DataFrame or None, default None
+        Flights the statistics are computed on, df when None. Flights
+        with a NAN feature are ignored.
+    date_column : string, default 'fl_date'
+
+    Returns
+    -------
+    stats : Pandas DataFrame
+        Aligned with df, with the columns
+        {groupby}_{N}d_{mean|std|count}_{feature} for every window N.
+        mean and std are NAN without history (std below 2 flights).
+    """
+
+    if history is None:
+        history = df
+
+    # Group codes shared by the history and the flights
+    codes, groups = pd.factorize(
+        pd.concat([history[groupby].astype(object), df[groupby].astype(object)],
+                  ignore_index=True)
+    )
+
+    history_values = history[feature].to_numpy(dtype='float64')
+    known = (~np.isnan(history_values)
+             & history[date_column].notna().to_numpy()
+             & (codes[:history.shape[0]] != -1))
+
+    history_codes = codes[:history.shape[0]][known]
+    flight_codes = codes[history.shape[0]:]
+    history_days = _days(history[date_column])[known]
+    missing = (flight_codes == -1) | df[date_column].isna().to_numpy()
+    flight_days = _days(df[date_column].fillna(history[date_column].min()))
+
+    history_values = history_values[known]
+
+    # (group, day) as one sortable integer
+    all_days = np.concatenate([history_days, flight_days[~missing]])
+    first_day = all_days.min() if all_days.shape[0] else 0
+    n_days = (all_days.max() - first_day + 1) if all_days.shape[0] else 1
+
+    keys, inverse = np.unique(history_codes * n_days + (history_days - first_day),
+                              return_inverse=True)
+    key_groups = keys // n_days
+
+    # Center the values on their group's mean to limit the cancellation
+    # in the variance
+    group_count = np.bincount(history_codes, minlength=len(groups))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_mean = np.bincount(history_codes,
+                                 weights=history_values,
+                                 minlength=len(groups)) / group_count
+    history_values = history_values - group_mean[history_codes]
+
+    # Cumulative count, sum and sum of squares of the daily aggregates,
+    # restarting at every group
+    cumulative = {}
+    for name, weights in [('count', None),
+                          ('sum', history_values),
+                          ('sumsq', history_values ** 2)]:
+        daily = np.bincount(inverse, weights=weights, minlength=keys.shape[0])
+        cumulative[name] = (pd.Series(daily).groupby(key_groups).cumsum()
+                            .to_numpy())
+
+    # Flights of the same group and day share their statistics, so the
+    # windows are computed once per distinct (group, day), in sorted
+    # order which also makes the binary searches cache friendly
+    flight_keys, flight_inverse = np.unique(
+        np.where(missing, -1, flight_codes * n_days + (flight_days - first_day)),
+        return_inverse=True
+    )
+    unknown = flight_keys == -1
+    flight_groups = np.where(unknown, 0, flight_keys // n_days)
+    flight_base = flight_groups * n_days
+    flight_offsets = np.where(unknown, 0, flight_keys - flight_base)
+
+    # Positions of the group's first day and of the day of the flight,
+    # the window ends on the day before the flight
+    start = np.searchsorted(keys, flight_base, side='left')
+    hi = np.searchsorted(keys, flight_base + flight_offsets, side='left')
+
+    def window_sum(name, lo):
+        """
+        Sum of the daily aggregates from position lo to hi - 1
+        """
+        values = cumulative[name]
+        if values.shape[0] == 0:
+            return np.zeros(hi.shape[0])
+        upper = np.where(hi > start, values[np.maximum(hi - 1, 0)], 0)
+        lower = np.where(lo > start, values[np.maximum(lo - 1, 0)], 0)
+        return upper - lower
+
+    stats = pd.DataFrame(index=df.index)
+
+    for n in windows:
+        # Windows starting before the first day start on the first day
+        lo = np.searchsorted(keys,
+                             flight_base + np.maximum(flight_offsets - n, 0),
+                             side='left')
+
+        count = np.where(unknown, 0, np.rint(window_sum('count', lo)))
+        total = window_sum('sum', lo)
+        total_sq = window_sum('sumsq', lo)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            variance = np.where(count > 1,
+                                (total_sq - total * mean) / (count - 1),
+                                np.nan)
+
+        mean = mean + group_mean[flight_groups]
+        std = np.sqrt(np.maximum(variance, 0))
+
+        stats[f'{groupby}_{n}d_mean_{feature}'] = mean[flight_inverse]
+        stats[f'{groupby}_{n}d_std_{feature}'] = std[flight_inverse]
+        stats[f'{groupby}_{n}d_count_{feature}'] = (
+            count[flight_inverse].astype('int32')
+        )
+
+    return stats
+
+
+def add_rolling_features(df,
+                         feature_dict: 'dict' = ROLLING_FEATURES,
+                         windows: 'list' = [7],
+                         history=None,
+                         date_column: 'str' = 'fl_date'):
+    """
+    Adds the trailing delay statistics of every grouping feature to a
+    DataFrame of flights (see rolling_delay_stats)
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+    feature_dict : dict, default ROLLING_FEATURES
+        Grouping feature : delay feature
+    windows : list of int, default [7]
+        Window lengths in days
+    history : Pandas DataFrame or None, default None
+        Flights the statistics are computed on, df when None
+    date_column : string, default 'fl_date'
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The same DataFrame, modified in place
+    """
+
+    for groupby, feature in feature_dict.items():
+        stats = rolling_delay_stats(df,
+                                    groupby=groupby,
+                                    feature=feature,
+                                    windows=windows,
+                                    history=history,
+                                    date_column=date_column)
+        for column in stats.columns:
+            df[column] = stats[column].to_numpy()
+
+    return df
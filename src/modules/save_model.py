@@ -14,7 +14,8 @@ def jar(model, name: 'str'):
     -------
     None
     """
-    pickle.dump(model, open(f'models/{name}.pickle.dat', 'wb'))
+    with open(f'models/{name}.pickle.dat', 'wb') as f_output:
+        pickle.dump(model, f_output)
     return
 
 if __name__ == '__main__':
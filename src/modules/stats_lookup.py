@@ -0,0 +1,132 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Project level modules
+import modules.flights_schema as fs
+
+
+# Process wide cache of the delay statistics tables, by csv path:
+# (modification time, Pandas DataFrame)
+_tables = {}
+
+# Lookup arrays of a statistics column for a category dictionary, by
+# (csv path, stats column, domain):
+# (modification time, number of categories, lookup array). The shared
+# dictionaries only grow, so their length identifies them. Only the
+# latest version of every lookup is kept.
+_lookups = {}
+
+_lock = threading.Lock()
+
+
+def stats_table(path: 'str'):
+    """
+    Returns a delay statistics csv file as a DataFrame indexed by group
+
+    The file is read once per process and read again only when its
+    modification time changes.
+
+    Parameters
+    ----------
+    path : string
+        filepath, e.g. '../data/feature_average_delay_stats/origin_dep_delay_stats.csv'
+
+    Returns
+    -------
+    stats : Pandas DataFrame
+    """
+
+    mtime = os.stat(path).st_mtime_ns
+
+    with _lock:
+        cached = _tables.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    stats = pd.read_csv(path, index_col=0)
+    stats.index = stats.index.astype(str)
+
+    with _lock:
+        _tables[path] = (mtime, stats)
+
+    return stats
+
+
+def _lookup(path: 'str', column: 'str', domain: 'str', categories):
+    """
+    Returns the value of a statistics column for every category code,
+    followed by NaN for missing values (code -1)
+    """
+
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, column, domain)
+
+    with _lock:
+        cached = _lookups.get(key)
+    if cached is not None and cached[:2] == (mtime, len(categories)):
+        return cached[2]
+
+    stats = stats_table(path)
+    positions = stats.index.get_indexer(categories.astype(str))
+    values = np.append(stats[column].to_numpy(dtype='float64'), np.nan)
+    lookup = values[positions]  # -1 (no statistics) picks the NaN
+    lookup = np.append(lookup, np.nan)
+
+    with _lock:
+        _lookups[key] = (mtime, len(categories), lookup)
+
+    return lookup
+
+
+def encode(values, path: 'str', column: 'str'):
+    """
+    Returns the statistic of every value's group
+
+    Categorical values of the shared flights dictionaries are encoded
+    with one gather on their category codes. Other values are looked up
+    in the index of the statistics table.
+
+    Parameters
+    ----------
+    values : Pandas Series
+        Group of every row, e.g. the origin airports of the flights
+    path : string
+        Delay statistics csv file
+    column : string
+        Column of the statistics table, e.g. '2018_week_origin_mean_dep_delay'
+
+    Returns
+    -------
+    encoded : numpy array of float64
+        NaN for groups without statistics
+    """
+
+    domain = fs.CATEGORICAL_DOMAINS.get(values.name)
+
+    if (domain is not None
+            and isinstance(values.dtype, pd.CategoricalDtype)
+            and values.dtype.categories is fs.categorical_dtype(domain).categories):
+        lookup = _lookup(path, column, domain, values.dtype.categories)
+        return lookup[values.cat.codes.to_numpy()]
+
+    stats = stats_table(path)
+    positions = stats.index.get_indexer(values.astype(str))
+    positions[values.isna().to_numpy()] = -1
+    table_values = np.append(stats[column].to_numpy(dtype='float64'), np.nan)
+
+    return table_values[positions]
+
+
+def clear():
+    """
+    Empties the cache
+    """
+
+    with _lock:
+        _tables.clear()
+        _lookups.clear()
+
+    return None
@@ -0,0 +1,272 @@
+import json
+
+import numpy as np
+
+
+# Objectives whose predictions are the raw sum of the trees
+IDENTITY_OBJECTIVES = [
+    'reg:squarederror',
+    'reg:squaredlogerror',
+    'reg:pseudohubererror',
+    'reg:absoluteerror',
+    'reg:quantileerror',
+    'reg:linear'
+]
+
+
+class TreeEnsemble:
+    """
+    XGBoost tree ensemble flattened into numpy arrays
+
+    Every node of every tree is a row of the node arrays. Leaves point
+    to themselves, so walking max_depth steps from the roots ends on a
+    leaf whatever the depth of each tree, and all the trees of a batch
+    of rows are evaluated together one level at a time.
+
+    Only numpy is needed to load and evaluate an ensemble, see
+    from_booster to export one from XGBoost.
+
+    Parameters
+    ----------
+    feature : numpy array of int32
+        Feature index of the split of each node, -1 for leaves
+    threshold : numpy array of float32
+        Rows with feature < threshold go to the left child
+    left, right, missing : numpy arrays of int32
+        Child of each node for values below the threshold, for values
+        above or equal and for NAN values
+    value : numpy array of float32
+        Leaf value of each node, 0 for splits
+    roots : numpy array of int32
+        Root node of each tree
+    max_depth : int
+    base_score : float
+    features : list of string
+        Feature names, in the order of the columns of X
+    """
+
+    def __init__(self,
+                 feature,
+                 threshold,
+                 left,
+                 right,
+                 missing,
+                 value,
+                 roots,
+                 max_depth: 'int',
+                 base_score: 'float',
+                 features: 'list'):
+        self.feature = np.asarray(feature, dtype='int32')
+        self.threshold = np.asarray(threshold, dtype='float32')
+        self.left = np.asarray(left, dtype='int32')
+        self.right = np.asarray(right, dtype='int32')
+        self.missing = np.asarray(missing, dtype='int32')
+        self.value = np.asarray(value, dtype='float32')
+        self.roots = np.asarray(roots, dtype='int32')
+        self.max_depth = int(max_depth)
+        self.base_score = float(base_score)
+        self.features = list(features)
+
+    @classmethod
+    def from_booster(cls, model):
+        """
+        Returns the ensemble of a fit XGBoost regressor or Booster
+
+        Only gbtree boosters with one output, numerical splits and an
+        objective of IDENTITY_OBJECTIVES are supported, others raise
+        ValueError: dart weighs its trees, other objectives transform the
+        sum of the trees.
+        """
+
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+
+        config = json.loads(booster.save_config())
+        learner = config['learner']
+        model_param = learner['learner_model_param']
+        objective = learner['objective']['name']
+
+        if learner['gradient_booster']['name'] != 'gbtree':
+            raise ValueError(f'{learner["gradient_booster"]["name"]} boosters '
+                             + 'are not supported, only gbtree')
+        if objective not in IDENTITY_OBJECTIVES:
+            raise ValueError(f'objective {objective} is not supported, only '
+                             + f'{IDENTITY_OBJECTIVES}')
+
+        # Saved as '5E-1', or '[5E-1]' by recent versions
+        base_score = model_param['base_score'].strip('[]').split(',')
+        if (len(base_score) != 1
+                or int(model_param.get('num_target', 1)) > 1
+                or int(model_param.get('num_class', 0)) > 1):
+            raise ValueError('only models with one output are supported')
+        base_score = float(base_score[0])
+
+        features = booster.feature_names or [
+            f'f{i}' for i in range(booster.num_features())
+        ]
+        feature_index = {name : i for i, name in enumerate(features)}
+
+        columns = {name : [] for name in ['feature', 'threshold', 'left',
+                                          'right', 'missing', 'value']}
+        roots = []
+        max_depth = 0
+
+        for tree in booster.get_dump(dump_format='json'):
+            nodes = []
+            stack = [(json.loads(tree), 0)]
+            while stack:
+                node, depth = stack.pop()
+                nodes.append(node)
+                max_depth = max(max_depth, depth)
+                stack.extend((child, depth + 1) for child in node.get('children', []))
+
+            # Node ids of pruned trees have gaps, rows are numbered in
+            # the order of the traversal from the root
+            offset = len(columns['feature'])
+            row = {node['nodeid'] : offset + i for i, node in enumerate(nodes)}
+            roots.append(offset)
+
+            for node in nodes:
+                if 'leaf' in node:
+                    columns['feature'].append(-1)
+                    columns['threshold'].append(0)
+                    for child in ['left', 'right', 'missing']:
+                        columns[child].append(row[node['nodeid']])
+                    columns['value'].append(node['leaf'])
+                elif isinstance(node['split_condition'], list):
+                    raise ValueError('categorical splits are not supported')
+                else:
+                    split = node['split']
+                    columns['feature'].append(
+                        feature_index[split] if split in feature_index
+                        else int(split.lstrip('f'))
+                    )
+                    columns['threshold'].append(node['split_condition'])
+                    columns['left'].append(row[node['yes']])
+                    columns['right'].append(row[node['no']])
+                    columns['missing'].append(row[node['missing']])
+                    columns['value'].append(0)
+
+        return cls(roots=roots,
+                   max_depth=max_depth,
+                   base_score=base_score,
+                   features=features,
+                   **columns)
+
+    def save(self, path: 'str'):
+        """
+        Saves the ensemble to a .npz file
+        """
+
+        np.savez(path,
+                 feature=self.feature,
+                 threshold=self.threshold,
+                 left=self.left,
+                 right=self.right,
+                 missing=self.missing,
+                 value=self.value,
+                 roots=self.roots,
+                 meta=np.array(json.dumps({
+                     'max_depth' : self.max_depth,
+                     'base_score' : self.base_score,
+                     'features' : self.features
+                 })))
+
+        return path
+
+    @classmethod
+    def load(cls, path: 'str'):
+        """
+        Returns the ensemble saved in a .npz file
+        """
+
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            return cls(**{k : arrays[k] for k in arrays.files if k != 'meta'},
+                       **meta)
+
+    def predict(self, X, batch_size: 'int' = 1024):
+        """
+        Returns the predictions of the ensemble
+
+        Parameters
+        ----------
+        X : Pandas DataFrame or 2-D array-like
+            Features in the order of self.features (DataFrames are
+            reordered by name). NAN values follow the missing branches.
+        batch_size : int, default 1,024
+            Rows evaluated at a time, bounding the (rows x trees) arrays
+
+        Returns
+        -------
+        predictions : numpy array of float32
+        """
+
+        if hasattr(X, 'columns'):
+            X = X[self.features]
+
+        # XGBoost compares float32 values
+        X = np.asarray(X, dtype='float32')
+        predictions = np.empty(X.shape[0], dtype='float32')
+        n_features = X.shape[1]
+
+        # Leaves read column 0 and stay on themselves
+        feature = np.maximum(self.feature, 0)
+        # Children of node i at 2 * i (below the threshold) and 2 * i + 1
+        children = np.column_stack([self.left, self.right]).ravel()
+        missing_right = self.missing == self.right
+
+        for start in range(0, X.shape[0], batch_size):
+            batch = X[start:start + batch_size]
+            values = batch.ravel()
+            row_offsets = (np.arange(batch.shape[0], dtype='int32') * n_features)[:, None]
+            has_missing = np.isnan(values).any()
+
+            nodes = np.broadcast_to(self.roots, (batch.shape[0], self.roots.shape[0]))
+
+            for _ in range(self.max_depth):
+                x = values[row_offsets + feature[nodes]]
+                go_right = ~(x < self.threshold[nodes])
+                if has_missing:
+                    # NAN values compare as not below the threshold
+                    go_right = np.where(np.isnan(x), missing_right[nodes], go_right)
+                nodes = children[2 * nodes + go_right]
+
+            predictions[start:start + batch_size] = (
+                self.value[nodes].sum(axis=1, dtype='float32')
+                + np.float32(self.base_score)
+            )
+
+        return predictions
+
+
+def export(model, path: 'str'):
+    """
+    Flattens the trees of a fit XGBoost model and saves them to a .npz
+    file loadable by TreeEnsemble.load
+
+    Parameters
+    ----------
+    model : XGBoost regressor or Booster
+    path : string
+
+    Returns
+    -------
+    ensemble : TreeEnsemble
+    """
+
+    ensemble = TreeEnsemble.from_booster(model)
+    ensemble.save(path)
+
+    return ensemble
+
+
+def max_abs_error(model, ensemble, X):
+    """
+    Returns the largest absolute difference between the predictions of
+    an XGBoost model and of its exported ensemble on X
+    """
+
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    expected = booster.inplace_predict(np.asarray(X, dtype='float32'))
+
+    return float(np.max(np.abs(expected - ensemble.predict(X)), initial=0))
@@ -1,55 +1,190 @@
+import os
+import sys
+
 import pandas as pd
 
 # Project level modules
 import modules.preprocessing_functions as ppf
 import modules.save_model as sm
+import modules.flights_schema as fs
+import modules.flight_cache as fc
+import modules.delay_stats as ds
+import modules.stats_lookup as sl
+import modules.feature_store as fst
+import modules.calendar_features as cf
+
+# Model features: the flight_test_features of preprocessing_functions
+# left after purge_features
+FEATURE_COLUMNS = (
+    'fl_date',
+    'op_unique_carrier',
+    'tail_num',
+    'origin',
+    'origin_city_name',
+    'dest',
+    'dest_city_name',
+    'crs_dep_time',
+    'crs_arr_time',
+    'distance'
+)
+
+# Columns of the raw flight files used by the model feature path
+LOAD_COLUMNS = FEATURE_COLUMNS + (
+    'dep_delay',
+    'arr_delay',
+    'cancelled',
+    'diverted'
+)
+
+# Delay statistics consumed by week_month
+STATS_DIR = '../data/feature_average_delay_stats'
+
+# Year of the January time windows of the statistics read by
+# week_month (see january_windows)
+STATS_WINDOW = '2018'
+
+# First week of January of every year of data
+WEEK_WINDOWS = (
+    ('2018-01-01', '2018-01-07'),
+    ('2019-01-01', '2019-01-07'),
+    ('2020-01-01', '2020-01-07')
+)
 
-def load_and_process(csv_path: 'str', time_period: 'str'):
+
+def iter_flight_chunks(csv_path: 'str',
+                       time_period: 'str',
+                       columns: 'tuple | None' = LOAD_COLUMNS,
+                       chunksize: 'int' = 250_000,
+                       use_cache: 'bool' = True):
+    """
+    Read a raw flights csv in chunks, yielding only the rows of the time
+    period that were neither cancelled nor diverted
+    
+    Only one chunk of the file is held in memory at a time. Through the
+    cache, a chunk is the flights of one date.
+    
+    Parameters
+    ----------
+    csv_path : string
+    time_period : string 'week', 'month'
+        'week' keeps the first week of January of each year
+    columns : tuple or None, default LOAD_COLUMNS
+        Columns to read, None reads every column
+    chunksize : int, default 250,000
+        Number of csv lines parsed at a time, not used with the cache
+    use_cache : bool, default True
+        Read the csv through its local parquet cache (see flight_cache),
+        which is built on first read. Only the partitions of the time
+        period are opened, one at a time, so the flights come in date
+        order (in csv order within a date) rather than in csv order.
+    
+    Yields
+    ------
+    chunk : Pandas DataFrame
+        Filtered chunk with the compact flights column types, NAN
+        departure and arrival delays set to 0. The index is the row
+        position among the flights of the time period.
+    """
+    
+    usecols = None if columns is None else list(columns)
+    rows_in_period = 0
+    
+    if use_cache:
+        chunks = (
+            fs.apply_schema(day)
+            for day in fc.iter_partitions(
+                csv_path=csv_path,
+                columns=usecols,
+                date_windows=WEEK_WINDOWS if time_period == 'week' else None
+            )
+        )
+    else:
+        chunks = fs.read_csv(csv_path,
+                             usecols=usecols,
+                             parse_dates=['fl_date'],
+                             chunksize=chunksize)
+    
+    for chunk in chunks:
+        
+        # Filter time period
+        if time_period == 'week':
+            in_period = False
+            for start, end in WEEK_WINDOWS:
+                in_period = in_period | ((chunk['fl_date'] >= start) &
+                                         (chunk['fl_date'] <= end))
+            chunk = chunk[in_period]
+        
+        chunk.index = pd.RangeIndex(rows_in_period,
+                                    rows_in_period + chunk.shape[0])
+        rows_in_period += chunk.shape[0]
+        
+        # Set NAN values in departure and arrival delay to 0
+        chunk = chunk.fillna({'dep_delay' : 0, 'arr_delay' : 0})
+        
+        # Drop flight rows that were cancelled or diverted
+        yield chunk[
+            (chunk['cancelled'] == 0) &
+            (chunk['diverted'] == 0)
+        ]
+
+
+def load_and_process(csv_path: 'str',
+                     time_period: 'str',
+                     columns: 'tuple | None' = LOAD_COLUMNS,
+                     chunksize: 'int' = 250_000,
+                     use_cache: 'bool' = True):
     """
     Load the csv, process NAN values in the target variable, and
     drop irrelevant rows
     
+    The csv is streamed in chunks (see iter_flight_chunks) so peak memory
+    is bounded by the chunk size plus the rows that are kept.
+    
     Parameters
     ----------
     csv_path : string
     time_period : string 'week', 'month'
+    columns : tuple or None, default LOAD_COLUMNS
+        Columns to read, None reads every column
+    chunksize : int, default 250,000
+        Number of csv lines parsed at a time
+    use_cache : bool, default True
+        Read the csv through its local parquet cache
     
     Returns
     -------
     df : Pandas Dataframe
     """
     
-    # Load csv and parse the first column as dates
-    df = pd.read_csv(csv_path, parse_dates=[0])
+    frames = []
     
-    # Filter time period
-    if time_period == 'week':
-        df = df[((df['fl_date'] >= f'2018-01-01') &
-                (df['fl_date'] <= f'2018-01-07')) |
-                ((df['fl_date'] >= f'2019-01-01') &
-                 (df['fl_date'] <= f'2019-01-07')) |
-                ((df['fl_date'] >= f'2020-01-01') &
-                 (df['fl_date'] <= f'2020-01-07'))
-               ]
+    # Running count, mean and sum of squared deviations of the arrival
+    # delay of every flight kept so far (Chan et al. parallel algorithm)
+    n, mean, m2 = 0, 0.0, 0.0
     
-    # Set NAN values in departure and arrival delay to 0
-    df = ppf.process_nan_values(
-        df=df,
-        features_to_zero=['dep_delay', 'arr_delay']
-    )
+    for chunk in iter_flight_chunks(csv_path=csv_path,
+                                    time_period=time_period,
+                                    columns=columns,
+                                    chunksize=chunksize,
+                                    use_cache=use_cache):
+        
+        delay = chunk['arr_delay'].to_numpy(dtype='float64')
+        if delay.shape[0]:
+            chunk_mean = delay.mean()
+            chunk_m2 = ((delay - chunk_mean) ** 2).sum()
+            total = n + delay.shape[0]
+            m2 += chunk_m2 + (chunk_mean - mean) ** 2 * n * delay.shape[0] / total
+            mean += (chunk_mean - mean) * delay.shape[0] / total
+            n = total
+        
+        # Drop flights with delay <-120min
+        frames.append(chunk[chunk['arr_delay'] > -120])
     
-    # Drop flight rows that were cancelled or diverted
-    df = df[
-        (df['cancelled'] == 0) &
-        (df['diverted'] == 0)
-    ]
+    df = fs.concat(frames)
     
-    # Drop flights with delay >+3std and <-120min
-    df = df[
-        (df['arr_delay'] < (df['arr_delay'].mean()
-                            + 3 * df['arr_delay'].std())) &
-        (df['arr_delay'] > -120)
-    ]
+    # Drop flights with delay >+3std
+    std = (m2 / (n - 1)) ** 0.5 if n > 1 else float('nan')
+    df = df[df['arr_delay'] < mean + 3 * std]
     
     # Add stratifier
     df['is_delayed'] = 0
@@ -60,6 +195,11 @@ def load_and_process(csv_path: 'str', time_period: 'str'):
 
 def week_month(df, time_period: 'str' = 'week'):
     """
+    Substitute the mean delay of their group in the STATS_WINDOW time
+    windows for the categorical features
+    
+    The statistics tables are read once per process (see stats_lookup)
+    and every feature is encoded with a single gather.
     
     Parameters
     ----------
@@ -81,73 +221,87 @@ def week_month(df, time_period: 'str' = 'week'):
     }
     
     for k, v in feature_dict.items():
-        stats = pd.read_csv(
-            f'../data/feature_average_delay_stats/{k}_{v}_stats.csv',
-            index_col=[0]
-        )
-        
-        df[f'{k}_{time_period}_mean_{v}'] = (
-            df[k].map(stats[f'2018_{time_period}_{k}_mean_{v}'])
+        df[f'{k}_{time_period}_mean_{v}'] = sl.encode(
+            df[k],
+            path=f'{STATS_DIR}/{k}_{v}_stats.csv',
+            column=f'{STATS_WINDOW}_{time_period}_{k}_mean_{v}'
         )
     
-        df.drop(k, axis=1, inplace=True)
+    df.drop(list(feature_dict), axis=1, inplace=True)
     
     return df
 
 
-def load(data_set: 'str' = 'sample', time_period: 'str' = 'week'):
+def build_features(data,
+                   time_period: 'str' = 'week',
+                   imputer: 'ppf.Imputer | str | None' = None,
+                   fit_imputer: 'bool' = False):
     """
+    Model features of flights
     
     Parameters
     ----------
-    data_set : string 'full', 'sample'
-        'full' is the whole 2019 csv with 638,649 lines
-        'sample' is 10,000 lines randomly sampled from 2018-01.csv
+    data : Pandas DataFrame
+        Flights with the columns of FEATURE_COLUMNS and fl_date as
+        datetimes, e.g. the output of load_and_process
     time_period : string 'week', 'month'
+    imputer : preprocessing_functions.Imputer, string or None, default None
+        Imputer (or path of a saved Imputer json file) holding the NAN
+        fill values of the training data. When None, the fill values
+        are computed on data.
+    fit_imputer : bool, default False
+        Fit the imputer on data and save it to the imputer path, for
+        training data only. Otherwise the path must exist.
     
     Returns
     -------
-    data : Pandas DataFrame
+    X : Pandas DataFrame
+        One row per flight, in the order of data, with a new RangeIndex
     """
     
-    google_drive_path = ('~/Google Drive/My Drive/Lighthouse Labs/'
-                         + 'Mid-term Project/Data-Jan/')
-    
-    path = {
-        'full' : f'{google_drive_path}2019-01.csv',
-        'sample' : f'../data/sample.csv'
-    }
-    
-    # Load the first week of to predict for
-    data = load_and_process(csv_path=path[data_set], time_period='week')
+    # Purge unused columns
+    X = data[list(FEATURE_COLUMNS)].copy()
     
     # Convert date to day integer
-    data['fl_date'] = data['fl_date'].dt.day
-    
-    # Purge unused columns
-    X = ppf.flight_test_features(data, purged=True)
-    y = data[['arr_delay', 'is_delayed']]
+    X['fl_date'] = X['fl_date'].dt.day
     
     # Substitue mean delay values for categorical features
     X = week_month(df=X, time_period=time_period)
     
     # For flights of the first week on Jan 2019 that did not fly in the
     # month of 2018, set tail number mean to carrier mean
-    X['tail_num_month_mean_arr_delay'].fillna(
-        X['op_unique_carrier_month_mean_arr_delay'],
-        inplace=True
+    X[f'tail_num_{time_period}_mean_arr_delay'] = (
+        X[f'tail_num_{time_period}_mean_arr_delay']
+        .fillna(X[f'op_unique_carrier_{time_period}_mean_arr_delay'])
     )
     
     # set nan to mean
-    X = ppf.process_nan_values(
-        df=X,
-        features_to_mean=[
-            'origin_month_mean_dep_delay',
-            'dest_month_mean_arr_delay',
-            'tail_num_month_mean_arr_delay',
-            'op_unique_carrier_month_mean_arr_delay'
-        ]
-    )
+    features_to_mean = [
+        f'origin_{time_period}_mean_dep_delay',
+        f'dest_{time_period}_mean_arr_delay',
+        f'tail_num_{time_period}_mean_arr_delay',
+        f'op_unique_carrier_{time_period}_mean_arr_delay'
+    ]
+    
+    if imputer is None:
+        X = ppf.process_nan_values(df=X, features_to_mean=features_to_mean)
+    else:
+        # Reuse the fill values of the training data
+        if isinstance(imputer, str):
+            if fit_imputer:
+                imputer = (ppf.Imputer(features_to_mean=features_to_mean)
+                           .fit(X)
+                           .save(imputer))
+            elif os.path.exists(imputer):
+                imputer = ppf.Imputer.load(imputer)
+            else:
+                # Fitting here would save the fill values of the
+                # flights being scored as the training ones
+                raise FileNotFoundError(
+                    f'no fitted imputer at {imputer}, fit one on the '
+                    + 'training data with fit_imputer=True'
+                )
+        X = imputer.transform(X)
     
     # Drop highly correlated features
     X.drop(['crs_dep_time',
@@ -156,69 +310,348 @@ def load(data_set: 'str' = 'sample', time_period: 'str' = 'week'):
            axis=1,
            inplace=True)
     
-    return X, y
+    return X
 
 
-def performance_stats(feature: 'str', groupby: 'str'):
+def load(data_set: 'str' = 'sample',
+         time_period: 'str' = 'week',
+         imputer: 'ppf.Imputer | str | None' = None,
+         fit_imputer: 'bool' = False,
+         use_store: 'bool' = False):
     """
     
+    Parameters
+    ----------
+    data_set : string 'full', 'sample'
+        'full' is the whole 2019 csv with 638,649 lines
+        'sample' is 10,000 lines randomly sampled from 2018-01.csv
+    time_period : string 'week', 'month'
+    imputer : preprocessing_functions.Imputer, string or None, default None
+        Imputer (or path of a saved Imputer json file) holding the NAN
+        fill values of the training data. When None, the fill values
+        are computed on this data set.
+    fit_imputer : bool, default False
+        Fit the imputer on this data set and save it to the imputer
+        path (see build_features), bypassing the feature store
+    use_store : bool, default False
+        Reuse the X and y saved in the feature store (see feature_store)
+        when the arguments, the source files and the feature code are
+        unchanged, otherwise compute and save them
+    
+    Returns
+    -------
+    data : Pandas DataFrame
     """
+    
     google_drive_path = ('~/Google Drive/My Drive/Lighthouse Labs/'
                          + 'Mid-term Project/Data-Jan/')
     
-    files = {
-        '2018' : google_drive_path + '2018-01.csv',
-        '2019' : google_drive_path + '2019-01.csv'
+    path = {
+        'full' : f'{google_drive_path}2019-01.csv',
+        'sample' : f'../data/sample.csv'
     }
     
+    def build():
+        # Load the first week of to predict for
+        data = load_and_process(csv_path=path[data_set], time_period='week')
+        
+        X = build_features(data=data,
+                           time_period=time_period,
+                           imputer=imputer,
+                           fit_imputer=fit_imputer)
+        y = data[['arr_delay', 'is_delayed']]
+        
+        return X, y
     
-    frames = []
+    # A fit must run to save the imputer
+    if not use_store or fit_imputer:
+        return build()
+    
+    # Inputs of the features: the flights, the delay statistics and the
+    # NAN fill values
+    sources = [path[data_set]] + [
+        f'{STATS_DIR}/{k}_{v}_stats.csv' for k, v in STATS_FEATURES.items()
+    ]
+    config = {
+        'function' : 'load',
+        'data_set' : data_set,
+        'time_period' : time_period,
+        'fit_imputer' : fit_imputer
+    }
+    if isinstance(imputer, ppf.Imputer):
+        config['imputer'] = vars(imputer)
+    elif imputer is not None:
+        config['imputer'] = imputer
+        if os.path.exists(imputer):
+            sources.append(imputer)
+    
+    return fst.cached(
+        build,
+        config=config,
+        sources=sources,
+        modules=[sys.modules[__name__], ppf, fs, fc, sl, cf]
+    )
+
+
+# Monthly flight files used to build the delay statistics
+GOOGLE_DRIVE_PATH = ('~/Google Drive/My Drive/Lighthouse Labs/'
+                     + 'Mid-term Project/Data-Jan/')
+
+STATS_FILES = {
+    '2018' : GOOGLE_DRIVE_PATH + '2018-01.csv',
+    '2019' : GOOGLE_DRIVE_PATH + '2019-01.csv'
+}
+
+# Delay feature whose statistics encode each categorical feature
+STATS_FEATURES = {
+    'origin' : 'dep_delay',
+    'origin_city_name' : 'dep_delay',
+    'dest' : 'arr_delay',
+    'dest_city_name' : 'arr_delay',
+    'tail_num' : 'arr_delay',
+    'op_unique_carrier' : 'arr_delay'
+}
+
 
+# Moment accumulators of the delay statistics
+STATS_STORE_DIR = f'{STATS_DIR}/moments'
+
+
+def january_windows(fl_date, yr):
+    """
+    First week and month of January time windows of a year
+    
+    Parameters
+    ----------
+    fl_date : Pandas Series of datetimes
+    yr : int or string
+    
+    Returns
+    -------
+    windows : dict
+        '{yr}_week', '{yr}_month' : boolean Pandas Series
+    """
+    
+    return {
+        # First week of January
+        f'{yr}_week' : ((fl_date >= f'{yr}-01-01') &
+            (fl_date <= f'{yr}-01-07')),
+        # Month of January
+        f'{yr}_month' : ((fl_date >= f'{yr}-01-01') &
+            (fl_date <= f'{yr}-01-31'))
+    }
+
+
+def update_windows(fl_date):
+    """
+    January time windows of the years of new flights
+    
+    Parameters
+    ----------
+    fl_date : Pandas Series of datetimes
+    
+    Returns
+    -------
+    windows : dict
+        window name : boolean Pandas Series
+    
+    Raises
+    ------
+    ValueError
+        when a flight is in no window, it would otherwise be dropped
+        from the statistics without notice
+    """
+    
+    windows = {}
+    for yr in sorted(fl_date.dt.year.dropna().unique()):
+        windows.update(january_windows(fl_date, int(yr)))
+    
+    in_window = pd.Series(False, index=fl_date.index)
+    for mask in windows.values():
+        in_window |= mask
+    
+    if not in_window.all():
+        outside = fl_date[~in_window]
+        raise ValueError(f'{outside.shape[0]} flights are outside the January '
+                         + f'time windows, e.g. fl_date {outside.iloc[0]}')
+    
+    return windows
+
+
+def build_stats_store(feature_dict: 'dict' = STATS_FEATURES,
+                      files: 'dict' = STATS_FILES):
+    """
+    Delay statistics store of the yearly flight files, loading each file
+    once
+    
+    The moments of every (groupby, feature, time window) are accumulated
+    in a single pass over each year of data (see delay_stats).
+    
+    Parameters
+    ----------
+    feature_dict : dict, default STATS_FEATURES
+        groupby : feature
+    files : dict, default STATS_FILES
+        year : csv path
+    
+    Returns
+    -------
+    store : delay_stats.DelayStatsStore
+    """
+    
+    store = ds.DelayStatsStore(feature_dict)
+    
     for yr, file in files.items():
         data = load_and_process(csv_path=file, time_period='month')
+        store.update(data, windows=january_windows(data['fl_date'], yr))
+    
+    return store
+
+
+def all_performance_stats(feature_dict: 'dict' = STATS_FEATURES,
+                          files: 'dict' = STATS_FILES):
+    """
+    Delay statistics of every grouping feature, loading each yearly
+    file once
+    
+    Parameters
+    ----------
+    feature_dict : dict, default STATS_FEATURES
+        groupby : feature
+    files : dict, default STATS_FILES
+        year : csv path
+    
+    Returns
+    -------
+    stats : dict
+        groupby : Pandas DataFrame in the layout of performance_stats
+    """
+    
+    store = build_stats_store(feature_dict=feature_dict, files=files)
+    
+    return {groupby : store.stats(groupby) for groupby in feature_dict}
+
+
+def performance_stats(feature: 'str', groupby: 'str'):
+    """
+    Delay statistics of a feature grouped by a categorical feature
+    
+    Parameters
+    ----------
+    feature : string
+        delay feature, e.g. 'arr_delay'
+    groupby : string
+        grouping feature, e.g. 'dest'
+    
+    Returns
+    -------
+    stats : Pandas DataFrame
+        indexed by groupby with the columns
+        {year}_{week|month}_{groupby}_{mean|std|skew}_{feature}
+    """
+    
+    return all_performance_stats(feature_dict={groupby : feature})[groupby]
+
+
+def write_stats(store, windows: 'list | None' = None):
+    """
+    Write the delay statistics of a store to the csv files read by
+    week_month
+    
+    Parameters
+    ----------
+    store : delay_stats.DelayStatsStore
+    windows : list or None, default None
+        Windows to write. Only their columns are replaced in the
+        existing files, the other columns are kept. None rewrites the
+        files from every window of the store.
+    
+    Returns
+    -------
+    None
+    """
+    
+    for k, v in store.feature_dict.items():
+        path = f'{STATS_DIR}/{k}_{v}_stats.csv'
         
-        date_filters = {
-            # First week of January
-            'week' : ((data['fl_date'] >= f'{yr}-01-01') &
-                (data['fl_date'] <= f'{yr}-01-07')),
-            # Month of January
-            'month' : ((data['fl_date'] >= f'{yr}-01-01') &
-                (data['fl_date'] <= f'{yr}-01-31'))
-        }
+        if windows is None:
+            stats = store.stats(k)
+        else:
+            if not any(window in windows for window in store.windows(k)):
+                continue
             
-        for timeline, date_filter in date_filters.items():
-            stats = pd.DataFrame()
-            stats[[
-                f'{yr}_{timeline}_{groupby}_mean_{feature}', 
-                f'{yr}_{timeline}_{groupby}_std_{feature}', 
-                f'{yr}_{timeline}_{groupby}_skew_{feature}'
-            ]] = (data[date_filter][[feature, groupby]]
-                  .groupby(by=[groupby])
-                  .agg({feature : ['mean', 'std', 'skew']})
-                 )
-            
-            frames.append(stats)
-    
-    stats = pd.concat(frames, axis=1)
+            new = store.stats(k, windows=windows)
+            stats = pd.read_csv(path,
+                                index_col=0,
+                                dtype={k : str},
+                                keep_default_na=False,
+                                na_values=[''],
+                                float_precision='round_trip')
+            stats = stats.reindex(stats.index.union(new.index))
+            stats[new.columns] = new
+        
+        # Readers never see a partial file (see stats_lookup)
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        stats.to_csv(tmp_path)
+        os.replace(tmp_path, path)
     
-    return stats
+    return None
+
 
 def save_stats():
     """
+    Rebuild the delay statistics of every feature of STATS_FEATURES from
+    the yearly flight files, saving their moment accumulators and
+    writing the csv files of data/feature_average_delay_stats
+    """
     
+    store = build_stats_store()
+    store.save(STATS_STORE_DIR)
+    write_stats(store)
+    
+    return None
+
+
+def update_stats(data):
     """
+    Fold new flights into the saved delay statistics
     
-    feature_dict = {
-        'origin' : 'dep_delay',
-        'origin_city_name' : 'dep_delay',
-        'dest' : 'arr_delay',
-        'dest_city_name' : 'arr_delay',
-        'tail_num' : 'arr_delay',
-        'op_unique_carrier' : 'arr_delay'
-    }
+    The new flights are folded into the January windows of their year,
+    so every window keeps describing the flights of its dates. Only the
+    moment accumulators of these windows are loaded, updated and saved,
+    and only their columns of the csv files read by week_month are
+    replaced, so the cost does not grow with the flights of earlier
+    updates.
     
-    for k, v in feature_dict.items():
-        stats = performance_stats(feature=v, groupby=k)
-        stats.to_csv(f'../data/feature_average_delay_stats/{k}_{v}_stats.csv')
+    Parameters
+    ----------
+    data : Pandas DataFrame
+        Flights processed by load_and_process that were not part of any
+        previous update, e.g. one new day of flights, all within a
+        January time window
+    
+    Returns
+    -------
+    store : delay_stats.DelayStatsStore
+        Accumulators of the updated windows
+    """
+    
+    windows = update_windows(data['fl_date'])
+    
+    store = ds.DelayStatsStore.load(STATS_STORE_DIR,
+                                    STATS_FEATURES,
+                                    windows=list(windows))
+    
+    # Folding into empty accumulators would replace the statistics of
+    # the yearly files with those of the new flights only
+    seeded = [f'{yr}_month' for yr in STATS_FILES if f'{yr}_month' in windows]
+    if not all((k, window) in store.moments
+               for k in STATS_FEATURES for window in seeded):
+        raise FileNotFoundError(f'No {seeded} accumulators in '
+                                + f'{STATS_STORE_DIR}, run save_stats first')
+    
+    store.update(data, windows=windows).save(STATS_STORE_DIR,
+                                             windows=list(windows))
+    write_stats(store, windows=list(windows))
     
-    return None
\ No newline at end of file
+    return store
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# Tests import the project modules as the notebooks do, from src
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+# libpq connection string of a local test database, e.g.
+# "dbname=flights_test user=postgres", loaded with the sample csv files.
+# Tests marked postgres are skipped when it is not set.
+POSTGRES_DSN = os.environ.get('FLIGHTS_TEST_DSN')
+
+if POSTGRES_DSN is not None:
+    try:
+        import modules.database_credentials  # noqa: F401
+    except ImportError:
+        # database_credentials is a local, untracked file
+        credentials = types.ModuleType('modules.database_credentials')
+        credentials.credentials = POSTGRES_DSN
+        sys.modules['modules.database_credentials'] = credentials
+
+
+@pytest.fixture(autouse=True)
+def src_cwd(monkeypatch):
+    """
+    Runs every test from src, where the relative '../data' paths of
+    the modules resolve
+    """
+
+    monkeypatch.chdir(SRC_DIR)
+
+
+@pytest.fixture(autouse=True)
+def category_domains(tmp_path, monkeypatch):
+    """
+    Gives every test a copy of the saved category dictionaries, which
+    build_domains may extend
+    """
+
+    import modules.flights_schema as fs
+
+    domains_dir = tmp_path / 'category_domains'
+    shutil.copytree(fs.DOMAINS_DIR, domains_dir)
+    monkeypatch.setattr(fs, 'DOMAINS_DIR', str(domains_dir))
+    monkeypatch.setattr(fs, '_dtypes', {})
+
+    return domains_dir
+
+
+@pytest.fixture(params=[0, 1])
+def flights(request):
+    """
+    Random flights of January 2019 from a few airports, with skewed
+    departure delays and some missing ones, one set per seed
+    """
+
+    rng = np.random.default_rng(request.param)
+    n = 400
+    data = pd.DataFrame({
+        'origin' : rng.choice(['ATL', 'BOS', 'JFK', 'ORD'], n),
+        'fl_date' : pd.Timestamp('2019-01-01')
+                    + pd.to_timedelta(rng.integers(0, 31, n), unit='D'),
+        'dep_delay' : rng.gamma(2.0, 15.0, n) - 10
+    })
+    data.loc[::17, 'dep_delay'] = np.nan
+
+    return data
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'postgres: needs a local PostgreSQL database, see FLIGHTS_TEST_DSN'
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if POSTGRES_DSN is not None:
+        return
+
+    skip = pytest.mark.skip(reason='FLIGHTS_TEST_DSN is not set')
+    for item in items:
+        if 'postgres' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,74 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+import modules.batch_scoring as bs
+import modules.calendar_features as cf
+import modules.flights_schema as fs
+import modules.xgboost_functions as xgf
+
+
+CSV_PATH = '../data/raw_flights_test_50.csv'
+
+
+class IdentityScaler:
+    def transform(self, X):
+        return X.to_numpy(dtype='float64')
+
+
+class SumModel:
+    def predict(self, X):
+        return X.sum(axis=1)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = {'model_path' : str(tmp_path / 'model.pickle.dat'),
+             'scaler_path' : str(tmp_path / 'scaler.pickle.dat'),
+             'imputer' : str(tmp_path / 'imputer.json')}
+
+    with open(paths['model_path'], 'wb') as f_output:
+        pickle.dump(SumModel(), f_output)
+    with open(paths['scaler_path'], 'wb') as f_output:
+        pickle.dump(IdentityScaler(), f_output)
+
+    data = fs.read_csv(CSV_PATH, usecols=bs.SCORING_COLUMNS)
+    data['fl_date'] = cf.parse_flight_dates(data['fl_date'])
+    xgf.build_features(data, time_period='month', imputer=paths['imputer'],
+                       fit_imputer=True)
+
+    return paths
+
+
+def test_score_file_refuses_a_missing_imputer(paths, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        bs.score_file(CSV_PATH, imputer=str(tmp_path / 'missing.json'),
+                      output_path=str(tmp_path / 'submission.csv'))
+
+
+def test_pool_scoring_matches_single_process_scoring(paths, tmp_path, monkeypatch):
+    output_path = str(tmp_path / 'submission.csv')
+
+    report = bs.score_file(CSV_PATH,
+                           imputer=paths['imputer'],
+                           output_path=output_path,
+                           model_path=paths['model_path'],
+                           scaler_path=paths['scaler_path'],
+                           chunksize=7,
+                           workers=2,
+                           max_pending=2)
+
+    # The whole file scored at once in this process
+    monkeypatch.setattr(bs, '_worker', {})
+    bs._init_worker(paths['model_path'], paths['scaler_path'], 'month',
+                    paths['imputer'])
+    expected = bs.score_chunk(pd.read_csv(CSV_PATH, usecols=bs.SCORING_COLUMNS))
+
+    submission = pd.read_csv(output_path)
+
+    assert report['rows'] == 50
+    assert list(submission.columns) == bs.SUBMISSION_COLUMNS
+    # The written csv holds the categoricals as text
+    expected = expected.astype({'mkt_carrier' : str, 'origin' : str, 'dest' : str})
+    pd.testing.assert_frame_equal(submission, expected, check_dtype=False)
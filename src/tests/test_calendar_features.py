@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import modules.calendar_features as cf
+
+
+def test_date_formats_parse_to_the_same_dates():
+    expected = pd.Series(pd.to_datetime(['2019-01-03', '2019-12-31']))
+    epoch_ms = expected.astype('int64') // 10 ** 6
+
+    for values in [expected, epoch_ms, ['2019-01-03', '2019-12-31']]:
+        pd.testing.assert_series_equal(cf.parse_flight_dates(values), expected)
+
+
+def test_calendar_features_match_the_datetime_attributes():
+    df = pd.DataFrame({'fl_date' : ['2019-12-30', '2020-02-29', None, '2019-12-30']})
+
+    cf.add_calendar_features(df, columns={'week' : 'week_of_year', 'weekday' : 'weekday'})
+
+    assert df['week_of_year'].tolist()[:2] == [1, 9]
+    assert df['weekday'].tolist()[:2] == [0, 5]
+    assert np.isnan(df['weekday'].iloc[2])
+    assert df['weekday'].iloc[3] == df['weekday'].iloc[0]
+
+
+def test_calendar_features_of_random_flights(flights):
+    cf.add_calendar_features(flights)
+
+    dates = flights['fl_date']
+    assert flights['day_of_year'].tolist() == dates.dt.dayofyear.tolist()
+    assert flights['weekday'].tolist() == dates.dt.dayofweek.tolist()
+    assert flights['week'].tolist() == dates.dt.isocalendar()['week'].tolist()
+
+
+def test_holiday_features_of_random_flights(flights):
+    cf.add_holiday_features(flights)
+
+    window_days = cf.holiday_calendar(2019, 2019)
+    days = flights['fl_date'].to_numpy().astype('datetime64[D]')
+    assert flights['stat_holiday'].tolist() == np.isin(days, window_days).tolist()
+    # A day is either a holiday or between two holidays
+    assert ((flights['days_to_next_holiday'] == 0)
+            == (flights['days_since_last_holiday'] == 0)).all()
+
+
+def test_floating_holidays_follow_their_rule():
+    holidays = cf.holiday_dates(2019, 2020).set_index(['holiday', 'date'])
+
+    for holiday, date in [('Thanksgiving', '2019-11-28'),
+                          ('Thanksgiving', '2020-11-26'),
+                          ('Memorial Day', '2020-05-25'),
+                          ('Labor Day', '2019-09-02')]:
+        assert (holiday, pd.Timestamp(date)) in holidays.index
+
+
+def test_holiday_features_across_a_year_boundary():
+    df = pd.DataFrame({'fl_date' : ['2019-12-30', '2020-01-01', '2020-01-10']})
+
+    cf.add_holiday_features(df)
+
+    assert df['stat_holiday'].tolist() == [1, 1, 0]
+    assert df['days_to_next_holiday'].tolist() == [2, 0, 10]
+    assert df['days_since_last_holiday'].tolist() == [5, 0, 9]
@@ -0,0 +1,127 @@
+import os
+
+import pandas as pd
+import pytest
+
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def dc():
+    import modules.database_connection as dc
+    return dc
+
+
+@pytest.fixture
+def pool(dc):
+    with dc.postgresql_pool(minconn=1, maxconn=2, timeout=5) as pool:
+        yield pool
+
+
+def test_pool_exposes_its_size(pool):
+    assert (pool.minconn, pool.maxconn) == (1, 2)
+
+
+def test_pool_waits_for_a_free_connection(dc, pool):
+    connections = [pool.getconn() for _ in range(pool.maxconn)]
+    pool.timeout = 0.1
+
+    with pytest.raises(dc.pg_pool.PoolError):
+        pool.getconn()
+
+    for connection in connections:
+        pool.putconn(connection)
+
+
+def test_pool_replaces_terminated_connections(pool):
+    connection = pool.getconn()
+    pid = connection.get_backend_pid()
+    pool.putconn(connection)
+
+    with pool.connection() as other, other.cursor() as cursor:
+        cursor.execute('SELECT pg_terminate_backend(%s);', (pid,))
+
+    with pool.connection() as connection, connection.cursor() as cursor:
+        cursor.execute('SELECT 1;')
+        assert cursor.fetchone() == (1,)
+        assert connection.get_backend_pid() != pid
+
+
+def test_pool_discards_connections_failing_the_ping(pool):
+    connection = pool.getconn()
+    with connection.cursor() as cursor:
+        with pytest.raises(Exception):
+            cursor.execute('SELECT 1 / 0;')
+    # Back to the inner pool in an aborted transaction
+    pool._pool.putconn(connection)
+    pool._available.release()
+
+    with pool.connection() as healthy:
+        assert healthy is not connection
+
+    assert connection.closed
+    assert not pool._pool._used
+
+
+def test_execute_sql_statements_runs_on_the_pool(dc, pool):
+    dfs = dc.execute_sql_statements(pool, {
+        f'q{n}' : ('SELECT %s AS n;', (n,)) for n in range(5)
+    })
+
+    assert {name : df['n'].iloc[0] for name, df in dfs.items()} == {
+        f'q{n}' : n for n in range(5)
+    }
+
+
+def test_copy_results_keep_integers(dc, pool, tmp_path):
+    csv_path = str(tmp_path / 'result.csv')
+
+    df = dc.execute_sql_statement(
+        pool,
+        query="""SELECT 4138991::BIGINT AS big, NULL::INTEGER AS missing,
+                        7::SMALLINT AS small, ';--' AS text -- trailing comment""",
+        save_to_csv=True,
+        csv_path=csv_path
+    )
+
+    assert df.dtypes.astype(str).tolist() == ['Int64', 'Int32', 'Int16', 'object']
+    assert df['missing'].isna().all()
+    with open(csv_path) as f_input:
+        assert f_input.read().splitlines()[1] == '4138991,,7,;--'
+
+
+@pytest.mark.parametrize('query', [
+    'SELECT fl_date, origin FROM flights WHERE fl_date = %s;',
+    'SELECT fl_date, origin FROM flights WHERE fl_date = %s -- one day',
+    'WITH day AS (SELECT * FROM flights WHERE fl_date = %s)\nSELECT fl_date, origin FROM day;'
+])
+def test_copy_results_match_the_rows(dc, pool, query):
+    copied = dc.execute_sql_statement(pool, query=query, variables=('2019-01-03',))
+    fetched = dc.execute_sql_statement(pool, query=query, variables=('2019-01-03',),
+                                       fetch='rows')
+
+    pd.testing.assert_frame_equal(copied, fetched)
+
+
+def test_cached_results_match_the_query(dc, pool, tmp_path):
+    query = "SELECT fl_date, origin, dep_time FROM flights WHERE fl_date = %s;"
+
+    fresh = dc.cached_sql_statement(pool, query, variables=('2019-01-03',),
+                                    cache_dir=str(tmp_path / 'cache'))
+    cached = dc.cached_sql_statement(pool, query + ' -- same query',
+                                     variables=('2019-01-03',),
+                                     cache_dir=str(tmp_path / 'cache'))
+
+    pd.testing.assert_frame_equal(cached, fresh)
+    assert cached['origin'].dtype.categories is fresh['origin'].dtype.categories
+    assert len(os.listdir(tmp_path / 'cache')) == 2
+
+
+def test_cache_keys_keep_string_literals(dc, pool, tmp_path):
+    one = dc.cached_sql_statement(pool, "SELECT 'a  b' AS text",
+                                  tables=[], cache_dir=str(tmp_path / 'cache'))
+    two = dc.cached_sql_statement(pool, "SELECT 'a b' AS text",
+                                  tables=[], cache_dir=str(tmp_path / 'cache'))
+
+    assert (one['text'].iloc[0], two['text'].iloc[0]) == ('a  b', 'a b')
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import modules.delay_stats as ds
+
+
+def expected_stats(data, mask):
+    grouped = data[mask].dropna(subset=['dep_delay']).groupby('origin')['dep_delay']
+    return pd.DataFrame({'mean' : grouped.mean(),
+                         'std' : grouped.std(),
+                         'skew' : grouped.skew()})
+
+
+def test_merged_moments_match_pandas(flights):
+    parts = np.array_split(flights.dropna(), 3)
+
+    merged = None
+    for part in parts:
+        codes, groups = pd.factorize(part['origin'], sort=True)
+        moments = ds.grouped_moments(codes, part['dep_delay'], len(groups))
+        moments.index = groups
+        merged = moments if merged is None else ds.merge_moments(merged, moments)
+
+    stats = ds.moments_to_stats(merged.sort_index())
+
+    pd.testing.assert_frame_equal(stats,
+                                  expected_stats(flights, flights.index >= 0),
+                                  check_names=False)
+
+
+def test_overlapping_windows_match_pandas(flights):
+    windows = {'week' : flights['fl_date'].dt.day <= 7,
+               'month' : flights['fl_date'].notna()}
+
+    stats = ds.window_stats(flights, {'origin' : 'dep_delay'}, windows)['origin']
+
+    for window, mask in windows.items():
+        expected = expected_stats(flights, mask)
+        expected.columns = [f'{window}_origin_{stat}_dep_delay'
+                            for stat in expected.columns]
+        pd.testing.assert_frame_equal(stats[expected.columns], expected,
+                                      check_names=False)
+
+
+def test_updates_match_a_single_pass(flights, tmp_path):
+    def windows(data):
+        return {'week' : data['fl_date'].dt.day <= 7}
+
+    feature_dict = {'origin' : 'dep_delay'}
+    first, second = flights.iloc[:250], flights.iloc[250:]
+
+    ds.DelayStatsStore(feature_dict).update(first, windows(first)).save(str(tmp_path))
+    store = ds.DelayStatsStore.load(str(tmp_path), feature_dict, windows=['week'])
+    store.update(second, windows(second))
+
+    expected = ds.window_stats(flights, feature_dict, windows(flights))['origin']
+    pd.testing.assert_frame_equal(store.stats('origin'), expected,
+                                  check_names=False)
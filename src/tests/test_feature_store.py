@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import modules.feature_store as fst
+
+
+@pytest.fixture
+def store_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(fst, 'STORE_DIR', str(tmp_path / 'store'))
+    return tmp_path / 'store'
+
+
+@pytest.fixture
+def frames():
+    X = pd.DataFrame({'distance' : np.arange(6, dtype='float64'),
+                      'crs_dep_time' : np.arange(6, dtype='int64'),
+                      'day' : np.arange(6, dtype='float64') % 3})
+    y = pd.DataFrame({'arr_delay' : np.linspace(-5, 5, 6)},
+                     index=pd.Index(np.arange(10, 16), name='row'))
+    return X, y
+
+
+def test_load_frames_keeps_the_memory_maps(store_dir, frames):
+    fst.save_frames('key', frames)
+    X, y = fst.load_frames('key')
+
+    pd.testing.assert_frame_equal(X, frames[0])
+    pd.testing.assert_frame_equal(y, frames[1])
+    for column in X.columns:
+        assert isinstance(X[column].to_numpy().base, np.memmap)
+
+    # Changes stay in memory
+    X.loc[0, 'distance'] = 100
+    pd.testing.assert_frame_equal(fst.load_frames('key')[0], frames[0])
+
+
+def test_save_frames_keeps_one_complete_key(store_dir, frames):
+    # Incomplete directory of an interrupted save
+    os.makedirs(store_dir / 'key')
+
+    with ThreadPoolExecutor(4) as executor:
+        paths = list(executor.map(lambda _: fst.save_frames('key', frames), range(8)))
+
+    assert set(paths) == {str(store_dir / 'key')}
+    assert os.listdir(store_dir) == ['key']
+    pd.testing.assert_frame_equal(fst.load_frames('key')[0], frames[0])
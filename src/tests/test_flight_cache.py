@@ -0,0 +1,66 @@
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import modules.flight_cache as fc
+import modules.flights_schema as fs
+
+
+@pytest.fixture
+def csv_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(fc, 'CACHE_DIR', str(tmp_path / 'cache'))
+
+    data = pd.read_csv('../data/raw_flights_100_random_sample.csv')
+    # Rows without a date and an integer column with a missing value in
+    # one chunk only
+    data.loc[[3, 70], 'fl_date'] = None
+    data.loc[80, 'crs_dep_time'] = None
+
+    path = str(tmp_path / 'flights.csv')
+    data.to_csv(path, index=False)
+
+    return path
+
+
+def test_read_flights_matches_the_csv(csv_path):
+    fc.build_cache(csv_path, chunksize=30)
+
+    expected = fs.read_csv(csv_path, parse_dates=['fl_date'])
+    df = fc.read_flights(csv_path)
+
+    pd.testing.assert_frame_equal(df, expected, check_categorical=False)
+
+
+def test_partitions_share_one_schema(csv_path):
+    path = fc.build_cache(csv_path, chunksize=30)
+
+    schemas = {pq.read_schema(part).remove_metadata()
+               for part in glob.glob(os.path.join(path, '*', '*.parquet'))}
+
+    assert len(schemas) == 1
+    assert os.path.exists(os.path.join(path, fc.NULL_PARTITION))
+
+
+def test_date_windows_skip_rows_without_a_date(csv_path):
+    fc.build_cache(csv_path, chunksize=30)
+    dates = fc.cached_dates(csv_path)
+
+    df = fc.read_flights(csv_path, date_windows=[(dates[0], dates[-1])])
+
+    assert df.shape[0] == 98
+    assert df.index.is_monotonic_increasing
+
+
+def test_concurrent_builds_leave_a_valid_cache(csv_path):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        paths = list(executor.map(lambda _: fc.build_cache(csv_path, chunksize=30),
+                                  range(4)))
+
+    assert len(set(paths)) == 1
+    assert fc.is_cached(csv_path)
+    assert fc.read_flights(csv_path).shape[0] == 100
+    assert not glob.glob(f'{paths[0]}.tmp-*')
@@ -0,0 +1,80 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+
+pytestmark = pytest.mark.postgres
+
+RANGE = {'start' : '2019-01-01', 'end' : '2019-01-31', 'days' : 7}
+
+
+@pytest.fixture
+def fe():
+    import modules.flights_extract as fe
+    return fe
+
+
+@pytest.fixture
+def pool():
+    import modules.database_connection as dc
+    with dc.postgresql_pool(minconn=1, maxconn=4) as pool:
+        yield pool
+
+
+def test_extract_matches_the_table(fe, pool, tmp_path):
+    output_dir = fe.extract_table(pool, output_dir=str(tmp_path), **RANGE)
+
+    extract = fe.read_extract(output_dir)
+    expected = fe.dc.execute_sql_statement(
+        pool,
+        query="SELECT * FROM flights WHERE fl_date BETWEEN %s AND %s",
+        variables=(RANGE['start'], RANGE['end'])
+    )
+
+    pd.testing.assert_frame_equal(
+        extract.sort_values(list(extract.columns[:5]), ignore_index=True),
+        expected.sort_values(list(expected.columns[:5]), ignore_index=True)
+    )
+    # One schema for every partition
+    schemas = {str(pq.read_schema(tmp_path / name))
+               for name in os.listdir(tmp_path) if name.endswith('.parquet')}
+    assert len(schemas) == 1
+
+
+def test_extract_resumes_only_the_same_columns(fe, pool, tmp_path):
+    progress = []
+    kwargs = dict(output_dir=str(tmp_path),
+                  progress=lambda *args: progress.append(args),
+                  **RANGE)
+
+    fe.extract_table(pool, columns=['fl_date', 'origin'], **kwargs)
+    first = len(progress)
+    fe.extract_table(pool, columns=['fl_date', 'origin'], **kwargs)
+    assert len(progress) == first
+
+    fe.extract_table(pool, columns=['fl_date', 'dest'], **kwargs)
+    assert len(progress) == 2 * first
+    assert list(fe.read_extract(str(tmp_path)).columns) == ['fl_date', 'dest']
+
+
+def test_benchmark_extract(fe, pool):
+    timings = fe.benchmark_extract(pool, workers_list=[1, 4], **RANGE)
+
+    assert timings['workers'].tolist() == [1, 4]
+    assert timings['rows'].nunique() == 1
+    assert (timings['seconds'] > 0).all()
+
+
+def test_extract_without_partitions_is_empty(fe, tmp_path):
+    with open(tmp_path / fe.MANIFEST, 'w') as f_output:
+        json.dump({'table' : 'flights', 'columns' : ['fl_date', 'origin'],
+                   'date_column' : 'fl_date', 'key' : 'key',
+                   'partitions' : [], 'rows' : 0}, f_output)
+
+    extract = fe.read_extract(str(tmp_path))
+
+    assert extract.shape == (0, 2)
+    assert isinstance(extract['origin'].dtype, pd.CategoricalDtype)
@@ -0,0 +1,102 @@
+import json
+
+import pandas as pd
+
+import modules.flights_schema as fs
+
+
+def test_categories_are_sorted_saved_domains():
+    dtype = fs.categorical_dtype('airport')
+
+    with open(f'{fs.DOMAINS_DIR}/airport.json') as f_input:
+        saved = json.load(f_input)
+
+    assert list(dtype.categories) == saved == sorted(saved)
+
+
+def test_unseen_values_are_cast_to_nan_and_never_saved():
+    with open(f'{fs.DOMAINS_DIR}/airport.json') as f_input:
+        saved = f_input.read()
+
+    df = fs.apply_schema(pd.DataFrame({'origin' : ['JFK', 'ZZA']}))
+
+    assert df['origin'].isna().tolist() == [False, True]
+    assert 'ZZA' not in fs.categorical_dtype('airport').categories
+    with open(f'{fs.DOMAINS_DIR}/airport.json') as f_input:
+        assert f_input.read() == saved
+
+
+def test_build_domains_appends_sorted_values_keeping_codes():
+    before = list(fs.categorical_dtype('airport').categories)
+
+    appended = fs.build_domains([pd.DataFrame({'origin' : ['ZZB', 'JFK']}),
+                                 pd.DataFrame({'dest' : ['ZZA', None]})])
+
+    assert appended == {'airport' : ['ZZA', 'ZZB']}
+    assert list(fs.categorical_dtype('airport').categories) == before + ['ZZA', 'ZZB']
+    with open(f'{fs.DOMAINS_DIR}/airport.json') as f_input:
+        assert json.load(f_input) == before + ['ZZA', 'ZZB']
+
+
+def test_build_domains_does_not_depend_on_the_order_data_is_seen():
+    fs.build_domains([pd.DataFrame({'origin' : ['ZZB']}),
+                      pd.DataFrame({'origin' : ['ZZA']})])
+    first = list(fs.categorical_dtype('airport').categories)
+
+    with open(f'{fs.DOMAINS_DIR}/airport.json', 'w') as f_output:
+        json.dump(first[:-2], f_output)
+    fs.build_domains([pd.DataFrame({'origin' : ['ZZA']}),
+                      pd.DataFrame({'origin' : ['ZZB']})])
+
+    assert list(fs.categorical_dtype('airport').categories) == first
+
+
+def test_apply_schema_only_casts_the_given_columns():
+    df = pd.DataFrame({'origin' : ['JFK', 'LAX'], 'dest' : ['ORD', 'JFK']})
+
+    fs.apply_schema(df, columns=['origin'])
+
+    assert isinstance(df['origin'].dtype, pd.CategoricalDtype)
+    assert df['dest'].dtype == object
+
+
+def test_apply_schema_narrows_numeric_columns():
+    df = fs.apply_schema(pd.DataFrame({'crs_dep_time' : [5.0, 2359.0],
+                                       'dep_delay' : [1.0, None]}))
+
+    assert df['crs_dep_time'].dtype == 'int16'
+    assert df['dep_delay'].dtype == 'float32'
+
+
+def test_apply_schema_narrows_nullable_integers():
+    # COPY results read integer columns as nullable integers
+    df = fs.apply_schema(pd.DataFrame({
+        'crs_dep_time' : pd.array([5, 2359], dtype='Int32'),
+        'dep_time' : pd.array([4, None], dtype='Int32')
+    }))
+
+    assert df['crs_dep_time'].dtype == 'int16'
+    assert df['dep_time'].dtype == 'float32'
+    assert df['dep_time'].isna().tolist() == [False, True]
+
+
+def test_apply_schema_shares_the_dictionary_of_parquet_categoricals(tmp_path):
+    df = fs.apply_schema(pd.DataFrame({'origin' : ['ATL', 'BOS']}))
+    df.to_parquet(tmp_path / 'flights.parquet')
+
+    read = fs.apply_schema(pd.read_parquet(tmp_path / 'flights.parquet'))
+
+    assert read['origin'].dtype.categories is fs.categorical_dtype('airport').categories
+    assert read['origin'].tolist() == ['ATL', 'BOS']
+
+
+def test_concat_does_not_modify_the_frames():
+    frames = [pd.DataFrame({'origin' : ['JFK'], 'crs_dep_time' : [5.0]}),
+              pd.DataFrame({'origin' : ['LAX'], 'crs_dep_time' : [10.0]})]
+
+    df = fs.concat(frames, ignore_index=True)
+
+    assert df['origin'].dtype.categories is fs.categorical_dtype('airport').categories
+    assert df['crs_dep_time'].dtype == 'int16'
+    assert [frame['origin'].dtype for frame in frames] == [object, object]
+    assert [frame['crs_dep_time'].dtype for frame in frames] == ['float64', 'float64']
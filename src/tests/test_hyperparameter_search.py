@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+
+import modules.hyperparameter_search as hps
+
+
+@pytest.fixture
+def flights():
+    # Two months of flights, the day of the month repeats across them
+    dates = pd.Series(pd.date_range('2019-01-01', '2019-02-28').repeat(4))
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({'fl_date' : dates.dt.day,
+                      'distance' : rng.normal(size=dates.shape[0])})
+    y = 2 * X['distance'] + rng.normal(size=dates.shape[0])
+    return X, y, dates
+
+
+def test_time_series_folds_expand_over_time():
+    folds = hps.time_series_folds(np.arange(8), n_splits=3)
+
+    assert folds == [(1, 3), (3, 5), (5, 7)]
+
+
+def test_time_series_folds_need_enough_times():
+    with pytest.raises(ValueError):
+        hps.time_series_folds(np.arange(3), n_splits=3)
+
+
+def test_search_cuts_folds_on_the_dates(flights, tmp_path):
+    X, y, dates = flights
+    log_path = str(tmp_path / 'search.jsonl')
+    progress = []
+
+    results = hps.search(X, y, dates,
+                         param_space={'alpha' : [0.1, 1.0]},
+                         estimator=Ridge,
+                         log_path=log_path,
+                         workers=2,
+                         progress=lambda *args: progress.append(args))
+
+    assert len(results) == 2 and len(progress) == 2
+    assert all(len(scores) == 3 for scores in results['fold_rmse'])
+
+    # Parameter sets already in the log are not evaluated again
+    hps.search(X, y, dates, param_space={'alpha' : [0.1, 1.0]},
+               estimator=Ridge, log_path=log_path, workers=2,
+               progress=lambda *args: progress.append(args))
+    assert len(progress) == 2
+
+
+def test_search_refuses_misaligned_time_values(flights, tmp_path):
+    X, y, dates = flights
+
+    with pytest.raises(ValueError):
+        hps.search(X, y, dates[:-1], param_space={'alpha' : [1.0]},
+                   estimator=Ridge, log_path=str(tmp_path / 'search.jsonl'))
+
+
+def test_search_does_not_reuse_scores_of_other_data(flights, tmp_path):
+    X, y, dates = flights
+    log_path = str(tmp_path / 'search.jsonl')
+    progress = []
+
+    first = hps.search(X, y, dates, param_space={'alpha' : [1.0]},
+                       estimator=Ridge, log_path=log_path, workers=1)
+    second = hps.search(X, -y, dates, param_space={'alpha' : [1.0]},
+                        estimator=Ridge, log_path=log_path, workers=1,
+                        progress=lambda *args: progress.append(args))
+
+    assert len(progress) == 1 and len(second) == 1
+    assert second['key'][0] != first['key'][0]
+    assert len(hps.read_results(log_path)) == 2
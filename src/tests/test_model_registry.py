@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+from sklearn.preprocessing import MinMaxScaler
+
+import modules.model_registry as mr
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    monkeypatch.setattr(mr, 'REGISTRY_DIR', str(tmp_path / 'registry'))
+    mr._open.cache_clear()
+    yield
+    mr._open.cache_clear()
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(200, 3)), columns=['a', 'b', 'c'])
+    y = X['a'] - 2 * X['b'] + rng.normal(size=200)
+    return X, y
+
+
+def fit(X, y, **params):
+    scaler = MinMaxScaler().fit(X)
+    model = xgb.XGBRegressor(n_estimators=10, **params).fit(scaler.transform(X), y)
+    return model, scaler
+
+
+def test_registered_model_predicts_with_both_engines(registry, data):
+    X, y = data
+    model, scaler = fit(X, y)
+
+    artifact = mr.load(version=mr.register(model, scaler, features=list(X.columns)))
+
+    expected = model.predict(scaler.transform(X))
+    np.testing.assert_allclose(artifact.predict(X), expected, atol=1e-5)
+    np.testing.assert_allclose(artifact.predict(X, engine='numpy'), expected, atol=1e-4)
+
+
+def test_unsupported_model_is_registered_without_trees(registry, data, caplog):
+    X, y = data
+    model, scaler = fit(X, y, booster='dart')
+
+    artifact = mr.load(version=mr.register(model, scaler, features=list(X.columns)))
+
+    assert 'without flattened trees' in caplog.text
+    assert artifact.metadata['trees'] is False
+    np.testing.assert_allclose(artifact.predict(X),
+                               model.predict(scaler.transform(X)),
+                               atol=1e-5)
+    with pytest.raises(ValueError):
+        artifact.predict(X, engine='numpy')
+
+
+def test_registrations_racing_for_a_version_take_the_next_one(registry, data, monkeypatch):
+    X, y = data
+    model, scaler = fit(X, y)
+    latest = mr.versions
+
+    # Every registration sees the registry as empty, like concurrent ones
+    monkeypatch.setattr(mr, 'versions', lambda name='flight_delay_xgboost': [])
+    registered = [mr.register(model, scaler, features=list(X.columns))
+                  for _ in range(3)]
+    monkeypatch.setattr(mr, 'versions', latest)
+
+    assert registered == mr.versions() == [1, 2, 3]
+    assert [mr.load(version=v).metadata['version'] for v in registered] == [1, 2, 3]
@@ -0,0 +1,157 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import modules.prediction_server as ps
+import modules.xgboost_functions as xgf
+
+
+class IdentityScaler:
+    def transform(self, X):
+        return X.to_numpy(dtype='float64')
+
+
+class SumModel:
+    def predict(self, X):
+        return X.sum(axis=1)
+
+
+class FailingModel:
+    def predict(self, X):
+        raise RuntimeError('model failure')
+
+
+@pytest.fixture
+def flights():
+    data = pd.read_csv('../data/raw_flights_50.csv', usecols=xgf.FEATURE_COLUMNS)
+    # Dates within the delay statistics windows
+    data['fl_date'] = '2019-01-03'
+    return json.loads(data.to_json(orient='records'))
+
+
+@pytest.fixture
+def imputer(flights, tmp_path):
+    path = str(tmp_path / 'imputer.json')
+    data = pd.DataFrame.from_records(flights)
+    data['fl_date'] = pd.to_datetime(data['fl_date'])
+    xgf.build_features(data, imputer=path, fit_imputer=True)
+    return path
+
+
+def batcher(imputer, model=None, **kwargs):
+    return ps.MicroBatcher(model=model if model is not None else SumModel(),
+                           scaler=IdentityScaler(), imputer=imputer,
+                           **kwargs)
+
+
+@pytest.fixture
+def server(imputer):
+    def start(model=None):
+        server = ps.PredictionServer(('127.0.0.1', 0), ps.PredictionHandler)
+        server.batcher = batcher(imputer, model=model).start()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(server, body):
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{server.server_address[1]}/predict',
+        data=body if isinstance(body, bytes) else json.dumps(body).encode()
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_batcher_refuses_an_unfitted_imputer(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        batcher(str(tmp_path / 'imputer.json'))
+
+
+def test_requests_are_scored_in_one_batch_like_alone(flights, imputer):
+    micro_batcher = batcher(imputer, max_wait_ms=1000)
+    expected = [micro_batcher.predict(flights[i:i + 5]).tolist()
+                for i in range(0, 20, 5)]
+
+    # Queued before the thread starts, so they all join the first batch
+    futures = [micro_batcher.submit(flights[i:i + 5]) for i in range(0, 20, 5)]
+    micro_batcher.start()
+
+    for future, predictions in zip(futures, expected):
+        np.testing.assert_allclose(future.result(timeout=30), predictions)
+    assert micro_batcher.metrics.summary()['batches'] == 1
+
+
+def test_an_invalid_request_only_fails_itself(flights, imputer):
+    micro_batcher = batcher(imputer, max_wait_ms=1000)
+    invalid = dict(flights[0], fl_date='not a date')
+
+    futures = [micro_batcher.submit(flights[:3]),
+               micro_batcher.submit([invalid]),
+               micro_batcher.submit(flights[3:5])]
+    micro_batcher.start()
+
+    np.testing.assert_allclose(futures[0].result(timeout=30),
+                               micro_batcher.predict(flights[:3]))
+    with pytest.raises(Exception):
+        futures[1].result(timeout=30)
+    np.testing.assert_allclose(futures[2].result(timeout=30),
+                               micro_batcher.predict(flights[3:5]))
+
+
+def test_post_predicts_a_flight_or_a_list(flights, server):
+    running = server()
+
+    assert post(running, flights[0])[0] == 200
+    status, body = post(running, flights[:3])
+    assert status == 200
+    assert len(body['predicted_delay']) == 3
+
+
+@pytest.mark.parametrize('change, field', [
+    ({'fl_date' : '2019-13-45'}, 'fl_date'),
+    ({'fl_date' : True}, 'fl_date'),
+    ({'distance' : 'far'}, 'distance'),
+    ({'crs_dep_time' : None}, 'crs_dep_time'),
+    ({'origin' : 7}, 'origin')
+])
+def test_post_rejects_invalid_features(flights, server, change, field):
+    status, body = post(server(), [flights[0], dict(flights[1], **change)])
+
+    assert status == 400
+    assert body['error'].startswith(f'flight 1: {field}:')
+
+
+@pytest.mark.parametrize('body', [b'{not json', [1, 2], [], [{'origin' : 'JFK'}]])
+def test_post_rejects_malformed_bodies(server, body):
+    assert post(server(), body)[0] == 400
+
+
+def test_post_reports_scoring_failures(flights, server):
+    status, body = post(server(model=FailingModel()), flights[:2])
+
+    assert status == 500
+    assert body['error'] == 'model failure'
+
+
+def test_post_never_saves_request_values(flights, server, category_domains):
+    saved = (category_domains / 'airport.json').read_text()
+
+    status, _ = post(server(), dict(flights[0], origin='ZZZ'))
+
+    assert status == 200
+    assert (category_domains / 'airport.json').read_text() == saved
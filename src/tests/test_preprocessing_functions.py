@@ -0,0 +1,82 @@
+import pandas as pd
+
+import modules.preprocessing_functions as pf
+
+
+def flights():
+    return pd.DataFrame({
+        'fl_date' : ['2019-01-01', '2019-01-01', '2019-01-01', '2019-01-02'],
+        'tail_num' : ['N1', 'N1', 'N1', 'N1'],
+        'crs_dep_time' : [600, 1200, 2330, 700],
+        'crs_arr_time' : [1000, 2345, 130, 900],
+        'origin' : ['JFK', 'ORD', 'LAX', 'JFK']
+    })
+
+
+def test_n_previous_flights_resets_every_day():
+    data = pf.daily_flight_order(flights())
+
+    assert data['n_previous_flights'].tolist() == [0, 1, 2, 0]
+
+
+def test_rotation_features_follow_n_previous_flights():
+    data = pf.aircraft_rotation_features(flights())
+
+    assert data['prev_origin'].isna().tolist() == (data['n_previous_flights'] == 0).tolist()
+    assert data['prev_crs_arr_time'].isna().tolist() == (data['n_previous_flights'] == 0).tolist()
+
+
+def test_turnaround_buffer_keeps_overlapping_legs_negative():
+    data = pf.aircraft_rotation_features(flights())
+
+    # 12:00 - 10:00, then 23:30 before an arrival at 23:45 (local times)
+    assert data['turnaround_buffer'].iloc[1] == 120
+    assert data['turnaround_buffer'].iloc[2] == -15
+
+
+def test_turnaround_buffer_counts_arrivals_after_midnight_the_next_day():
+    data = pf.aircraft_rotation_features(pd.DataFrame({
+        'fl_date' : ['2019-01-01'] * 3,
+        'tail_num' : ['N1'] * 3,
+        'crs_dep_time' : [600, 2100, 2350],
+        'crs_arr_time' : [1000, 30, 100],
+        'origin' : ['JFK', 'ORD', 'LAX']
+    }))
+
+    # 21:00 after 10:00, then 23:50 before the 00:30 arrival of the
+    # next day
+    assert data['turnaround_buffer'].tolist()[1:] == [660, -40]
+
+
+def delays():
+    return pd.DataFrame({
+        'carrier' : ['A', 'A', 'A', 'A', 'A', 'A', 'B', 'B', None],
+        'origin' : ['X', 'X', 'X', 'X', 'Y', 'Y', 'X', 'X', 'X'],
+        'arr_delay' : [-5, 0, 10, 20, 15, None, 0, 30, 100]
+    })
+
+
+def test_binomial_threshold_stats_count_values_past_every_threshold():
+    stats = pf.binomial_threshold_stats(delays(), ['carrier', 'origin'],
+                                        'arr_delay', thresholds=[10, 0])
+
+    # One row per group and sorted threshold, missing keys and values
+    # are left out
+    assert stats[['carrier', 'origin', 'threshold']].values.tolist() == [
+        ['A', 'X', 0], ['A', 'X', 10],
+        ['A', 'Y', 0], ['A', 'Y', 10],
+        ['B', 'X', 0], ['B', 'X', 10]
+    ]
+    assert stats['total'].tolist() == [4, 4, 1, 1, 2, 2]
+    assert stats['yes'].tolist() == [2, 1, 1, 1, 1, 1]
+    assert stats['arr_delay_yes'].tolist() == [0.5, 0.25, 1, 1, 0.5, 0.5]
+    assert stats['arr_delay_no'].tolist() == [0.5, 0.75, 0, 0, 0.5, 0.5]
+
+
+def test_binomial_threshold_stats_count_values_below_thresholds():
+    stats = pf.binomial_threshold_stats(delays(), ['carrier', 'origin'],
+                                        'arr_delay', thresholds=[0, 10],
+                                        greater=False)
+
+    assert stats['yes'].tolist() == [1, 2, 0, 0, 0, 1]
+    assert stats['arr_delay_yes'].tolist() == [0.25, 0.5, 0, 0, 0, 0.5]
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import modules.rolling_features as rf
+
+
+def test_windows_match_a_brute_force_trailing_window(flights):
+    stats = rf.rolling_delay_stats(flights, 'origin', 'dep_delay', windows=[1, 7])
+
+    for n in [1, 7]:
+        for i, flight in flights.iterrows():
+            days = (flight['fl_date'] - flights['fl_date']).dt.days
+            window = flights.loc[(flights['origin'] == flight['origin'])
+                                 & (days >= 1) & (days <= n), 'dep_delay'].dropna()
+
+            assert stats.at[i, f'origin_{n}d_count_dep_delay'] == len(window)
+            np.testing.assert_allclose(
+                stats.loc[i, [f'origin_{n}d_mean_dep_delay',
+                              f'origin_{n}d_std_dep_delay']].astype(float),
+                [window.mean(), window.std()],
+                rtol=1e-9, atol=1e-9
+            )
+
+
+def test_unknown_groups_and_dates_have_no_statistics(flights):
+    df = pd.DataFrame({'origin' : ['ATL', 'SFO', 'ATL'],
+                       'fl_date' : [pd.Timestamp('2019-02-01'), pd.Timestamp('2019-02-01'), pd.NaT],
+                       'dep_delay' : [0.0, 0.0, 0.0]})
+
+    stats = rf.rolling_delay_stats(df, 'origin', 'dep_delay', windows=[7], history=flights)
+
+    assert stats['origin_7d_count_dep_delay'].tolist()[1:] == [0, 0]
+    assert stats['origin_7d_mean_dep_delay'].isna().tolist() == [False, True, True]
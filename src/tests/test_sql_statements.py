@@ -0,0 +1,35 @@
+import pytest
+
+import modules.sql_statements as sqs
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ('SELECT 1;', 'SELECT 1'),
+    ('SELECT 1; -- last line comment', 'SELECT 1'),
+    ('SELECT 1 -- comment\n  FROM flights;;\n/* end */\n', 'SELECT 1 -- comment\n  FROM flights'),
+    ("SELECT ';' AS x; ", "SELECT ';' AS x"),
+    ("SELECT 'it''s -- not a comment'", "SELECT 'it''s -- not a comment'"),
+    ('SELECT $tag$;--$tag$;', 'SELECT $tag$;--$tag$'),
+    ('SELECT "odd;--name" FROM t', 'SELECT "odd;--name" FROM t')
+])
+def test_strip_statement(statement, expected):
+    assert sqs.strip_statement(statement) == expected
+
+
+def test_sql_tokens_cover_the_statement():
+    statement = "SELECT a, 'b--' /* c */ FROM t -- d\nWHERE e = E'f\\'g';"
+
+    tokens = sqs.sql_tokens(statement)
+
+    assert ''.join(text for _, text in tokens) == statement
+    assert [text for kind, text in tokens if kind == 'quoted'] == ["'b--'", "E'f\\'g'"]
+    assert [text for kind, text in tokens if kind == 'comment'] == ['/* c */', '-- d']
+
+
+def test_normalize_statement_ignores_layout_outside_quotes():
+    assert (sqs.normalize_statement("SELECT a, 'x  y' -- comment\n  FROM t;")
+            == sqs.normalize_statement("SELECT a, 'x  y' FROM t"))
+    assert (sqs.normalize_statement("SELECT 'x  y' FROM t")
+            != sqs.normalize_statement("SELECT 'x y' FROM t"))
+    assert (sqs.normalize_statement("SELECT '-- not a comment' FROM t")
+            != sqs.normalize_statement("SELECT '' FROM t"))
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import modules.flights_schema as fs
+import modules.stats_lookup as sl
+
+
+def write_stats(path, mean, mtime):
+    pd.DataFrame({'origin' : ['ATL', 'BOS'],
+                  '2018_week_origin_mean_dep_delay' : mean}).to_csv(path, index=False)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_lookups_keep_only_the_latest_file_version(tmp_path):
+    sl.clear()
+    path = str(tmp_path / 'origin_dep_delay_stats.csv')
+    column = '2018_week_origin_mean_dep_delay'
+    origin = pd.Series(['BOS', 'ATL', None], name='origin',
+                       dtype=fs.categorical_dtype('airport'))
+
+    for version in range(3):
+        write_stats(path, [version, version + 0.5], mtime=10 ** 9 * (version + 1))
+        np.testing.assert_array_equal(sl.encode(origin, path, column),
+                                      [version + 0.5, version, np.nan])
+
+    assert len(sl._lookups) == 1
+    sl.clear()
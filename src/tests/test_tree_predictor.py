@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+import modules.tree_predictor as tp
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(500, 4)),
+                     columns=['distance', 'crs_dep_time', 'day', 'mean_delay'])
+    y = 3 * X['distance'] - X['day'] ** 2 + rng.normal(size=500)
+    # Missing values follow the default branches
+    X = X.mask(rng.random(X.shape) < 0.1)
+    return X, y
+
+
+def test_pruned_trees_have_node_id_gaps(data):
+    X, y = data
+    model = xgb.XGBRegressor(n_estimators=30, max_depth=6, gamma=20,
+                             tree_method='exact').fit(X, y)
+    trees = model.get_booster().trees_to_dataframe()
+
+    assert (trees.groupby('Tree')['Node'].max() + 1
+            > trees.groupby('Tree').size()).any()
+
+
+@pytest.mark.parametrize('params', [
+    {'max_depth' : 4},
+    # Pruning leaves gaps in the node ids
+    {'max_depth' : 6, 'gamma' : 20, 'tree_method' : 'exact'},
+    {'objective' : 'reg:absoluteerror', 'max_depth' : 3}
+])
+def test_ensemble_matches_xgboost(data, params, tmp_path):
+    X, y = data
+    model = xgb.XGBRegressor(n_estimators=30, **params).fit(X, y)
+
+    tp.export(model, str(tmp_path / 'trees.npz'))
+    ensemble = tp.TreeEnsemble.load(str(tmp_path / 'trees.npz'))
+
+    assert tp.max_abs_error(model, ensemble, X) < 1e-4
+
+
+@pytest.mark.parametrize('params, y', [
+    ({'booster' : 'dart'}, 'regression'),
+    ({'objective' : 'binary:logistic'}, 'binary'),
+    ({'objective' : 'multi:softprob', 'num_class' : 3}, 'classes'),
+    ({'multi_strategy' : 'multi_output_tree'}, 'targets')
+])
+def test_from_booster_refuses_unsupported_models(data, params, y):
+    X, target = data
+    labels = {
+        'regression' : target,
+        'binary' : (target > 0).astype(int),
+        'classes' : pd.qcut(target, 3, labels=False),
+        'targets' : np.column_stack([target, -target])
+    }[y]
+    booster = xgb.train(params, xgb.DMatrix(X, labels), num_boost_round=3)
+
+    with pytest.raises(ValueError):
+        tp.TreeEnsemble.from_booster(booster)
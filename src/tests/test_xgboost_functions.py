@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+import modules.preprocessing_functions as ppf
+import modules.xgboost_functions as xgf
+
+
+@pytest.fixture
+def flights():
+    data = pd.read_csv('../data/raw_flights_50.csv')
+    # Dates within the delay statistics windows
+    data['fl_date'] = pd.to_datetime('2019-01-03')
+    return data
+
+
+def test_build_features_refuses_a_missing_imputer(flights, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        xgf.build_features(flights, imputer=str(tmp_path / 'imputer.json'))
+
+
+def test_build_features_reuses_the_fitted_imputer(flights, tmp_path):
+    path = str(tmp_path / 'imputer.json')
+
+    X_train = xgf.build_features(flights, imputer=path, fit_imputer=True)
+    X = xgf.build_features(flights.iloc[:5], imputer=path)
+
+    assert ppf.Imputer.load(path).fill_values
+    pd.testing.assert_frame_equal(X, X_train.iloc[:5])
+
+
+def test_update_stats_folds_flights_into_the_windows_of_their_dates(monkeypatch, tmp_path):
+    monkeypatch.setattr(xgf, 'STATS_DIR', str(tmp_path))
+    monkeypatch.setattr(xgf, 'STATS_STORE_DIR', str(tmp_path / 'moments'))
+
+    data = pd.read_csv('../data/raw_flights_50.csv')
+    data['fl_date'] = pd.to_datetime(
+        ['2018-01-03', '2019-01-20'] * 10
+        + ['2018-01-05', '2019-01-02', '2019-01-28'] * 10
+    )
+    seed, first, second = data.iloc[:20], data.iloc[20:35], data.iloc[35:]
+
+    store = xgf.ds.DelayStatsStore(xgf.STATS_FEATURES)
+    for yr in xgf.STATS_FILES:
+        store.update(seed, windows=xgf.january_windows(seed['fl_date'], yr))
+    store.save(xgf.STATS_STORE_DIR)
+    xgf.write_stats(store)
+
+    xgf.update_stats(first)
+    xgf.update_stats(second)
+
+    windows = {}
+    for yr in xgf.STATS_FILES:
+        windows.update(xgf.january_windows(data['fl_date'], yr))
+    expected = xgf.ds.window_stats(data, xgf.STATS_FEATURES, windows)
+
+    for k, v in xgf.STATS_FEATURES.items():
+        stats = pd.read_csv(f'{tmp_path}/{k}_{v}_stats.csv',
+                            index_col=0,
+                            dtype={k : str})
+        pd.testing.assert_frame_equal(stats[expected[k].columns],
+                                      expected[k],
+                                      check_names=False)
+
+
+def test_update_stats_refuses_flights_outside_the_windows(monkeypatch, tmp_path):
+    monkeypatch.setattr(xgf, 'STATS_STORE_DIR', str(tmp_path / 'moments'))
+
+    data = pd.read_csv('../data/raw_flights_50.csv')
+    data['fl_date'] = pd.to_datetime('2019-01-05')
+    data.loc[7, 'fl_date'] = pd.Timestamp('2019-02-05')
+
+    with pytest.raises(ValueError, match='2019-02-05'):
+        xgf.update_stats(data)
+
+
+def test_update_stats_refuses_an_empty_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(xgf, 'STATS_STORE_DIR', str(tmp_path / 'moments'))
+
+    data = pd.read_csv('../data/raw_flights_50.csv')
+    data['fl_date'] = pd.to_datetime('2018-01-05')
+
+    with pytest.raises(FileNotFoundError):
+        xgf.update_stats(data)
+
+
+def test_cached_chunks_are_the_csv_rows_one_date_at_a_time(monkeypatch, tmp_path):
+    monkeypatch.setattr(xgf.fc, 'CACHE_DIR', str(tmp_path / 'cache'))
+
+    csv_path = '../data/raw_flights_100_random_sample.csv'
+
+    chunks = list(xgf.iter_flight_chunks(csv_path, time_period='month'))
+    expected = pd.concat(xgf.iter_flight_chunks(csv_path, time_period='month',
+                                                use_cache=False))
+
+    assert all(chunk['fl_date'].nunique() <= 1 for chunk in chunks)
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks).reset_index(drop=True),
+        expected.sort_values('fl_date', kind='stable').reset_index(drop=True)
+    )